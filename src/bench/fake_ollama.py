@@ -0,0 +1,184 @@
+"""Stand-in for the Ollama API with configurable latency and token rate.
+
+Answers are deterministic functions of the prompt, shaped like what the bot
+expects from each of its prompts. Point the bot at it with
+OLLAMA_HOST=http://127.0.0.1:11435.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+from aiohttp import web
+
+
+WORDS = (
+    'network latency model token search result page summary cache query '
+    'report research source analysis data system user answer context time '
+    'energy market policy science history city water climate health study'
+).split()
+EMBED_DIMENSIONS = 64
+
+
+def seed(text):
+    return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+
+
+def filler(text, tokens):
+    """Return tokens words picked deterministically from text."""
+    value = seed(text)
+    words = []
+    for _ in range(tokens):
+        value = (value * 6364136223846793005 + 1442695040888963407) % 2**64
+        words.append(WORDS[(value >> 33) % len(WORDS)])
+    return ' '.join(words).capitalize() + '.'
+
+
+def embed(text):
+    """Hash words into a bag-of-words vector, so similar texts are close."""
+    vector = [0.0] * EMBED_DIMENSIONS
+    for word in re.findall(r'\w+', text.lower()):
+        vector[seed(word) % EMBED_DIMENSIONS] += 1.0
+    return vector
+
+
+class FakeOllama:
+    """Serve /api/generate and /api/embed from canned, prompt-shaped answers.
+
+    latency is a fixed delay per request, token_rate the generation speed in
+    tokens per second; iterations is how many research iterations pass
+    before the completion check answers "complete"; search_ratio is the
+    share of chat questions classified as needing a web search.
+    """
+
+    def __init__(self, host='127.0.0.1', port=11435, latency=0.05,
+                 token_rate=200.0, tokens=120, iterations=2, search_ratio=0.5):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.iterations = iterations
+        self.search_ratio = search_ratio
+        self.calls = {'generate': 0, 'embed': 0}
+        self.tokens_generated = 0
+        self._runner = None
+
+    def answer(self, prompt):
+        """Return the response text for prompt."""
+        if 'choose: (1 or 2)' in prompt:
+            question = prompt.rsplit("User's latest prompt:", 1)[-1]
+            return '2' if seed(question) % 100 < self.search_ratio * 100 else '1'
+        if 'web search queries in JSON format' in prompt:
+            topic = filler(prompt, 2)[:-1].lower()
+            queries = [f'"{topic} {word}"' for word in ('overview', 'latest', 'data')]
+            return '```json\n[\n' + ',\n'.join(queries) + '\n]\n```'
+        if 'Is the task complete?' in prompt:
+            if prompt.count('"iteration_number"') >= self.iterations:
+                return '2. Sufficient info gathered'
+            return '1. More data needed'
+        if prompt.startswith('Based on the conversation context'):
+            return filler(prompt, 6)[:-1]
+        return filler(prompt, self.tokens)
+
+    async def _generate(self, request):
+        started = time.perf_counter()
+        payload = await request.json()
+        if 'prompt' not in payload:
+            # A model load request, as the warm-up sends
+            return web.json_response({
+                'model': payload.get('model'),
+                'response': '',
+                'done': True,
+                'done_reason': 'load',
+            })
+        prompt = payload['prompt']
+        response = self.answer(prompt)
+        eval_count = len(response.split())
+        prompt_eval_count = len(prompt) // 4 + 1
+        await asyncio.sleep(self.latency + eval_count / self.token_rate)
+        self.calls['generate'] += 1
+        self.tokens_generated += eval_count
+        total = int((time.perf_counter() - started) * 1e9)
+        return web.json_response({
+            'model': payload.get('model'),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'response': response,
+            'done': True,
+            'done_reason': 'stop',
+            'context': [1, 2, 3],
+            'total_duration': total,
+            'load_duration': 0,
+            'prompt_eval_count': prompt_eval_count,
+            'prompt_eval_duration': int(self.latency * 1e9),
+            'eval_count': eval_count,
+            'eval_duration': int(eval_count / self.token_rate * 1e9),
+        })
+
+    async def _embed(self, request):
+        payload = await request.json()
+        inputs = payload.get('input', '')
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await asyncio.sleep(self.latency / 5)
+        self.calls['embed'] += 1
+        return web.json_response({
+            'model': payload.get('model'),
+            'embeddings': [embed(text) for text in inputs],
+            'prompt_eval_count': sum(len(text) // 4 + 1 for text in inputs),
+        })
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/api/generate', self._generate)
+        app.router.add_post('/api/embed', self._embed)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+
+async def serve(args):
+    fake = FakeOllama(
+        args.host, args.port, args.latency, args.token_rate, args.tokens,
+        args.iterations, args.search_ratio,
+    )
+    await fake.start()
+    print(f'Fake Ollama on {fake.url}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        print(json.dumps(fake.calls))
+        await fake.stop()
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Seconds added to every request')
+    parser.add_argument('--token-rate', type=float, default=200.0,
+                        help='Generated tokens per second')
+    parser.add_argument('--tokens', type=int, default=120,
+                        help='Tokens in a free-text answer')
+    parser.add_argument('--iterations', type=int, default=2,
+                        help='Research iterations before "complete"')
+    parser.add_argument('--search-ratio', type=float, default=0.5,
+                        help='Share of chat questions that need a search')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    add_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
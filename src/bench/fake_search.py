@@ -0,0 +1,141 @@
+"""Stand-in for a SearXNG JSON search endpoint and the pages it links to.
+
+Pages come from a static corpus generated from a fixed seed, so every run
+fetches the same bytes. Point the bot at it with
+SEARCH_API_URL=http://127.0.0.1:8889/search.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+from aiohttp import web
+
+
+TOPICS = (
+    'solar energy storage', 'urban water supply', 'large language models',
+    'coastal climate adaptation', 'battery recycling', 'public transport',
+    'vaccine development', 'semiconductor supply chain', 'ocean fisheries',
+    'remote work productivity', 'soil carbon', 'wildfire prevention',
+)
+SENTENCE_WORDS = (
+    'the study reports that costs fell while adoption grew across regions '
+    'analysts expect further gains as policy support and investment rise '
+    'critics note risks to supply reliability and uneven local benefits '
+    'new data from surveys and field trials confirm earlier estimates'
+).split()
+
+
+def build_corpus(pages=60, paragraphs=12, seed=1):
+    """Return {page id: (title, html)} for a deterministic page corpus."""
+    rng = random.Random(seed)
+    corpus = {}
+    for page_id in range(pages):
+        topic = TOPICS[page_id % len(TOPICS)]
+        title = f'{topic.title()} report {page_id}'
+        body = []
+        for _ in range(paragraphs):
+            sentences = (
+                ' '.join(rng.choice(SENTENCE_WORDS) for _ in range(rng.randint(12, 24)))
+                for _ in range(rng.randint(3, 6))
+            )
+            body.append(f'<p>{topic.capitalize()}: ' + '. '.join(sentences) + '.</p>')
+        corpus[page_id] = (title, (
+            f'<!DOCTYPE html><html><head><title>{title}</title></head><body>'
+            f'<h1>{title}</h1><div class="nav">Home | News | About</div>'
+            + ''.join(body) + '</body></html>'
+        ))
+    return corpus
+
+
+class FakeSearch:
+    """Serve /search?q=...&format=json and the corpus pages under /pages/."""
+
+    def __init__(self, host='127.0.0.1', port=8889, latency=0.05,
+                 results=10, pages=60):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.results = results
+        self.corpus = build_corpus(pages)
+        self.calls = {'search': 0, 'page': 0}
+        self.bytes_served = 0
+        self._runner = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def search_results(self, query):
+        """Return the result list for query, always the same for a query."""
+        start = int.from_bytes(hashlib.sha256(query.encode('utf-8')).digest()[:4], 'big')
+        results = []
+        for i in range(self.results):
+            page_id = (start + i * 7) % len(self.corpus)
+            title, _ = self.corpus[page_id]
+            results.append({
+                'url': f'{self.url}/pages/{page_id}.html',
+                'title': title,
+                'content': f'{title}: findings and figures on {query}.',
+                'engine': 'fake',
+                'score': 1.0 / (i + 1),
+            })
+        return results
+
+    async def _search(self, request):
+        await asyncio.sleep(self.latency)
+        query = request.query.get('q', '')
+        body = json.dumps({
+            'query': query,
+            'number_of_results': self.results,
+            'results': self.search_results(query),
+        })
+        self.calls['search'] += 1
+        self.bytes_served += len(body)
+        return web.Response(text=body, content_type='application/json')
+
+    async def _page(self, request):
+        await asyncio.sleep(self.latency)
+        name = request.match_info['name']
+        page_id = name.removesuffix('.html')
+        if not page_id.isdigit() or int(page_id) not in self.corpus:
+            raise web.HTTPNotFound()  # Includes /pages/N.html/robots.txt
+        _, html = self.corpus[int(page_id)]
+        self.calls['page'] += 1
+        self.bytes_served += len(html)
+        return web.Response(text=html, content_type='text/html')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/search', self._search)
+        app.router.add_get('/pages/{name:.+}', self._page)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+async def serve(args):
+    fake = FakeSearch(args.host, args.port, args.latency, args.results, args.pages)
+    await fake.start()
+    print(f'Fake search on {fake.url}/search')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8889)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--results', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=60)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
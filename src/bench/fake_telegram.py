@@ -0,0 +1,152 @@
+"""Stand-in for the Telegram Bot API, for running the bot fully offline.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:8081/bot and
+TELEGRAM_FILE_URL=http://127.0.0.1:8081/file/bot.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+
+
+BOT_USER = {
+    'id': 1000000001,
+    'is_bot': True,
+    'first_name': 'WebSearchBuddy',
+    'username': 'websearchbuddy_bot',
+    'can_join_groups': True,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+
+def make_text_update(update_id, user_id, text):
+    """Build a raw private-chat text update from user_id."""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': user,
+        'text': text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [
+            {'type': 'bot_command', 'offset': 0, 'length': len(command)}
+        ]
+    return {'update_id': update_id, 'message': message}
+
+
+class FakeTelegram:
+    """Record Bot API calls and deliver updates to a registered webhook."""
+
+    def __init__(self, host='127.0.0.1', port=8081):
+        self.host = host
+        self.port = port
+        self.calls = []  # (method, params)
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._message_ids = itertools.count(1)
+        self._runner = None
+        self._session = None
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post()) if request.can_read_body else {}
+        params = {
+            key: value if isinstance(value, str) else '<file>'
+            for key, value in params.items()
+        }
+        self.calls.append((method, params))
+        return web.json_response({'ok': True, 'result': self._result(method, params)})
+
+    def _result(self, method, params):
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'setWebhook':
+            self.webhook_url = params.get('url')
+            self.webhook_secret = params.get('secret_token')
+            return True
+        if method == 'deleteWebhook':
+            self.webhook_url = None
+            return True
+        if method == 'getUpdates':
+            return []
+        if method.startswith('send'):
+            chat_id = int(json.loads(params.get('chat_id', '0')))
+            return {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+        return True
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._session = aiohttp.ClientSession()
+
+    async def stop(self):
+        await self._session.close()
+        await self._runner.cleanup()
+
+    async def push_update(self, update, webhook_url=None):
+        """POST a raw update to the webhook, like Telegram does."""
+        headers = {}
+        if self.webhook_secret:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = self.webhook_secret
+        async with self._session.post(
+            webhook_url or self.webhook_url, json=update, headers=headers
+        ) as response:
+            return response.status
+
+    def replies(self, chat_id=None):
+        """Return the texts sent by the bot, optionally to one chat only."""
+        return [
+            params.get('text', '<document>') for method, params in self.calls
+            if method.startswith('send')
+            and (chat_id is None or params.get('chat_id') == str(chat_id))
+        ]
+
+
+async def serve(args):
+    fake = FakeTelegram(args.host, args.port)
+    await fake.start()
+    print(f'Fake Telegram API on http://{args.host}:{args.port}/bot')
+    update_ids = itertools.count(1)
+    try:
+        if args.send:
+            while not (args.webhook or fake.webhook_url):
+                await asyncio.sleep(0.5)
+            for _ in range(args.send):
+                for user_id in range(1, args.users + 1):
+                    update = make_text_update(next(update_ids), user_id, args.text)
+                    status = await fake.push_update(update, args.webhook)
+                    print(f'update from user {user_id}: HTTP {status}')
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--webhook', help='Deliver to this URL instead of the registered one')
+    parser.add_argument('--send', type=int, default=0, help='Text updates per user')
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--text', default='Hello!')
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,106 @@
+"""Measure how long importing the bot takes, and what the time goes to.
+
+Each run imports the module in a fresh interpreter with -X importtime and a
+throwaway DATA_DIR. The report gives the median total, the modules with the
+largest cumulative import time and which heavy libraries were loaded at all;
+the bot should only pull those in during the warm-up, after it started.
+
+    cd src && python -m bench.import_time --runs 5
+    cd src && python -m bench.import_time --module handlers.research_handler
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Libraries that only some handlers need and that are slow to import
+HEAVY_MODULES = ('fpdf', 'bs4', 'aiohttp', 'transliterate', 'requests')
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(output):
+    """Return {module: (self_us, cumulative_us)} from -X importtime output."""
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # The header line
+        modules[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return modules
+
+
+def measure(module, data_dir):
+    """Import module once in a fresh interpreter and return its import times."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SRC_DIR,
+        env={**os.environ, 'DATA_DIR': data_dir},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr}')
+    return parse_importtime(result.stderr)
+
+
+def run(module, runs, top):
+    with tempfile.TemporaryDirectory(prefix='websearchbuddy-import-') as data_dir:
+        samples = [measure(module, data_dir) for _ in range(runs)]
+    cumulative = {
+        name: statistics.median(sample[name][1] for sample in samples if name in sample)
+        for name in samples[-1]
+    }
+    slowest = sorted(
+        (name for name in cumulative if name != module),
+        key=cumulative.get, reverse=True,
+    )[:top]
+    return {
+        'module': module,
+        'runs': runs,
+        'total_ms': cumulative[module] / 1000,
+        'modules_imported': len(samples[-1]),
+        'slowest': [
+            {'module': name, 'cumulative_ms': cumulative[name] / 1000}
+            for name in slowest
+        ],
+        'heavy_modules_loaded': [name for name in HEAVY_MODULES if name in samples[-1]],
+    }
+
+
+def print_result(result):
+    print(
+        f'import {result["module"]}: {result["total_ms"]:.0f} ms median of '
+        f'{result["runs"]} runs, {result["modules_imported"]} modules'
+    )
+    for entry in result['slowest']:
+        print(f'  {entry["cumulative_ms"]:>8.1f} ms  {entry["module"]}')
+    heavy = ', '.join(result['heavy_modules_loaded']) or 'none'
+    print(f'Heavy libraries loaded: {heavy}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--module', default='main', help='Module to import')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15,
+                        help='Slowest modules to list, by cumulative time')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    result = run(args.module, args.runs, args.top)
+    print_result(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""Synthetic Telegram load against the full Application, offline.
+
+Fake text, /delete and /research updates from many users go through the
+bot's real Application: update queue, per-user update processor and
+handlers. The Bot API transport is stubbed, so replies are recorded
+instead of sent; Ollama and search are the stand-ins of run_bench. Each
+concurrency level runs closed-loop users (next message after the reply)
+and reports throughput, latency percentiles, event-loop lag and memory
+growth per user (tracemalloc; it slows the bot, see --no-tracemalloc).
+
+    cd src && python -m bench.load_test --levels 1,8,32 --messages 5
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from telegram import Update
+from telegram.ext import TypeHandler
+from telegram.request import BaseRequest
+
+from bench.fake_telegram import BOT_USER, make_text_update
+from bench.run_bench import (
+    CHAT_QUESTIONS,
+    RESEARCH_QUERIES,
+    BenchEnvironment,
+    add_environment_arguments,
+    percentile,
+    write_results,
+)
+
+
+LEVEL_USER_STRIDE = 1_000_000  # Every level gets fresh user ids
+
+
+class StubRequest(BaseRequest):
+    """Bot API transport that answers every call locally and counts them."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        bot_method = url.rsplit('/', 1)[-1]
+        self.calls[bot_method] += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        params = request_data.parameters if request_data else {}
+        if bot_method == 'getMe':
+            result = BOT_USER
+        elif bot_method.startswith('send'):
+            chat_id = int(params.get('chat_id', 0))
+            result = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+async def sample_loop_lag(samples, interval=0.01):
+    """Append how late the loop wakes up from each interval-long sleep."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - started - interval)
+
+
+def pick_text(rng, args):
+    roll = rng.random()
+    if roll < args.research_share:
+        return f'/research -f txt {rng.choice(RESEARCH_QUERIES)}'
+    if roll < args.research_share + args.delete_share:
+        return '/delete'
+    return rng.choice(CHAT_QUESTIONS)
+
+
+class LoadTest:
+    """Feed updates into app and time each one until its handlers finish."""
+
+    def __init__(self, app, args):
+        self.app = app
+        self.args = args
+        self._update_ids = itertools.count(1)
+        self._done = {}  # update_id -> event set when the update is handled
+        # Group 1 runs after the bot's handlers in group 0 are finished
+        app.add_handler(TypeHandler(Update, self._mark_done), group=1)
+
+    async def _mark_done(self, update, context):
+        event = self._done.pop(update.update_id, None)
+        if event is not None:
+            event.set()
+
+    async def send(self, user_id, text):
+        """Put an update into the queue; return seconds until it is handled."""
+        data = make_text_update(next(self._update_ids), user_id, text)
+        update = Update.de_json(data, self.app.bot)
+        done = self._done[update.update_id] = asyncio.Event()
+        started = time.perf_counter()
+        await self.app.update_queue.put(update)
+        await done.wait()
+        return time.perf_counter() - started
+
+    async def user(self, user_id, rng, latencies):
+        for _ in range(self.args.messages):
+            text = pick_text(rng, self.args)
+            kind = text.split()[0] if text.startswith('/') else 'message'
+            latencies.setdefault(kind, []).append(await self.send(user_id, text))
+            if self.args.think_time:
+                await asyncio.sleep(rng.uniform(0, 2 * self.args.think_time))
+
+    async def run_level(self, level, users):
+        from constants import RESEARCH_JSON_FILE
+        from utils.admission import ADMIT, COALESCE, RATE_LIMITED, SHED
+        from utils.chat_store import get_chat_store
+        from utils.metrics import registry
+
+        decisions = (ADMIT, COALESCE, RATE_LIMITED, SHED)
+
+        def admission_totals():
+            return {
+                decision: registry.total('admission_decisions_total', decision=decision)
+                for decision in decisions
+            }
+
+        rng = random.Random(self.args.seed + level)
+        first_user = LEVEL_USER_STRIDE * (level + 1)
+        latencies = {}
+        lag = []
+        if tracemalloc.is_tracing():
+            gc.collect()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        sampler = asyncio.create_task(sample_loop_lag(lag))
+        requests_before = sum(self.app.bot.request.calls.values())
+        admission_before = admission_totals()
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self.user(first_user + i, random.Random(rng.random()), latencies)
+            for i in range(users)
+        ))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        # Let a research task started in this level finish before the next
+        while os.path.exists(RESEARCH_JSON_FILE):
+            await asyncio.sleep(0.2)
+        result = {
+            'users': users,
+            'updates': sum(len(values) for values in latencies.values()),
+            'seconds': elapsed,
+            'bot_api_calls': sum(self.app.bot.request.calls.values()) - requests_before,
+            'loop_lag_p50_ms': percentile(lag, 50) * 1000,
+            'loop_lag_p99_ms': percentile(lag, 99) * 1000,
+            'loop_lag_max_ms': max(lag, default=0.0) * 1000,
+            'admission': {
+                decision: total - admission_before[decision]
+                for decision, total in admission_totals().items()
+            },
+            'latency': {
+                kind: {
+                    'count': len(values),
+                    'p50_ms': percentile(values, 50) * 1000,
+                    'p95_ms': percentile(values, 95) * 1000,
+                    'p99_ms': percentile(values, 99) * 1000,
+                }
+                for kind, values in sorted(latencies.items())
+            },
+        }
+        result['throughput_per_second'] = result['updates'] / elapsed
+        if tracemalloc.is_tracing():
+            await asyncio.to_thread(get_chat_store().flush)
+            gc.collect()
+            growth = tracemalloc.get_traced_memory()[0] - memory_before
+            result['memory_growth_per_user_kib'] = growth / users / 1024
+        return result
+
+
+async def run(args):
+    from main import build_application
+
+    request = StubRequest(args.bot_api_delay)
+    app = build_application(with_updater=False, request=request)
+    load_test = LoadTest(app, args)
+    results = []
+    async with app:
+        await app.start()
+        for level, users in enumerate(args.levels):
+            result = await load_test.run_level(level, users)
+            print_level(result)
+            results.append(result)
+        await app.stop()
+    return results
+
+
+def print_level(result):
+    memory = ''
+    if 'memory_growth_per_user_kib' in result:
+        memory = f', {result["memory_growth_per_user_kib"]:.1f} KiB/user'
+    print(
+        f'{result["users"]:>4} users: {result["updates"]} updates in '
+        f'{result["seconds"]:.1f} s, {result["throughput_per_second"]:.2f} updates/s, '
+        f'loop lag p99 {result["loop_lag_p99_ms"]:.1f} ms '
+        f'(max {result["loop_lag_max_ms"]:.1f} ms){memory}'
+    )
+    admission = ', '.join(
+        f'{count} {decision}' for decision, count in result['admission'].items()
+    )
+    print(f'      admission: {admission}')
+    for kind, latency in result['latency'].items():
+        print(
+            f'      {kind:<10} n={latency["count"]:<4} p50 {latency["p50_ms"]:.0f} ms, '
+            f'p95 {latency["p95_ms"]:.0f} ms, p99 {latency["p99_ms"]:.0f} ms'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--levels', default='1,4,16,64',
+                        type=lambda value: [int(v) for v in value.split(',')],
+                        help='Comma-separated numbers of concurrent users')
+    parser.add_argument('--messages', type=int, default=5, help='Updates per user')
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='Mean seconds a user waits between messages')
+    parser.add_argument('--delete-share', type=float, default=0.05)
+    parser.add_argument('--research-share', type=float, default=0.0,
+                        help='Share of updates that are /research commands')
+    parser.add_argument('--bot-api-delay', type=float, default=0.0,
+                        help='Seconds each stubbed Bot API call takes')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help='Skip memory tracing, which slows the bot down')
+    add_environment_arguments(parser)
+    args = parser.parse_args()
+
+    power_users = [
+        LEVEL_USER_STRIDE * (level + 1) + i
+        for level, users in enumerate(args.levels) for i in range(users)
+    ]
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    with BenchEnvironment(args, power_users):
+        results = asyncio.run(run(args))
+    write_results(args, {'mode': args.mode, 'levels': results})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Record real Ollama, search and page traffic once, then replay it offline.
+
+One proxy sits in front of each upstream. In record mode it forwards every
+request and appends the exchange to a JSONL cassette; in replay mode it
+answers from the cassette only. Search results are rewritten to point at
+the proxy's /page endpoint, so page fetches are recorded as well.
+
+    python -m bench.replay --mode record --upstream http://127.0.0.1:11434 \\
+        --cassette ollama.jsonl --port 11436
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import urllib.parse
+
+import aiohttp
+from aiohttp import web
+
+
+# Prompts contain the current date; ignore it so cassettes replay any day
+DATE_PATTERN = re.compile(rb'\d{4}-\d{2}-\d{2}')
+HOP_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection'}
+
+
+def request_key(method, target, body):
+    """Return the cassette key of a request."""
+    digest = hashlib.sha256(DATE_PATTERN.sub(b'', body)).hexdigest()
+    return f'{method} {target} {digest}'
+
+
+class RecordReplayProxy:
+    """HTTP proxy that records exchanges to, or replays them from, a cassette.
+
+    upstream is the base URL requests are forwarded to; page fetches carry
+    their own absolute URL. With rewrite_search, 'url' fields of JSON search
+    results are rewritten to go through this proxy.
+    """
+
+    def __init__(self, cassette, mode='replay', upstream=None,
+                 host='127.0.0.1', port=11436, rewrite_search=False):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f'Unknown mode: {mode}')
+        self.cassette = cassette
+        self.mode = mode
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.host = host
+        self.port = port
+        self.rewrite_search = rewrite_search
+        self.exchanges = {}  # key -> list of recorded responses
+        self._served = {}  # key -> index of the next response to replay
+        self.misses = 0
+        self._runner = None
+        self._session = None
+        self._file = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def load(self):
+        if not os.path.exists(self.cassette):
+            return
+        with open(self.cassette, 'r', encoding='utf-8') as f:
+            for line in f:
+                exchange = json.loads(line)
+                self.exchanges.setdefault(exchange['key'], []).append(exchange)
+
+    def replay(self, key):
+        """Return the next recorded response for key, repeating the last one."""
+        responses = self.exchanges.get(key)
+        if not responses:
+            return None
+        index = self._served.get(key, 0)
+        self._served[key] = index + 1
+        return responses[min(index, len(responses) - 1)]
+
+    async def forward(self, request, url, body):
+        headers = {
+            name: value for name, value in request.headers.items()
+            if name.lower() not in HOP_HEADERS and name.lower() != 'host'
+        }
+        async with self._session.request(
+            request.method, url, data=body or None, headers=headers,
+            allow_redirects=True,
+        ) as response:
+            return {
+                'status': response.status,
+                'content_type': response.content_type,
+                'body': base64.b64encode(await response.read()).decode('ascii'),
+            }
+
+    def rewrite(self, body):
+        """Point the URLs of search results at this proxy."""
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body
+        for result in data.get('results', []):
+            if result.get('url'):
+                quoted = urllib.parse.quote(result['url'], safe='')
+                result['url'] = f'{self.url}/page?url={quoted}'
+        return json.dumps(data).encode('utf-8')
+
+    async def _handle(self, request):
+        body = await request.read()
+        if request.path == '/page':
+            url = target = request.query.get('url', '')
+        else:
+            url = f'{self.upstream}{request.path_qs}' if self.upstream else None
+            target = request.path_qs
+        key = request_key(request.method, target, body)
+        exchange = self.replay(key) if self.mode == 'replay' else None
+        if exchange is None:
+            if self.mode == 'replay' or url is None:
+                self.misses += 1
+                logging.warning(
+                    f'Replay miss: {request.method} {target} {body[:300]!r}'
+                )
+                return web.Response(status=502, text='Not in cassette')
+            try:
+                exchange = await self.forward(request, url, body)
+            except aiohttp.ClientError as e:
+                exchange = {'status': 502, 'content_type': 'text/plain',
+                            'body': base64.b64encode(str(e).encode()).decode('ascii')}
+            exchange['key'] = key
+            exchange['request'] = body.decode('utf-8', 'replace')
+            self._file.write(json.dumps(exchange) + '\n')
+            self._file.flush()
+        response_body = base64.b64decode(exchange['body'])
+        if self.rewrite_search and exchange['content_type'] == 'application/json':
+            response_body = self.rewrite(response_body)
+        return web.Response(
+            status=exchange['status'], body=response_body,
+            content_type=exchange['content_type'],
+        )
+
+    async def start(self):
+        if self.mode == 'replay':
+            self.load()
+        else:
+            self._file = open(self.cassette, 'a', encoding='utf-8')
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=120)
+            )
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route('*', '/{tail:.*}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+        if self._session is not None:
+            await self._session.close()
+        if self._file is not None:
+            self._file.close()
+
+
+async def serve(args):
+    proxy = RecordReplayProxy(
+        args.cassette, args.mode, args.upstream, args.host, args.port,
+        args.rewrite_search,
+    )
+    await proxy.start()
+    print(f'{args.mode.capitalize()} proxy on {proxy.url} ({args.cassette})')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await proxy.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--mode', choices=('record', 'replay'), default='replay')
+    parser.add_argument('--cassette', required=True)
+    parser.add_argument('--upstream', help='Base URL to record from')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11436)
+    parser.add_argument('--rewrite-search', action='store_true',
+                        help='Route result pages of a search upstream through the proxy')
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,334 @@
+"""End-to-end benchmark of the chat and research pipelines, fully offline.
+
+Starts the Ollama and search stand-ins (or record/replay proxies in front
+of the real services), then drives handle_message and /research with fake
+updates and reports chat latency percentiles, research wall time, LLM
+calls per task and bytes fetched. Bot data goes to a temporary DATA_DIR.
+
+    cd src && python -m bench.run_bench --chat-users 4 --chat-messages 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from types import SimpleNamespace
+
+from bench.fake_ollama import FakeOllama, add_arguments
+from bench.fake_search import FakeSearch
+from bench.replay import RecordReplayProxy
+
+
+BENCH_USER_ID = 4242
+CHAT_QUESTIONS = (
+    'What is the capital of France?',
+    'Tell me a fun fact about octopuses.',
+    'What are the latest news about battery recycling?',
+    'How do solar panels store energy at night?',
+    'Explain how large language models are trained.',
+    'What is the current price of lithium?',
+    'Why is the sky blue?',
+    'What happened in public transport policy this week?',
+    'Give me tips for remote work productivity.',
+    'How does soil store carbon?',
+    'What is the capital of France?',
+    'How do solar panels store energy at night?',
+)
+RESEARCH_QUERIES = (
+    'Impact of battery recycling on lithium supply',
+    'Coastal climate adaptation strategies in Europe',
+    'Wildfire prevention methods and their costs',
+)
+
+
+def percentile(values, q):
+    """Return the q-th percentile (0-100) of values by nearest rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class BackgroundLoop:
+    """Event loop in a daemon thread, so stand-ins never share the bot's loop."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name='bench-servers', daemon=True
+        )
+        self._thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+class FakeMessage:
+    """The parts of telegram.Message the handlers use, with recorded replies."""
+
+    def __init__(self, user_id, text):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.chat_id = user_id
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def reply_document(self, document, caption=None, **kwargs):
+        self.replies.append(('document', caption))
+
+
+def fake_update(user_id, text):
+    """Return (update, context) for a text message from user_id."""
+    message = FakeMessage(user_id, text)
+    update = SimpleNamespace(
+        message=message, effective_user=message.from_user,
+        effective_chat=SimpleNamespace(id=user_id),
+    )
+    context = SimpleNamespace(
+        args=text.split()[1:], user_data={},
+        # No per-user update queue, so admission control sees none pending
+        application=SimpleNamespace(update_processor=None),
+    )
+    return update, context
+
+
+def start_backends(args, servers):
+    """Start stand-ins or proxies; return (ollama host, search API URL)."""
+    if args.mode == 'fake':
+        ollama = FakeOllama(
+            port=args.ollama_port, latency=args.latency,
+            token_rate=args.token_rate, tokens=args.tokens,
+            iterations=args.iterations, search_ratio=args.search_ratio,
+        )
+        search = FakeSearch(port=args.search_port, latency=args.search_latency)
+        backends = [ollama, search]
+        urls = ollama.url, f'{search.url}/search'
+    else:
+        os.makedirs(args.cassettes, exist_ok=True)
+        # Replay needs the search path the cassettes were recorded with
+        meta_path = os.path.join(args.cassettes, 'meta.json')
+        if args.mode == 'record':
+            search_api_url = os.getenv('SEARCH_API_URL', '')
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'search_api_url': search_api_url}, f)
+        else:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                search_api_url = json.load(f)['search_api_url']
+        real_search = urllib.parse.urlsplit(search_api_url)
+        ollama = RecordReplayProxy(
+            os.path.join(args.cassettes, 'ollama.jsonl'), args.mode,
+            os.getenv('OLLAMA_HOST', 'http://127.0.0.1:11434'),
+            port=args.ollama_port,
+        )
+        search = RecordReplayProxy(
+            os.path.join(args.cassettes, 'search.jsonl'), args.mode,
+            f'{real_search.scheme}://{real_search.netloc}',
+            port=args.search_port, rewrite_search=True,
+        )
+        backends = [ollama, search]
+        urls = ollama.url, f'{search.url}{real_search.path}'
+    for backend in backends:
+        servers.run(backend.start())
+    return backends, urls
+
+
+async def wait_for_tasks():
+    """Wait for the tasks handlers spawned, e.g. run_research_task."""
+    current = asyncio.current_task()
+    while True:
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        if not tasks:
+            return
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def chat_user(handle_message, user_id, messages, latencies):
+    for i in range(messages):
+        text = CHAT_QUESTIONS[(user_id + i) % len(CHAT_QUESTIONS)]
+        update, context = fake_update(user_id, text)
+        started = time.perf_counter()
+        await handle_message(update, context)
+        latencies.append(time.perf_counter() - started)
+
+
+async def bench(args):
+    from handlers.message_handler import handle_message
+    from handlers.research_handler import research
+    from utils.metrics import registry
+
+    results = {}
+    if args.chat_users and args.chat_messages:
+        latencies = []
+        calls_before = registry.total('llm_requests_total')
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            chat_user(handle_message, BENCH_USER_ID + 1 + user, args.chat_messages, latencies)
+            for user in range(args.chat_users)
+        ))
+        elapsed = time.perf_counter() - started
+        await wait_for_tasks()
+        results['chat'] = {
+            'messages': len(latencies),
+            'p50_seconds': percentile(latencies, 50),
+            'p95_seconds': percentile(latencies, 95),
+            'mean_seconds': statistics.fmean(latencies),
+            'throughput_per_second': len(latencies) / elapsed,
+            'llm_calls_per_message':
+                (registry.total('llm_requests_total') - calls_before) / len(latencies),
+        }
+
+    tasks = []
+    for i in range(args.research):
+        query = RESEARCH_QUERIES[i % len(RESEARCH_QUERIES)]
+        text = f'/research {"-f " + args.formats + " " if args.formats else ""}{query}'
+        update, context = fake_update(BENCH_USER_ID, text)
+        calls_before = registry.total('llm_requests_total')
+        bytes_before = registry.total('downloaded_bytes_total')
+        started = time.perf_counter()
+        await research(update, context)
+        await wait_for_tasks()
+        tasks.append({
+            'query': query,
+            'wall_seconds': time.perf_counter() - started,
+            'llm_calls': registry.total('llm_requests_total') - calls_before,
+            'bytes_fetched': registry.total('downloaded_bytes_total') - bytes_before,
+            'documents': sum(1 for r in update.message.replies if isinstance(r, tuple)),
+            'failed': any(
+                isinstance(r, str) and r.startswith('Error') for r in update.message.replies
+            ),
+        })
+    if tasks:
+        results['research'] = {
+            'tasks': tasks,
+            'mean_wall_seconds': statistics.fmean(t['wall_seconds'] for t in tasks),
+            'mean_llm_calls': statistics.fmean(t['llm_calls'] for t in tasks),
+            'mean_bytes_fetched': statistics.fmean(t['bytes_fetched'] for t in tasks),
+        }
+    return results
+
+
+def print_results(results):
+    chat = results.get('chat')
+    if chat:
+        print(
+            f'chat: {chat["messages"]} messages, p50 {chat["p50_seconds"]*1000:.0f} ms, '
+            f'p95 {chat["p95_seconds"]*1000:.0f} ms, '
+            f'{chat["throughput_per_second"]:.2f} msg/s, '
+            f'{chat["llm_calls_per_message"]:.2f} LLM calls/msg'
+        )
+    research = results.get('research')
+    if research:
+        for task in research['tasks']:
+            status = 'FAILED' if task['failed'] else f'{task["documents"]} documents'
+            print(
+                f'research: {task["wall_seconds"]:.1f} s, {task["llm_calls"]} LLM calls, '
+                f'{task["bytes_fetched"] / 1024:.0f} KiB fetched, {status} '
+                f'- {task["query"]}'
+            )
+
+
+def add_environment_arguments(parser):
+    """Add the backend and data directory options shared by the benchmarks."""
+    parser.add_argument('--mode', choices=('fake', 'record', 'replay'), default='fake',
+                        help='Stand-ins, or proxies recording/replaying real services')
+    parser.add_argument('--cassettes', default='bench_cassettes',
+                        help='Cassette directory for record and replay')
+    parser.add_argument('--scrape-delay', type=int,
+                        help='Override SCRAPE_DELAY (ms) for the research run')
+    parser.add_argument('--ollama-port', type=int, default=11435)
+    parser.add_argument('--search-port', type=int, default=8889)
+    parser.add_argument('--search-latency', type=float, default=0.05)
+    parser.add_argument('--data-dir', help='Keep bot data here instead of a temp dir')
+    parser.add_argument('--json', help='Also write the results to this file')
+    add_arguments(parser)
+    parser.add_argument('--verbose', action='store_true', help='Show the bot\'s INFO logs')
+
+
+class BenchEnvironment:
+    """Backends in a background loop plus the environment the bot reads.
+
+    Must be entered before any bot module is imported, since constants are
+    read at import time.
+    """
+
+    def __init__(self, args, power_users=(BENCH_USER_ID,)):
+        self.args = args
+        self.power_users = power_users
+        self.servers = None
+        self.backends = []
+        self.data_dir = None
+
+    def __enter__(self):
+        if not self.args.verbose:
+            logging.disable(logging.INFO)
+        self.servers = BackgroundLoop()
+        self.backends, (ollama_host, search_url) = start_backends(self.args, self.servers)
+        self.data_dir = self.args.data_dir or tempfile.mkdtemp(
+            prefix='websearchbuddy-bench-'
+        )
+        os.environ.update({
+            'OLLAMA_HOST': ollama_host,
+            'SEARCH_API_URL': search_url,
+            'DATA_DIR': self.data_dir,
+            'POWER_USERS': ','.join(str(user_id) for user_id in self.power_users),
+        })
+        from constants import ensure_dirs
+        ensure_dirs()
+        if self.args.scrape_delay is not None:
+            from utils import search_utils
+            search_utils.SCRAPE_DELAY = self.args.scrape_delay
+        return self
+
+    def __exit__(self, *exc_info):
+        from utils.chat_store import close_chat_store
+        from utils.pdf_utils import shutdown_report_executor
+        close_chat_store()
+        shutdown_report_executor()
+        for backend in self.backends:
+            self.servers.run(backend.stop())
+        self.servers.close()
+        if not self.args.data_dir:
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+
+
+def write_results(args, results):
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--chat-users', type=int, default=4)
+    parser.add_argument('--chat-messages', type=int, default=5)
+    parser.add_argument('--research', type=int, default=1, help='Research tasks to run')
+    parser.add_argument('--formats', default='', help="Report formats, as in '/research -f'")
+    add_environment_arguments(parser)
+    args = parser.parse_args()
+
+    with BenchEnvironment(args):
+        results = asyncio.run(bench(args))
+    results['mode'] = args.mode
+    print_results(results)
+    write_results(args, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,30 +7,114 @@ load_dotenv()
 
 # Directories and filenames
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-CHAT_DIR = os.path.join(BASE_DIR, 'chats/')
-os.makedirs(CHAT_DIR, exist_ok=True)
-RESEARCH_DIR = os.path.join(BASE_DIR, 'research/')
-os.makedirs(RESEARCH_DIR, exist_ok=True)
+# Chats and research output live here; benchmarks point it at a temp dir
+DATA_DIR = os.getenv('DATA_DIR', BASE_DIR)
+CHAT_DIR = os.path.join(DATA_DIR, 'chats/')
+RESEARCH_DIR = os.path.join(DATA_DIR, 'research/')
 RESEARCH_LOG_DIR = os.path.join(RESEARCH_DIR, 'logs/')
-os.makedirs(RESEARCH_LOG_DIR, exist_ok=True)
 RESEARCH_TXT_DIR = os.path.join(RESEARCH_DIR, 'txt/')
-os.makedirs(RESEARCH_TXT_DIR, exist_ok=True)
+RESEARCH_ARCHIVE_DIR = os.path.join(RESEARCH_DIR, 'archive/')
+PROFILE_DIR = os.path.join(DATA_DIR, 'profiles/')
 RESEARCH_JSON_FILE = os.path.join(RESEARCH_DIR, 'research_task.json')
+CHAT_DB_FILE = os.path.join(CHAT_DIR, 'chats.db')
+ANSWER_CACHE_DB = os.path.join(CHAT_DIR, 'answer_cache.db')
+RESEARCH_INDEX_DB = os.path.join(RESEARCH_DIR, 'research_index.db')
+RESEARCH_ARTIFACTS_DB = os.path.join(RESEARCH_DIR, 'artifacts.db')
+
+
+def ensure_dirs():
+    """Create the data directories; run at startup rather than on import."""
+    for directory in (CHAT_DIR, RESEARCH_DIR, RESEARCH_LOG_DIR, RESEARCH_TXT_DIR,
+                      RESEARCH_ARCHIVE_DIR, PROFILE_DIR):
+        os.makedirs(directory, exist_ok=True)
+
 
 # Environment:
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'your-telegram-bot-token')
 OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://127.0.0.1:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'granite3.2:2b')
 POWER_USERS = os.getenv('POWER_USERS','1234567890')
+OLLAMA_EMBED_MODEL = os.getenv('OLLAMA_EMBED_MODEL', 'nomic-embed-text')
+# How long Ollama keeps the models loaded after a request
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
 OLLAMA_API_URL = f'{OLLAMA_HOST}/api/generate'
+OLLAMA_EMBED_URL = f'{OLLAMA_HOST}/api/embed'
 SEARCH_API_URL = os.getenv('SEARCH_API_URL', 'https://yourdomain.com/search')
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '16'))
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+TELEGRAM_FILE_URL = os.getenv(
+    'TELEGRAM_FILE_URL', 'https://api.telegram.org/file/bot'
+)
+
+# Serving mode: 'polling', 'webhook' or 'worker', a webhook worker on its own
+RUN_MODE = os.getenv('RUN_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Public URL registered at Telegram
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '2'))
+WORKER_HOST = os.getenv('WORKER_HOST', '127.0.0.1')
+WORKER_BASE_PORT = int(os.getenv('WORKER_BASE_PORT', '8600'))
+# Comma-separated worker URLs on other nodes; local workers are spawned if empty
+WORKER_URLS = os.getenv('WORKER_URLS', '')
+# Where a RUN_MODE=worker process listens for the updates the router forwards
+WORKER_LISTEN = os.getenv('WORKER_LISTEN', '0.0.0.0')
+WORKER_PORT = int(os.getenv('WORKER_PORT', str(WORKER_BASE_PORT)))
+# Serve GET /metrics on this port in polling mode; 0 disables it. Webhook
+# workers always expose /metrics next to their update endpoint
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# Load the handlers and Ollama models and check the search API at startup
+WARM_UP = True  # Load handlers and models and check the search API at startup
+OLLAMA_LOAD_TIMEOUT = 300  # Seconds a cold model may take to load
+
+# Event loop monitor and profiler constants:
+LOOP_MONITOR_ENABLED = True
+LOOP_MONITOR_INTERVAL = 0.05  # Seconds between heartbeats
+LOOP_LAG_THRESHOLD = 0.1  # Lag in seconds that counts as a stall; stack captured
+LOOP_MONITOR_SAMPLES = 6000  # Recent heartbeats kept for /stats percentiles
+PROFILE_INTERVAL = 0.01  # Seconds between /profile stack samples
+PROFILE_MAX_SECONDS = 600  # /profile stops sampling by itself after this
 
 # Text and chat constants:
 MAX_HISTORY = 20
+CHAT_CACHE_SIZE = 1000  # Users whose recent history is kept in memory
+CHAT_FLUSH_INTERVAL = 2.0  # Seconds between chat store write-behind flushes
+CHAT_FLUSH_BATCH = 200  # Pending messages that trigger an early flush
+CHAT_VERBATIM_TURNS = 6  # Latest messages kept word for word in the prompt
+CHAT_SUMMARY_BATCH = 4  # Older messages folded into the summary at once
+CHAT_PROMPT_TOKEN_BUDGET = 2048  # Max estimated tokens of a chat prompt
+CHAT_SUMMARY_MAX_TOKENS = 400  # Max estimated tokens of the rolling summary
+CHARS_PER_TOKEN = 4  # Rough chars-per-token ratio for budget estimates
 TELEGRAM_MAX_MESSAGE_LENGTH = 4096
 FONT_PATH = os.path.join(BASE_DIR, 'fonts', 'Arial.ttf')
 GENERATE_TXT = True
 GENERATE_PDF = True
+# Report formats when /research is not given '-f'; also: md, html, json
+DEFAULT_REPORT_FORMATS = [
+    name for name, enabled in (('pdf', GENERATE_PDF), ('txt', GENERATE_TXT))
+    if enabled
+]
+REPORT_WORKERS = 1  # Processes rendering PDF/TXT reports off the event loop
+
+# Answer cache constants:
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_SIZE = 2000  # Max cached answers, least recently used evicted
+ANSWER_CACHE_THRESHOLD = 0.92  # Min cosine similarity for a cache hit
+ANSWER_CACHE_CANDIDATES = 256  # Most recently used answers compared per lookup
+ANSWER_CACHE_TTL = 24 * 3600  # Seconds an evergreen answer stays valid
+ANSWER_CACHE_FRESH_TTL = 15 * 60  # Seconds for current-events answers
+
+# Admission control constants, see utils/admission:
+ADMISSION_CONTROL = True
+ADMISSION_USER_RATE = 0.2  # Messages per second a user may send on average
+ADMISSION_USER_BURST = 5  # Messages a user may send at once
+ADMISSION_GLOBAL_RATE = 4.0  # Messages per second of all users together
+ADMISSION_GLOBAL_BURST = 20
+ADMISSION_SHED_DEPTH = 24  # Ollama requests in flight that shed new messages
+ADMISSION_MAX_USERS = 10000  # Idle users whose rate limit state is kept
 
 # Search constants:
 NUM_SEARCH_RESULTS = 15
@@ -44,6 +128,24 @@ MAX_SCRAPED_CONTENT_LENGTH = 20000  # Max characters per page
 SCRAPE_DELAY = 1000  # Delay between scrapes in ms
 RESPECT_ROBOTS_TXT = True  # Respect robots.txt by default
 SUMMARY_LENGTH = 1500  # Max characters per page summary
+RESEARCH_INDEX_MIN_SCORE = 0.75  # Min match score to answer from past research
+RESEARCH_INDEX_MAX_HITS = 5  # Stored findings passed to the summary prompt
+RESEARCH_TRACE_APPENDIX = True  # Append the timing breakdown to reports
+# Generate the next queries from the page summaries while the batch summary
+# runs and prefetch their pages; the completion check cancels them
+SPECULATIVE_PREFETCH = False
+RESEARCH_CACHE_SIZE = 200  # Search results and pages kept per cache
+RESEARCH_CACHE_TTL = 15 * 60  # Seconds a cached search or page stays valid
+# Per-task budget; the fan-out above shrinks to fit it, see research_budget
+RESEARCH_TIME_BUDGET = 20 * 60  # Wall-clock seconds, '/research -t MIN' overrides
+RESEARCH_TOKEN_BUDGET = 600000  # Prompt plus completion tokens
+RESEARCH_BUDGET_RESERVE = 0.15  # Share kept for the final summary and conclusion
+RESEARCH_BUDGET_MIN_SCALE = 0.05  # Conclude below this share of the full fan-out
+MIN_EXCERPT_LENGTH = 2000  # Page characters kept however tight the budget
+LLM_QUEUE_SATURATION = 8  # Other Ollama requests in flight that halve the fan-out
+# Retention of task archives, logs and reports, see artifact_store; 0 keeps all
+RESEARCH_RETENTION_BYTES = 2 * 1024 ** 3  # Oldest deleted beyond this total size
+RESEARCH_RETENTION_DAYS = 365  # Deleted once older than this
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
@@ -1,23 +1,24 @@
-import os
+import asyncio
 
 from telegram import Update
-from telegram.ext import ContextTypes, CommandHandler
+from telegram.ext import ContextTypes
 
+from utils.chat_store import get_chat_store
+from utils.metrics import instrument
 
+
+@instrument('delete', metric='handler_seconds')
 async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /delete command to remove user's chat history."""
     user_id = update.message.from_user.id
-    chat_file = f'../chats/{user_id}.json'
-
-    if os.path.exists(chat_file):
-        try:
-            os.remove(chat_file)
-            await update.message.reply_text('Your chat history has been deleted.')
-        except Exception as e:
-            await update.message.reply_text(
-                f'Failed to delete chat history: {str(e)}'
-            )
+    try:
+        deleted = await asyncio.to_thread(get_chat_store().delete, user_id)
+    except Exception as e:
+        await update.message.reply_text(
+            f'Failed to delete chat history: {str(e)}'
+        )
+        return
+    if deleted:
+        await update.message.reply_text('Your chat history has been deleted.')
     else:
         await update.message.reply_text('No chat history found to delete.')
-
-delete_handler = CommandHandler('delete', delete)
\ No newline at end of file
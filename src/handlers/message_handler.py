@@ -1,24 +1,27 @@
-import json
-import os
+import asyncio
 import logging
+import time
 from telegram import Update
-from telegram.ext import ContextTypes, MessageHandler, filters
+from telegram.ext import ContextTypes
 from constants import (
-    MAX_HISTORY, AGENT_PRECONTEXT, CHAT_DIR,
+    ADMISSION_CONTROL, ANSWER_CACHE_ENABLED, OLLAMA_EMBED_MODEL,
     SUMMARIZE_SEARCH_PROMPT_TEMPLATE, TELEGRAM_MAX_MESSAGE_LENGTH
 )
-from utils.ollama_utils import ollama_generate, analyze_prompt, refine_search_query
+from utils.admission import (
+    ADMIT, COALESCE, get_admission_controller, pending_text_messages
+)
+from utils.answer_cache import get_answer_cache
+from utils.chat_memory import build_chat_prompt, schedule_summary
+from utils.chat_store import get_chat_store
+from utils.metrics import instrument
+from utils.ollama_utils import (
+    ollama_generate, ollama_embed, analyze_prompt, refine_search_query,
+    is_model_missing
+)
+from utils.research_index import format_findings, lookup_findings
 from utils.search_utils import perform_search
 
 
-def save_conversation(conversation, chat_file, max_history=MAX_HISTORY):
-    """Save conversation to JSON file, truncating if over max_history."""
-    if len(conversation) > max_history:
-        conversation = conversation[-max_history:]
-    with open(chat_file, 'w') as f:
-        json.dump(conversation, f, indent=2)
-
-
 async def send_in_chunks(reply_func, text, chunk_size=TELEGRAM_MAX_MESSAGE_LENGTH):
     """Send long text in chunks smaller than chunk_size."""
     for i in range(0, len(text), chunk_size):
@@ -26,32 +29,85 @@ async def send_in_chunks(reply_func, text, chunk_size=TELEGRAM_MAX_MESSAGE_LENGT
         await reply_func(chunk)
 
 
+async def lookup_answer(question):
+    """Return (embedding, cached answer) of question; either may be None."""
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    answer_cache = get_answer_cache()
+    if not answer_cache.enabled:
+        return None, None
+    try:
+        vector = await asyncio.to_thread(ollama_embed, question)
+    except Exception as e:
+        # Already logged; without the model every message would fail again
+        if is_model_missing(e):
+            answer_cache.disable(f'embedding model {OLLAMA_EMBED_MODEL} not found')
+        return None, None
+    answer = await asyncio.to_thread(answer_cache.lookup, vector)
+    if answer is not None:
+        logging.info(f'Answer cache hit: {answer_cache.stats()}')
+    return vector, answer
+
+
+@instrument('message', metric='handler_seconds')
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle incoming text messages from users."""
+    """Handle incoming text messages from users, if admission control lets them."""
+    if not ADMISSION_CONTROL:
+        await answer_message(update)
+        return
     user_id = update.message.from_user.id
-    chat_file = os.path.join(CHAT_DIR, f'{user_id}.json')
-    if os.path.exists(chat_file):
-        with open(chat_file, 'r') as f:
-            conversation = json.load(f)
-    else:
-        conversation = []
+    admission = get_admission_controller()
+    decision, retry_after = admission.admit(
+        user_id, pending_text_messages(context, user_id)
+    )
+    if decision == COALESCE:
+        # Answered as context of the user's next text message
+        await asyncio.to_thread(
+            get_chat_store().append, user_id, f'user: {update.message.text}'
+        )
+        return
+    if decision != ADMIT:
+        logging.info(f'Message of user {user_id} {decision}, retry in {retry_after} s')
+        notify = admission.should_notify(user_id, retry_after)
+        dropped = admission.pop_coalesced(user_id)
+        if dropped:
+            await update.message.reply_text(
+                f'Busy, please retry in {retry_after} s. Your {dropped} earlier '
+                f'message(s) were not answered either.'
+            )
+        elif notify:
+            await update.message.reply_text(f'Busy, please retry in {retry_after} s.')
+        return
+    started = time.monotonic()
+    try:
+        await answer_message(update)
+    finally:
+        admission.observe(time.monotonic() - started)
+
+
+async def answer_message(update: Update):
+    """Answer a text message from the answer cache, the LLM or a web search."""
+    user_id = update.message.from_user.id
+    chat_store = get_chat_store()
+    # Loads the user into the cache, so the appends below stay in memory
+    conversation = await asyncio.to_thread(chat_store.get_history, user_id)
     user_message = update.message.text
     conversation.append(f'user: {user_message}')
-    save_conversation(conversation, chat_file)
-
-    # Analyze prompt with conversation context
-    category = analyze_prompt(user_message, conversation)
+    chat_store.append(user_id, conversation[-1])
 
     async def reply_and_log(message):
         conversation.append(f'agent: {message}')
-        save_conversation(conversation, chat_file)
+        chat_store.append(user_id, conversation[-1])
+        schedule_summary(user_id)
         await send_in_chunks(update.message.reply_text, message)
 
+    # Analyze prompt with conversation context
+    category = await asyncio.to_thread(analyze_prompt, user_message, conversation)
+
     if category == 1:
         try:
-            history_str = '\n'.join(conversation)
-            prompt = f'{AGENT_PRECONTEXT}\n{history_str}\nagent:'
-            response = ollama_generate(prompt)
+            prompt = build_chat_prompt(user_id)
+            response = await asyncio.to_thread(ollama_generate, prompt)
             agent_response = response.get('response', '').strip()
             await reply_and_log(agent_response)
         except Exception as e:
@@ -61,17 +117,40 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await reply_and_log('Need to search the web')
         try:
             # Refine the user's query using Ollama
-            refined_query = refine_search_query(user_message, conversation)
+            refined_query = await asyncio.to_thread(
+                refine_search_query, user_message, conversation
+            )
             logging.info(f'Refined search query: {refined_query}')
-            search_results = perform_search(refined_query)
+            # The refined query carries the conversation context, so a
+            # follow-up like "and tomorrow?" only matches its own topic
+            question_vector, cached_answer = await lookup_answer(refined_query)
+            if cached_answer is not None:
+                await reply_and_log(cached_answer)
+                return
+            # A hit pays for everything up to here too; it saves what follows
+            started = time.monotonic()
+            hits = await asyncio.to_thread(lookup_findings, refined_query)
+            if hits:
+                logging.info(
+                    f'Answering from {len(hits)} past research findings '
+                    f'(best score {hits[0]["score"]:.2f})'
+                )
+                search_results = format_findings(hits)
+            else:
+                search_results = await asyncio.to_thread(perform_search, refined_query)
             if search_results and search_results != 'Failed to retrieve search results.':
                 prompt = SUMMARIZE_SEARCH_PROMPT_TEMPLATE.format(
                     user_query=user_message,
                     search_results=search_results
                 )
-                response = ollama_generate(prompt)
+                response = await asyncio.to_thread(ollama_generate, prompt)
                 summary = response.get('response', '').strip()
                 await reply_and_log(summary)
+                if question_vector is not None and summary:
+                    await asyncio.to_thread(
+                        get_answer_cache().store, refined_query, question_vector,
+                        summary, time.monotonic() - started
+                    )
             else:
                 await reply_and_log('No search results found.')
         except Exception as e:
@@ -79,6 +158,3 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await reply_and_log('Sorry, I couldn’t perform the search right now.')
     else:
         await reply_and_log('Sorry, I don’t understand that request.')
-
-
-message_handler = MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)
\ No newline at end of file
@@ -1,9 +1,12 @@
 import os
 
 from telegram import Update
-from telegram.ext import ContextTypes, CommandHandler
+from telegram.ext import ContextTypes
 
+from utils.metrics import instrument
 
+
+@instrument('model', metric='handler_seconds')
 async def model(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /model command to show the current Ollama model."""
     ollama_model = os.getenv('OLLAMA_MODEL', 'Not specified')
@@ -20,5 +23,3 @@ async def model(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             f'Error retrieving model information: {str(e)}'
         )
-
-model_handler = CommandHandler('model', model)
@@ -0,0 +1,45 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from constants import POWER_USERS
+from utils.metrics import instrument
+from utils.profiler import get_profiler, start_profiler, stop_profiler
+
+
+@instrument('profile', metric='handler_seconds')
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /profile start|stop: sample all threads and send the stacks."""
+    user_id = str(update.message.from_user.id)
+    if user_id not in POWER_USERS.split(','):
+        await update.message.reply_text('Permission denied.')
+        return
+
+    action = context.args[0].lower() if context.args else ''
+    if action == 'start':
+        if get_profiler() is not None:
+            await update.message.reply_text(
+                'The profiler is already running, send /profile stop first.'
+            )
+            return
+        profiler = start_profiler()
+        await update.message.reply_text(
+            f'Sampling all threads every {profiler.interval * 1000:.0f} ms for up '
+            f'to {profiler.max_seconds // 60} min. Send /profile stop for the stacks.'
+        )
+    elif action == 'stop':
+        profiler = await asyncio.to_thread(stop_profiler)
+        if profiler is None:
+            await update.message.reply_text('The profiler is not running.')
+            return
+        path = await asyncio.to_thread(profiler.save)
+        with open(path, 'rb') as f:
+            await update.message.reply_document(
+                f, caption=(
+                    f'{profiler.samples} samples over {profiler.seconds:.0f} s, '
+                    'collapsed stacks for flamegraph.pl or speedscope'
+                ),
+            )
+    else:
+        await update.message.reply_text('Usage: /profile start|stop')
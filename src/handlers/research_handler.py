@@ -4,10 +4,11 @@ import uuid
 import asyncio
 import logging
 import re
+import sqlite3
 from datetime import datetime
 
 from telegram import Update
-from telegram.ext import ContextTypes, CommandHandler
+from telegram.ext import ContextTypes
 from transliterate import translit
 
 from constants import (
@@ -17,14 +18,21 @@ from constants import (
     RESEARCH_LOG_DIR,
     MAX_QUERIES_PER_BATCH,
     SUMMARY_LENGTH,
+    DEFAULT_REPORT_FORMATS,
+    SPECULATIVE_PREFETCH,
+    RESEARCH_TIME_BUDGET,
 )
+from utils.artifact_store import get_artifact_store, task_archive_path
 from utils.ollama_utils import (
     generate_plan,
     generate_batch_queries,
     check_completion,
+    generate_conclusion,
     ollama_generate,
 )
-from utils.pdf_utils import generate_pdf
+from utils.logging_confg import close_task_log, flush_logs, open_task_log
+from utils.metrics import instrument
+from utils.report_writers import REPORT_WRITERS, ReportBuilder
 from utils.prompts import (
     INITIAL_BATCH_QUERIES_PROMPT_TEMPLATE,
     NEXT_BATCH_QUERIES_PROMPT_TEMPLATE,
@@ -32,7 +40,10 @@ from utils.prompts import (
     SUMMARIZE_STEP_PROMPT_TEMPLATE,
     SUMMARIZE_RESEARCH_PROMPT_TEMPLATE,
 )
-from utils.search_utils import perform_research_search
+from utils.research_budget import ResearchBudget
+from utils.research_index import forget_artifacts, index_finished_task
+from utils.research_trace import activate, end_span, new_span, run_in_span, span
+from utils.search_utils import perform_research_search, prefetch_research_search
 
 
 def sanitize_filename(query):
@@ -47,18 +58,8 @@ def sanitize_filename(query):
     sanitized = re.sub(r'[^a-z0-9\s]', '', sanitized).strip()
     return '_'.join(word for word in sanitized.split() if word)
 
-def get_unique_filename(base_name, directory, extension):
-    """Generate a unique filename with counter if needed."""
-    filename = f'research_{base_name}{extension}'
-    filepath = os.path.join(directory, filename)
-    counter = 1
-    while os.path.exists(filepath):
-        filename = f'research_{base_name}_{counter:03d}{extension}'
-        filepath = os.path.join(directory, filename)
-        counter += 1
-    return filepath
-
 
+@instrument('research', metric='handler_seconds')
 async def research(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /research command."""
     user_id = str(update.message.from_user.id)
@@ -70,55 +71,160 @@ async def research(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text('Research task already in progress.')
         return
 
-    query = ' '.join(context.args)
+    args = list(context.args)
+    formats = DEFAULT_REPORT_FORMATS
+    time_budget = RESEARCH_TIME_BUDGET
+    while len(args) >= 2 and args[0] in ('-f', '--format', '-t', '--time'):
+        option, value, args = args[0], args[1], args[2:]
+        if option in ('-t', '--time'):
+            try:
+                time_budget = float(value) * 60
+            except ValueError:
+                time_budget = 0
+            if time_budget <= 0:
+                await update.message.reply_text(
+                    'The time budget is a number of minutes, e.g. -t 5'
+                )
+                return
+            continue
+        formats = [f.strip().lower() for f in value.split(',') if f.strip()]
+        unknown = [f for f in formats if f not in REPORT_WRITERS]
+        if unknown or not formats:
+            await update.message.reply_text(
+                f'Unknown report format: {", ".join(unknown)}. '
+                f'Available: {", ".join(REPORT_WRITERS)}'
+            )
+            return
+    query = ' '.join(args)
     if not query:
         await update.message.reply_text('Please provide a query.')
         return
 
     research_id = str(uuid.uuid4())  # Keep UUID internally
     current_date = datetime.now().strftime('%Y-%m-%d')
-    plan = generate_plan(query, current_date)
-    base_name = sanitize_filename(query)
-
-    # Setup logging with query-based filename
-    log_file = get_unique_filename(base_name, RESEARCH_LOG_DIR, '.log')
-    logger = logging.getLogger(research_id)
-    logger.setLevel(logging.INFO)
-    handler = logging.FileHandler(log_file, encoding='utf-8')
-    handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
-    logger.addHandler(handler)
-
-    task_state = {
-        'research_id': research_id,
-        'user_id': user_id,
-        'current_date': current_date,
-        'initial_user_query': query,
-        'plan': plan,
-        'iterations': [],
-        'next_queries': [],
-        'complete_status': None,
-        'final_summary': None,
-        'status': 'pending',
-        'used_urls': [],
-        'base_name': base_name
-    }
-
-    prompt = INITIAL_BATCH_QUERIES_PROMPT_TEMPLATE.format(
-        current_date=current_date,
-        initial_query=query,
-        plan=plan,
-        max_queries=MAX_QUERIES_PER_BATCH
-    )
-    task_state['next_queries'] = generate_batch_queries(prompt)
-    save_task_state(task_state)
-
-    await update.message.reply_text('Starting research task...')
+    # Claim the research slot before yielding to other updates
+    if not claim_research_slot({'research_id': research_id, 'status': 'pending'}):
+        await update.message.reply_text('Research task already in progress.')
+        return
+    trace = new_span('research', query)
+    logger = None
+    # Until the task runs, any failure must give the slot back
+    try:
+        with activate(trace):
+            plan = await run_in_span('plan', generate_plan, query, current_date)
+            prompt = INITIAL_BATCH_QUERIES_PROMPT_TEMPLATE.format(
+                current_date=current_date,
+                initial_query=query,
+                plan=plan,
+                max_queries=MAX_QUERIES_PER_BATCH
+            )
+            next_queries = await run_in_span(
+                'query_generation', generate_batch_queries, prompt
+            )
+        base_name = sanitize_filename(query)
+
+        # Setup logging with query-based filename
+        log_file = await asyncio.to_thread(
+            get_artifact_store().reserve_path, base_name, RESEARCH_LOG_DIR, '.log'
+        )
+        logger = await asyncio.to_thread(open_task_log, research_id, log_file)
+
+        task_state = {
+            'research_id': research_id,
+            'user_id': user_id,
+            'current_date': current_date,
+            'initial_user_query': query,
+            'plan': plan,
+            'iterations': [],
+            'next_queries': next_queries,
+            'complete_status': None,
+            'final_summary': None,
+            'status': 'pending',
+            'used_urls': [],
+            'base_name': base_name,
+            'formats': formats,
+            'trace': trace,
+            'log_file': log_file,
+        }
+        budget = ResearchBudget(task_state, seconds=time_budget)
+        await asyncio.to_thread(save_task_state, task_state)
+
+        await update.message.reply_text(
+            f'Starting research task {research_id[:8]}... '
+            f'(/trace {research_id[:8]} shows its timing)'
+        )
+    except Exception as e:
+        if logger is not None:
+            await asyncio.to_thread(close_task_log, logger)
+        try:
+            os.remove(RESEARCH_JSON_FILE)
+        except FileNotFoundError:
+            pass
+        await update.message.reply_text(f'Failed to start research: {e}')
+        return
     context.user_data['current_task_id'] = research_id
-    asyncio.create_task(run_research_task(update, context, task_state, logger))
+    # The task copies the context, so its work is recorded into the trace
+    with activate(trace):
+        asyncio.create_task(
+            run_research_task(update, context, task_state, budget, logger)
+        )
+
+class Speculation:
+    """Next batch queries generated from an iteration's page summaries.
+
+    They are generated while the batch summary runs, and their searches and
+    pages are prefetched into the search caches while the batch summary and
+    the completion check finish.
+    """
+
+    def __init__(self, task_state, batch_results, iteration_number, max_urls, logger):
+        iterations = task_state['iterations'] + [{
+            'iteration_number': iteration_number,
+            'queries': batch_results,
+            'summary': '',
+        }]
+        prompt = NEXT_BATCH_QUERIES_PROMPT_TEMPLATE.format(
+            current_date=task_state['current_date'],
+            initial_query=task_state['initial_user_query'],
+            plan=task_state['plan'],
+            iterations_json=json.dumps(iterations, indent=2),
+            max_queries=MAX_QUERIES_PER_BATCH
+        )
+        self.max_urls = max_urls
+        self.logger = logger
+        self.queries = asyncio.create_task(
+            run_in_span('speculative_queries', generate_batch_queries, prompt)
+        )
+        self.prefetch = asyncio.create_task(self._prefetch())
+
+    async def _prefetch(self):
+        try:
+            queries = await self.queries
+        except Exception:
+            return  # Reported by next_queries()
+        with span('prefetch', f'{len(queries)} queries'):
+            await prefetch_research_search(queries, self.logger, self.max_urls)
+
+    async def next_queries(self):
+        """Return the speculative queries, or [] if generating them failed."""
+        try:
+            return await self.queries
+        except Exception as e:
+            self.logger.warning(f'Speculative query generation failed: {e}')
+            return []
 
-async def run_research_task(update: Update, context, task_state, logger):
-    """Run the research task with scraping."""
+    def cancel(self):
+        self.queries.cancel()
+        self.prefetch.cancel()
+
+
+@instrument('research_task', metric='handler_seconds')
+async def run_research_task(update: Update, context, task_state, budget, logger):
+    """Run the research task with scraping, within budget."""
+    report = None
+    speculations = []
     try:
+        report = await asyncio.to_thread(ReportBuilder, task_state, task_state['formats'])
         iteration_number = 1
         while iteration_number <= MAX_BATCH_ITERATIONS:
             queries = task_state['next_queries']
@@ -126,77 +232,123 @@ async def run_research_task(update: Update, context, task_state, logger):
                 logger.info(f'Iteration {iteration_number}: No queries generated.')
                 await update.message.reply_text(f'Iteration {iteration_number}: No queries.')
                 break
+            fanout = budget.plan_iteration()
+            if fanout is None:
+                logger.info(f'Budget spent: {task_state["budget"]["concluded_early"]}')
+                await update.message.reply_text('Research budget spent.')
+                break
+            queries = queries[:fanout['queries']]
+            logger.info(f'Iteration {iteration_number} fan-out: {fanout}')
 
-            await update.message.reply_text('Searching...')
-            logger.info(f'Iteration {iteration_number}: Searching {len(queries)} queries')
-            batch_results = []
-            for query in queries:
-                logger.info(f'Searching: "{query}"')
-                results = await perform_research_search(query, logger)
-                if not results:
-                    logger.warning(f'No results for query: {query}')
-                    continue
-
-                for result in results:
-                    content = result['content']
-                    prompt = SUMMARIZE_STEP_PROMPT_TEMPLATE.format(
-                        query=query,
-                        raw_content=content,
-                        summary_length=SUMMARY_LENGTH
+            with span('iteration', str(iteration_number)):
+                await update.message.reply_text('Searching...')
+                logger.info(f'Iteration {iteration_number}: Searching {len(queries)} queries')
+                batch_results = []
+                for query in queries:
+                    logger.info(f'Searching: "{query}"')
+                    with span('search', query):
+                        results = await perform_research_search(
+                            query, logger, fanout['urls_per_query'],
+                            fanout['excerpt_length'],
+                        )
+                    if not results:
+                        logger.warning(f'No results for query: {query}')
+                        continue
+
+                    for result in results:
+                        content = result['content']
+                        prompt = SUMMARIZE_STEP_PROMPT_TEMPLATE.format(
+                            query=query,
+                            raw_content=content,
+                            summary_length=SUMMARY_LENGTH
+                        )
+                        response = await run_in_span(
+                            'summary', ollama_generate, prompt, detail=result['url']
+                        )
+                        summary = response.get('response', '').strip()
+                        batch_results.append({
+                            'query': query,
+                            'url': result['url'],
+                            'title': result['title'],
+                            'summary': summary
+                        })
+                        task_state['used_urls'].append(result['url'])
+
+                if not batch_results:
+                    logger.error('No valid results in batch.')
+                    raise Exception('No data retrieved for iteration.')
+
+                speculation = None
+                if SPECULATIVE_PREFETCH and iteration_number < MAX_BATCH_ITERATIONS:
+                    speculation = Speculation(
+                        task_state, batch_results, iteration_number,
+                        fanout['urls_per_query'], logger,
                     )
-                    summary = ollama_generate(prompt).get('response', '').strip()
-                    batch_results.append({
-                        'query': query,
-                        'url': result['url'],
-                        'title': result['title'],
-                        'summary': summary
-                    })
-                    task_state['used_urls'].append(result['url'])
-
-            if not batch_results:
-                logger.error('No valid results in batch.')
-                raise Exception('No data retrieved for iteration.')
-
-            await update.message.reply_text('Summarizing...')
-            batch_summary_prompt = SUMMARIZE_STEP_PROMPT_TEMPLATE.format(
-                query='batch queries',
-                raw_content=json.dumps([r['summary'] for r in batch_results], indent=2),
-                summary_length=SUMMARY_LENGTH * 2
-            )
-            batch_summary = ollama_generate(batch_summary_prompt).get('response', '').strip()
-
-            task_state['iterations'].append({
-                'iteration_number': iteration_number,
-                'queries': batch_results,
-                'summary': batch_summary
-            })
-            save_task_state(task_state)
-
-            iterations_json = json.dumps(task_state['iterations'], indent=2)
-            prompt = COMPLETION_CHECK_PROMPT_TEMPLATE.format(
-                current_date=task_state['current_date'],
-                initial_query=task_state['initial_user_query'],
-                plan=task_state['plan'],
-                iterations_json=iterations_json
-            )
-            complete_response = check_completion(prompt)
-            task_state['complete_status'] = complete_response
-            decision = int(complete_response[0])
+                    speculations.append(speculation)
 
-            if decision == 2 or iteration_number == MAX_BATCH_ITERATIONS:
-                if iteration_number == MAX_BATCH_ITERATIONS:
-                    await update.message.reply_text('Max iterations reached.')
-                break
+                await update.message.reply_text('Summarizing...')
+                batch_summary_prompt = SUMMARIZE_STEP_PROMPT_TEMPLATE.format(
+                    query='batch queries',
+                    raw_content=json.dumps([r['summary'] for r in batch_results], indent=2),
+                    summary_length=SUMMARY_LENGTH * 2
+                )
+                response = await run_in_span(
+                    'batch_summary', ollama_generate, batch_summary_prompt
+                )
+                batch_summary = response.get('response', '').strip()
 
-            prompt = NEXT_BATCH_QUERIES_PROMPT_TEMPLATE.format(
-                current_date=task_state['current_date'],
-                initial_query=task_state['initial_user_query'],
-                plan=task_state['plan'],
-                iterations_json=iterations_json,
-                max_queries=MAX_QUERIES_PER_BATCH
-            )
-            task_state['next_queries'] = generate_batch_queries(prompt)
-            save_task_state(task_state)
+                task_state['iterations'].append({
+                    'iteration_number': iteration_number,
+                    'queries': batch_results,
+                    'summary': batch_summary
+                })
+                save_task_state(task_state)
+                report.add_iteration(task_state['iterations'][-1])
+
+                iterations_json = json.dumps(task_state['iterations'], indent=2)
+                prompt = COMPLETION_CHECK_PROMPT_TEMPLATE.format(
+                    current_date=task_state['current_date'],
+                    initial_query=task_state['initial_user_query'],
+                    plan=task_state['plan'],
+                    iterations_json=iterations_json
+                )
+                complete_response = await run_in_span(
+                    'completion_check', check_completion, prompt
+                )
+                task_state['complete_status'] = complete_response
+                decision = int(complete_response[0])
+                last = iteration_number == MAX_BATCH_ITERATIONS
+                out_of_budget = decision != 2 and not last and budget.exhausted()
+
+                if decision == 2 or last or out_of_budget:
+                    if speculation is not None:
+                        speculation.cancel()
+                    if last:
+                        await update.message.reply_text('Max iterations reached.')
+                    elif out_of_budget:
+                        logger.info(f'Budget spent: {task_state["budget"]["concluded_early"]}')
+                        await update.message.reply_text('Research budget spent.')
+                    budget.record(f'iteration {iteration_number}', fanout)
+                    break
+
+                # Speculative queries were prefetched, so the next search is warm
+                next_queries = await speculation.next_queries() if speculation else []
+                if next_queries:
+                    logger.info(f'Using speculative queries: {next_queries}')
+                else:
+                    prompt = NEXT_BATCH_QUERIES_PROMPT_TEMPLATE.format(
+                        current_date=task_state['current_date'],
+                        initial_query=task_state['initial_user_query'],
+                        plan=task_state['plan'],
+                        iterations_json=iterations_json,
+                        max_queries=MAX_QUERIES_PER_BATCH
+                    )
+                    next_queries = await run_in_span(
+                        'query_generation', generate_batch_queries, prompt
+                    )
+                task_state['next_queries'] = next_queries
+                budget.record(f'iteration {iteration_number}', fanout)
+                save_task_state(task_state)
             iteration_number += 1
 
         await update.message.reply_text('Making conclusion...')
@@ -206,42 +358,115 @@ async def run_research_task(update: Update, context, task_state, logger):
             plan=task_state['plan'],
             steps=iterations_json
         )
-        task_state['final_summary'] = ollama_generate(final_prompt).get('response', '').strip()
+        # The conclusion only needs the iterations, so it runs alongside
+        response, conclusion = await asyncio.gather(
+            run_in_span('final_summary', ollama_generate, final_prompt),
+            run_in_span('conclusion', generate_conclusion, task_state),
+        )
+        task_state['final_summary'] = response.get('response', '').strip()
+        task_state['conclusion'] = conclusion
         task_state['status'] = 'complete'
+        budget.record('conclusion')
         save_task_state(task_state)
 
         await update.message.reply_text('Generating files...')
-        pdf_file, txt_file = generate_pdf(task_state)
-        if pdf_file:
-            with open(pdf_file, 'rb') as pdf:
-                await update.message.reply_document(pdf, caption='Research complete (PDF)')
-        if txt_file:
-            with open(txt_file, 'rb') as txt:
-                await update.message.reply_document(txt, caption='Research raw text')
+        # The appendix is written before rendering, so its total excludes it
+        end_span(task_state['trace'])
+        with span('rendering'):
+            report_files = await report.finish(conclusion)
+        for report_file, caption in report_files:
+            with open(report_file, 'rb') as f:
+                await update.message.reply_document(f, caption=caption)
+        try:
+            await asyncio.to_thread(
+                index_finished_task, task_state,
+                [report_file for report_file, _ in report_files],
+            )
+        except Exception as e:
+            logger.error(f'Failed to index research: {e}')
 
     except Exception as e:
         logger.error(f'Fatal error: {e}')
+        if report is not None:
+            report.close()
         await update.message.reply_text('Error during research, see logs.')
-        with open(logger.handlers[0].baseFilename, 'rb') as log_file:
+        await asyncio.to_thread(flush_logs)
+        with open(task_state['log_file'], 'rb') as log_file:
             await update.message.reply_document(log_file, caption='Research log')
     finally:
+        for speculation in speculations:
+            speculation.cancel()
         if 'current_task_id' in context.user_data:
             del context.user_data['current_task_id']
-        archive_completed_task()
-        logger.handlers[0].close()
-        logger.removeHandler(logger.handlers[0])
+        end_span(task_state['trace'])
+        await asyncio.to_thread(close_task_log, logger)
+        reports = [writer.path for writer in report.writers] if report else []
+        await asyncio.to_thread(archive_completed_task, task_state, reports)
+
+def claim_research_slot(state):
+    """Create the task JSON atomically; return False if a task is running."""
+    try:
+        fd = os.open(RESEARCH_JSON_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    return True
 
 def save_task_state(state):
     """Save task state to JSON."""
     with open(RESEARCH_JSON_FILE, 'w', encoding='utf-8') as f:
         json.dump(state, f, indent=2, ensure_ascii=False)
 
-def archive_completed_task():
-    """Archive completed task JSON."""
-    if os.path.exists(RESEARCH_JSON_FILE):
-        i = 1
-        while os.path.exists(f'{RESEARCH_JSON_FILE}.{i:03d}'):
-            i += 1
-        os.rename(RESEARCH_JSON_FILE, f'{RESEARCH_JSON_FILE}.{i:03d}')
+def find_task_state(research_id='', user_id=None):
+    """Return the current or archived task whose id starts with research_id.
+
+    Without research_id the most recent task is returned; with user_id
+    only tasks of that user are.
+    """
+    try:
+        with open(RESEARCH_JSON_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        pass
+    else:
+        if (state.get('research_id', '').startswith(research_id)
+                and user_id in (None, state.get('user_id'))):
+            return state
+    return get_artifact_store().find_task(research_id, user_id)
+
+def archive_completed_task(task_state, reports=()):
+    """Compress the task log, archive the task JSON and apply retention.
 
-research_handler = CommandHandler('research', research)
\ No newline at end of file
+    Errors are logged, not raised: this runs when the task is over, and the
+    task JSON leaves RESEARCH_JSON_FILE in any case, so that the next
+    /research can claim the slot.
+    """
+    try:
+        store = get_artifact_store()
+        store.add_task_files(task_state, reports)
+        if os.path.exists(task_state['log_file']):
+            task_state['log_file'] = store.compress(task_state['log_file'], task_state)
+        save_task_state(task_state)
+        store.archive_task()
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logging.error(f'Failed to archive research {task_state["research_id"]}: {e}')
+        release_research_slot(task_state)
+        return
+    try:
+        forget_artifacts(store.prune())
+    except (OSError, sqlite3.Error) as e:
+        logging.error(f'Research retention failed: {e}')
+
+def release_research_slot(task_state):
+    """Move a task JSON that could not be archived next to the archives."""
+    try:
+        os.replace(RESEARCH_JSON_FILE, task_archive_path(task_state['research_id']))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.error(f'Failed to move {RESEARCH_JSON_FILE}, removing it: {e}')
+        try:
+            os.remove(RESEARCH_JSON_FILE)
+        except OSError:
+            logging.exception(f'Failed to remove {RESEARCH_JSON_FILE}')
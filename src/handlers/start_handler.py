@@ -1,7 +1,10 @@
 from telegram import Update
-from telegram.ext import ContextTypes, CommandHandler
+from telegram.ext import ContextTypes
 
+from utils.metrics import instrument
 
+
+@instrument('start', metric='handler_seconds')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /start command with a welcome message."""
     welcome_message = (
@@ -17,6 +20,3 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'Just ask me anything to get started!'
     )
     await update.message.reply_text(welcome_message)
-
-
-start_handler = CommandHandler('start', start)
\ No newline at end of file
@@ -0,0 +1,22 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from constants import POWER_USERS
+from handlers.message_handler import send_in_chunks
+from utils.loop_monitor import get_loop_monitor
+from utils.metrics import instrument
+
+
+@instrument('stats', metric='handler_seconds')
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the /stats command: show event loop lag and what blocked it."""
+    user_id = str(update.message.from_user.id)
+    if user_id not in POWER_USERS.split(','):
+        await update.message.reply_text('Permission denied.')
+        return
+
+    monitor = get_loop_monitor()
+    if monitor is None:
+        await update.message.reply_text('The event loop monitor is not running.')
+        return
+    await send_in_chunks(update.message.reply_text, monitor.report())
@@ -0,0 +1,39 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from constants import POWER_USERS
+from handlers.message_handler import send_in_chunks
+from handlers.research_handler import find_task_state
+from utils.metrics import instrument
+from utils.research_budget import format_budget
+from utils.research_trace import format_trace
+
+
+@instrument('trace', metric='handler_seconds')
+async def trace(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the /trace command: show where a research task spent its time."""
+    user_id = str(update.message.from_user.id)
+    if user_id not in POWER_USERS.split(','):
+        await update.message.reply_text('Permission denied.')
+        return
+
+    research_id = context.args[0] if context.args else ''
+    task_state = await asyncio.to_thread(find_task_state, research_id)
+    if task_state is None:
+        await update.message.reply_text('No research task found.')
+        return
+    if not task_state.get('trace'):
+        await update.message.reply_text(
+            f'Research task {task_state["research_id"][:8]} has no timing data.'
+        )
+        return
+    text = format_trace(task_state['trace'])
+    if task_state.get('budget'):
+        text += f'\n\n{format_budget(task_state["budget"])}'
+    await send_in_chunks(
+        update.message.reply_text,
+        f'Research task {task_state["research_id"][:8]}: '
+        f'{task_state["initial_user_query"]} ({task_state["status"]})\n\n{text}'
+    )
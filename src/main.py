@@ -1,38 +1,138 @@
+import asyncio
 import logging
-import os
 import sys
 
-from telegram.ext import Application
+from telegram.ext import Application, CommandHandler, MessageHandler, filters
 
-from constants import TELEGRAM_BOT_TOKEN, CHAT_DIR
-from handlers.message_handler import message_handler
-from handlers.start_handler import start_handler
-from handlers.delete_handler import delete_handler
-from handlers.model_handler import model_handler
-from handlers.error_handler import error_handler
-from handlers.research_handler import research_handler
-from utils.logging_confg import configure_logging
+from constants import (
+    TELEGRAM_BOT_TOKEN, MAX_CONCURRENT_UPDATES, RUN_MODE, TELEGRAM_API_URL,
+    TELEGRAM_FILE_URL, METRICS_HOST, METRICS_PORT, WARM_UP, WORKER_LISTEN,
+    WORKER_PORT, ensure_dirs,
+)
+from utils.chat_store import close_chat_store
+from utils.lazy_callback import LazyCallback
+from utils.logging_confg import configure_logging, stop_logging
+from utils.loop_monitor import start_loop_monitor, stop_loop_monitor
+from utils.metrics import registry, start_metrics_server
+from utils.update_processor import PerUserUpdateProcessor
+from utils.warmup import warm_up
 
 
+# Handler modules are imported by the warm-up, not at startup
 HANDLERS = [
-    start_handler,
-    delete_handler,
-    model_handler,
-    message_handler,
-    research_handler,
+    CommandHandler('start', LazyCallback('handlers.start_handler:start')),
+    CommandHandler('delete', LazyCallback('handlers.delete_handler:delete')),
+    CommandHandler('model', LazyCallback('handlers.model_handler:model')),
+    MessageHandler(
+        filters.TEXT & ~filters.COMMAND,
+        LazyCallback('handlers.message_handler:handle_message'),
+    ),
+    CommandHandler('research', LazyCallback('handlers.research_handler:research')),
+    CommandHandler('trace', LazyCallback('handlers.trace_handler:trace')),
+    CommandHandler('stats', LazyCallback('handlers.stats_handler:stats')),
+    CommandHandler('profile', LazyCallback('handlers.profile_handler:profile')),
 ]
+ERROR_HANDLER = LazyCallback('handlers.error_handler:error_handler')
+
+
+async def post_init(app):
+    """Watch the event loop, serve metrics if METRICS_PORT is set and warm up."""
+    start_loop_monitor()
+    if METRICS_PORT:
+        app.bot_data['metrics_runner'] = await start_metrics_server(
+            METRICS_HOST, METRICS_PORT
+        )
+    if WARM_UP:
+        app.bot_data['warm_up'] = asyncio.create_task(warm_up(app))
+
+
+async def post_shutdown(app):
+    warm_up_task = app.bot_data.pop('warm_up', None)
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    stop_loop_monitor()
+    runner = app.bot_data.pop('metrics_runner', None)
+    if runner is not None:
+        await runner.cleanup()
+
+
+def shutdown_report_workers():
+    """Stop the report worker processes, if any report was rendered."""
+    pdf_utils = sys.modules.get('utils.pdf_utils')
+    if pdf_utils is not None:
+        pdf_utils.shutdown_report_executor()
+
+
+def lazy_gauge(module, name):
+    """Return a gauge callback calling module.name, or 0 until it is imported."""
+
+    def read():
+        loaded = sys.modules.get(module)
+        return getattr(loaded, name)() if loaded else 0
+
+    return read
+
+
+def register_queue_metrics(app, processor):
+    """Report the depth of the update queues of app."""
+    registry.gauge('update_queue_size', app.update_queue.qsize,
+                   'Updates received but not dispatched yet.')
+    registry.gauge('users_in_progress', lambda: processor.queue_depths()[0],
+                   'Users with an update being processed.')
+    registry.gauge('user_updates_queued', lambda: processor.queue_depths()[1],
+                   'Updates waiting behind the same user\'s running update.')
+    # Their modules are imported by the warm-up, so look them up when read
+    registry.gauge('pdf_renders_pending', lazy_gauge('utils.pdf_utils', 'pending_renders'),
+                   'PDF reports queued or rendering.')
+    registry.gauge('llm_requests_in_flight',
+                   lazy_gauge('utils.ollama_utils', 'llm_requests_in_flight'),
+                   'Ollama requests sent and not answered yet.')
+
+
+def build_application(with_updater=True, request=None):
+    """Build the bot Application with all handlers registered.
+
+    request replaces the Bot API transport, e.g. with a stub under load tests.
+    """
+    processor = PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES)
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .base_file_url(TELEGRAM_FILE_URL)
+        .concurrent_updates(processor)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if not with_updater:
+        builder = builder.updater(None)
+    if request is not None:
+        builder = builder.request(request)
+    app = builder.build()
+    app.add_handlers(HANDLERS)
+    app.add_error_handler(ERROR_HANDLER)
+    register_queue_metrics(app, processor)
+    return app
 
 
 def main():
     """Initialize and run the Telegram bot application."""
     try:
         configure_logging()
-        logging.info('Starting the Telegram bot application')
-        # if not os.path.exists(CHAT_DIR):
-        #     os.makedirs(CHAT_DIR)
-        app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-        app.add_handlers(HANDLERS)
-        app.add_error_handler(error_handler)
+        logging.info(f'Starting the Telegram bot application ({RUN_MODE})')
+        ensure_dirs()
+        if RUN_MODE == 'webhook':
+            from utils.webhook import run_webhook
+            print('WEBsearch Buddy is ready (webhook)...')
+            run_webhook(build_application)
+            return 0
+        if RUN_MODE == 'worker':
+            from utils.webhook import serve_worker
+            print(f'WEBsearch Buddy is ready (worker on port {WORKER_PORT})...')
+            asyncio.run(serve_worker(build_application, WORKER_PORT, WORKER_LISTEN))
+            return 0
+
+        app = build_application()
         print('WEBsearch Buddy is ready...')
 
         app.run_polling()
@@ -40,6 +140,10 @@ def main():
     except Exception as e:
         logging.error(f'Failed to start bot: {e}', exc_info=True)
         return 1  # Failure
+    finally:
+        close_chat_store()
+        shutdown_report_workers()
+        stop_logging()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,18 @@
+"""Run the tests against a throwaway DATA_DIR, set before constants is imported."""
+import os
+import shutil
+import sys
+import tempfile
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp(prefix='websearchbuddy-test-')
+sys.path.insert(0, SRC_DIR)
+os.environ['DATA_DIR'] = DATA_DIR
+
+import constants  # noqa: E402
+
+constants.ensure_dirs()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
@@ -0,0 +1,144 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from telegram import Chat, Message, Update, User
+
+import utils.admission
+from utils.admission import (
+    ADMIT, COALESCE, RATE_LIMITED, SHED, AdmissionController, TokenBucket
+)
+from utils.update_processor import PerUserUpdateProcessor
+
+
+class Clock:
+    """Stands in for time.monotonic, advanced by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(utils.admission.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def in_flight(monkeypatch):
+    """Set how many Ollama requests the controller sees in flight."""
+    requests = [0]
+    monkeypatch.setattr(utils.admission, 'llm_requests_in_flight', lambda: requests[0])
+    return requests
+
+
+def new_controller():
+    return AdmissionController(user_rate=1.0, user_burst=2, global_rate=10.0,
+                               global_burst=10, shed_depth=10)
+
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2.0, burst=2)
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.wait_time() == 0
+    clock.now += 10
+    assert bucket.full()
+    assert bucket.tokens == 2
+
+
+def test_user_burst_then_rate_limited(clock, in_flight):
+    controller = new_controller()
+    assert controller.admit(1) == (ADMIT, 0)
+    assert controller.admit(1) == (ADMIT, 0)
+    assert controller.admit(1) == (RATE_LIMITED, 1)
+    assert controller.admit(2) == (ADMIT, 0)
+    clock.now += 1
+    assert controller.admit(1) == (ADMIT, 0)
+
+
+def test_shed_when_ollama_is_overloaded(clock, in_flight):
+    controller = new_controller()
+    controller.observe(20.0)
+    in_flight[0] = 14
+    decision, retry_after = controller.admit(1)
+    assert decision == SHED
+    assert retry_after == 10  # 5 requests over, 10 drain per 20 s
+
+
+def test_coalesce_only_with_newer_text_and_busy_ollama(clock, in_flight):
+    controller = new_controller()
+    assert controller.admit(1, pending=1)[0] == ADMIT
+    in_flight[0] = utils.admission.LLM_QUEUE_SATURATION
+    assert controller.admit(1, pending=0)[0] == ADMIT
+    assert controller.admit(1, pending=1)[0] == COALESCE
+
+
+def test_rejected_follow_up_reports_coalesced_messages(clock, in_flight):
+    controller = new_controller()
+    in_flight[0] = utils.admission.LLM_QUEUE_SATURATION
+    controller.admit(1, pending=2)
+    controller.admit(1, pending=1)
+    in_flight[0] = 20
+    assert controller.admit(1)[0] == SHED
+    assert controller.pop_coalesced(1) == 2
+    assert controller.pop_coalesced(1) == 0
+
+
+def test_admitted_follow_up_answers_coalesced_messages(clock, in_flight):
+    controller = new_controller()
+    in_flight[0] = utils.admission.LLM_QUEUE_SATURATION
+    controller.admit(1, pending=1)
+    assert controller.admit(1)[0] == ADMIT
+    assert controller.pop_coalesced(1) == 0
+
+
+def test_notify_once_per_retry_window(clock):
+    controller = new_controller()
+    assert controller.should_notify(1, 5)
+    assert not controller.should_notify(1, 5)
+    assert controller.should_notify(2, 5)
+    clock.now += 5
+    assert controller.should_notify(1, 5)
+
+
+def make_update(update_id, text, user_id=1):
+    user = User(user_id, 'user', False)
+    message = Message(update_id, datetime.now(), Chat(user_id, Chat.PRIVATE),
+                      from_user=user, text=text)
+    return Update(update_id, message=message)
+
+
+def test_processor_counts_pending_text_messages_only():
+    async def run():
+        processor = PerUserUpdateProcessor(4)
+        release = asyncio.Event()
+        done = []
+
+        async def handle(update_id):
+            if update_id == 1:
+                await release.wait()
+            done.append(update_id)
+
+        updates = [make_update(1, 'first'), make_update(2, '/status'),
+                   make_update(3, 'second')]
+        tasks = [
+            asyncio.create_task(processor.do_process_update(update, handle(update.update_id)))
+            for update in updates
+        ]
+        await asyncio.sleep(0)
+        counts = processor.pending_count(1), processor.pending_text_count(1)
+        release.set()
+        await asyncio.gather(*tasks)
+        return counts, done, processor.queue_depths()
+
+    counts, done, depths = asyncio.run(run())
+    assert counts == (2, 1)
+    assert done == [1, 2, 3]
+    assert depths == (0, 0)
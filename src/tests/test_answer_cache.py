@@ -0,0 +1,74 @@
+import math
+
+from utils.answer_cache import AnswerCache, is_time_sensitive
+
+
+def unit(angle):
+    """Return a 2-d unit vector; the cosine of two is that of their angle."""
+    return [math.cos(angle), math.sin(angle)]
+
+
+def test_hit_at_or_above_threshold_only():
+    cache = AnswerCache(threshold=0.9)
+    cache.store('what is rust', unit(0), 'a language', cost=2.0)
+    assert cache.lookup(unit(math.acos(0.95))) == 'a language'
+    assert cache.lookup(unit(math.acos(0.85))) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['latency_saved_seconds'] == 2.0
+
+
+def test_closest_answer_wins():
+    cache = AnswerCache(threshold=0.5)
+    cache.store('near', unit(0.1), 'near', cost=1.0)
+    cache.store('far', unit(0.5), 'far', cost=1.0)
+    assert cache.lookup(unit(0)) == 'near'
+
+
+def test_only_recent_candidates_are_compared():
+    cache = AnswerCache(threshold=0.99, candidates=2)
+    cache.store('old', unit(0), 'old', cost=1.0)
+    cache.store('other', unit(1), 'other', cost=1.0)
+    cache.store('another', unit(2), 'another', cost=1.0)
+    assert cache.lookup(unit(0)) is None
+    cache.store('old', unit(0), 'old again', cost=1.0)
+    assert cache.lookup(unit(0)) == 'old again'
+
+
+def test_least_recently_used_is_evicted():
+    cache = AnswerCache(max_entries=2, threshold=0.99)
+    cache.store('a', unit(0), 'a', cost=1.0)
+    cache.store('b', unit(1), 'b', cost=1.0)
+    assert cache.lookup(unit(0)) == 'a'
+    cache.store('c', unit(2), 'c', cost=1.0)
+    assert cache.lookup(unit(1)) is None
+    assert cache.lookup(unit(0)) == 'a'
+
+
+def test_expired_answers_miss():
+    cache = AnswerCache(threshold=0.99, ttl=-1)
+    cache.store('stale', unit(0), 'stale', cost=1.0)
+    assert cache.lookup(unit(0)) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_time_sensitive_questions():
+    assert is_time_sensitive('What is the weather today?')
+    assert is_time_sensitive('Best laptops of 2025')
+    assert not is_time_sensitive('How does TCP work?')
+
+
+def test_answers_are_shared_through_the_database(tmp_path):
+    db_path = str(tmp_path / 'answers.db')
+    writer = AnswerCache(threshold=0.99, db_path=db_path)
+    reader = AnswerCache(threshold=0.99, db_path=db_path)
+    writer.store('shared', unit(0), 'shared', cost=1.0)
+    assert reader.lookup(unit(0)) == 'shared'
+
+
+def test_disable_is_logged_once(caplog):
+    cache = AnswerCache()
+    cache.disable('model not found')
+    cache.disable('model not found')
+    assert not cache.enabled
+    assert len(caplog.records) == 1
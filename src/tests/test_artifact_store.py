@@ -0,0 +1,105 @@
+import json
+import os
+import time
+
+import pytest
+
+import utils.research_index
+from utils.artifact_store import ArtifactStore, read_compressed, report_kind
+from utils.research_index import ResearchIndex
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ArtifactStore(db_path=str(tmp_path / 'artifacts.db'))
+    yield store
+    store.close()
+
+
+def write_file(path, size=10):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return str(path)
+
+
+def archive(store, tmp_path, research_id, user_id=1, created_at=None):
+    json_path = tmp_path / 'research_task.json'
+    state = {'research_id': research_id, 'user_id': user_id, 'status': 'complete',
+             'initial_user_query': 'solar panel recycling methods', 'plan': '',
+             'final_summary': 'solar panel recycling recovers silver',
+             'iterations': []}
+    json_path.write_text(json.dumps(state))
+    return store.archive_task(str(json_path), created_at)
+
+
+def test_reserve_path_counts_up(store, tmp_path):
+    directory = str(tmp_path)
+    first = store.reserve_path('topic', directory, '.pdf')
+    assert first == os.path.join(directory, 'research_topic.pdf')
+    assert store.reserve_path('topic', directory, '.pdf').endswith('research_topic_001.pdf')
+    assert store.reserve_path('topic', directory, '.txt').endswith('research_topic.txt')
+
+
+def test_reserve_path_skips_files_from_before_the_index(store, tmp_path):
+    write_file(tmp_path / 'research_old.pdf')
+    assert store.reserve_path('old', str(tmp_path), '.pdf').endswith('research_old_001.pdf')
+
+
+def test_archived_task_is_found_by_prefix_and_user(store, tmp_path):
+    path = archive(store, tmp_path, 'abc123', user_id=7)
+    assert not os.path.exists(tmp_path / 'research_task.json')
+    assert json.loads(read_compressed(path))['research_id'] == 'abc123'
+    assert store.find_task('abc', 7)['research_id'] == 'abc123'
+    assert store.find_task('abc', 8) is None
+    assert store.find_task('xyz') is None
+
+
+def test_find_task_skips_unreadable_archives(store, tmp_path):
+    archive(store, tmp_path, 'good1', created_at=time.time() - 10)
+    broken = archive(store, tmp_path, 'good2')
+    write_file(broken)
+    assert store.find_task('good')['research_id'] == 'good1'
+
+
+def test_prune_by_age_and_size(store, tmp_path):
+    now = time.time()
+    old = write_file(tmp_path / 'research_old.log')
+    store.add(old, 'log', 'r1', created_at=now - 400 * 86400)
+    for i in range(3):
+        path = write_file(tmp_path / f'research_{i}.pdf', size=100)
+        store.add(path, 'pdf', f'r{i + 2}', created_at=now - 10 + i)
+    deleted = store.prune(max_bytes=250, max_days=365)
+    assert sorted(deleted) == sorted([
+        (old, 'log', 'r1'), (str(tmp_path / 'research_0.pdf'), 'pdf', 'r2')
+    ])
+    assert not os.path.exists(old)
+    assert store.artifacts('r2') == []
+    assert store.artifacts('r3') != []
+    assert store.prune(max_bytes=0, max_days=0) == []
+
+
+def test_report_kind():
+    assert report_kind('/a/research_x_001.pdf') == 'pdf'
+    assert report_kind('/a/research_x.log.gz') == 'log'
+
+
+def test_pruned_task_leaves_the_research_index(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.research_index, 'get_artifact_store', lambda: store)
+    monkeypatch.setattr(utils.research_index, 'RESEARCH_TXT_DIR', str(tmp_path / 'txt'))
+    index = ResearchIndex(db_path=str(tmp_path / 'index.db'))
+    try:
+        archive(store, tmp_path, 'pruned', created_at=time.time() - 10)
+        archive(store, tmp_path, 'kept')
+        assert index.sync() == 2
+        assert {hit['research_id'] for hit in index.lookup('solar panel recycling')} == {
+            'pruned', 'kept'
+        }
+        _, _, kept_size = store.artifacts('kept')[0]
+        index.forget(store.prune(max_bytes=kept_size, max_days=0))
+        assert [hit['research_id'] for hit in index.lookup('solar panel recycling')] == ['kept']
+        # Pruned while the index was closed
+        store.prune(max_bytes=1, max_days=0)
+        index.sync()
+        assert index.lookup('solar panel recycling') == []
+    finally:
+        index.close()
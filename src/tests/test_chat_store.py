@@ -0,0 +1,88 @@
+import json
+import sqlite3
+
+import pytest
+
+from utils.chat_store import ChatStore, legacy_chat_file
+
+
+class FailingConnection:
+    """Stands in for the write connection of a ChatStore whose disk is full."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def executemany(self, sql, params):
+        raise sqlite3.OperationalError('database or disk is full')
+
+
+@pytest.fixture
+def store(tmp_path):
+    # No background flushes; the tests flush when they need to
+    store = ChatStore(db_path=str(tmp_path / 'chats.db'), max_history=3,
+                      cache_size=1, flush_interval=3600, flush_batch=1000)
+    yield store
+    store.close()
+
+
+def test_history_is_kept_to_max_history(store):
+    for i in range(5):
+        store.append(1, f'user: {i}')
+    assert store.get_history(1) == ['user: 2', 'user: 3', 'user: 4']
+
+
+def test_evicted_user_is_reloaded_from_pending_and_disk(store):
+    store.append(1, 'user: first')
+    store.append(2, 'user: other')  # Evicts user 1 before any flush
+    assert store.get_history(1) == ['user: first']
+    assert store.flush() == 2
+    store.append(2, 'user: again')
+    assert store.get_history(1) == ['user: first']
+
+
+def test_flush_trims_old_rows(store):
+    for i in range(5):
+        store.append(1, f'user: {i}')
+    store.flush()
+    count, = store._conn.execute('SELECT COUNT(*) FROM messages').fetchone()
+    assert count == 3
+
+
+def test_failed_flush_keeps_messages_for_the_next_one(store):
+    store.append(1, 'user: kept')
+    conn, store._conn = store._conn, FailingConnection()
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+    store._conn = conn
+    store.append(1, 'user: later')
+    assert store.pending_writes() == 2
+    assert store.flush() == 2
+    store.append(2, 'user: other')
+    assert store.get_history(1) == ['user: kept', 'user: later']
+
+
+def test_delete_removes_pending_and_stored_messages(store):
+    store.append(1, 'user: stored')
+    store.flush()
+    store.append(1, 'user: pending')
+    assert store.delete(1)
+    assert store.pending_writes() == 0
+    assert store.get_history(1) == []
+    assert not store.delete(1)
+
+
+def test_delete_removes_a_legacy_history_not_imported_yet(store):
+    with open(legacy_chat_file(7), 'w') as f:
+        json.dump(['user: secret', 'agent: ok'], f)
+    assert store.delete(7)
+    assert store.get_history(7) == []
+
+
+def test_legacy_history_is_imported_on_first_use(store):
+    with open(legacy_chat_file(8), 'w') as f:
+        json.dump(['user: old', 'agent: reply'], f)
+    assert store.get_history(8) == ['user: old', 'agent: reply']
+    assert store.pending_writes() == 2
@@ -0,0 +1,66 @@
+import pytest
+
+import utils.research_budget
+from constants import LLM_QUEUE_SATURATION, RESEARCH_BUDGET_RESERVE
+from utils.research_budget import ResearchBudget, format_budget
+from utils.research_trace import new_span
+
+
+@pytest.fixture
+def in_flight(monkeypatch):
+    """Set how many Ollama requests the budget sees in flight."""
+    requests = [0]
+    monkeypatch.setattr(utils.research_budget, 'llm_requests_in_flight',
+                        lambda: requests[0])
+    return requests
+
+
+def new_task(seconds=1000, tokens=100000):
+    task_state = {'trace': new_span('research'), 'iterations': []}
+    return task_state, ResearchBudget(task_state, seconds, tokens)
+
+
+def test_fresh_task_gets_full_fan_out(in_flight):
+    _, budget = new_task()
+    assert budget.plan_iteration() == {
+        'scale': 1.0, 'queries': 5, 'urls_per_query': 3,
+        'excerpt_length': 20000, 'llm_in_flight': 0,
+    }
+
+
+def test_saturated_ollama_halves_the_scale(in_flight):
+    _, budget = new_task()
+    in_flight[0] = LLM_QUEUE_SATURATION * 2
+    assert budget.scale() == pytest.approx(0.5)
+
+
+def test_scale_spreads_what_is_left_over_remaining_iterations(in_flight):
+    # 5 iterations left at 100 s each, but only a quarter of that usable
+    seconds = 125 / (1 - RESEARCH_BUDGET_RESERVE)
+    task_state, budget = new_task(seconds=seconds)
+    task_state['budget']['ledger'].append({'stage': 'iteration 1', 'seconds': 50.0,
+                                           'tokens': 0, 'scale': 0.5})
+    assert budget.scale() == pytest.approx(0.25, rel=0.01)
+
+
+def test_fan_out_gets_cube_root_of_the_scale(in_flight, monkeypatch):
+    _, budget = new_task()
+    monkeypatch.setattr(budget, 'scale', lambda: 0.125)
+    plan = budget.plan_iteration()
+    assert (plan['queries'], plan['urls_per_query'], plan['excerpt_length']) == (2, 2, 10000)
+
+
+def test_spent_budget_concludes_early(in_flight):
+    task_state, budget = new_task(tokens=1000)
+    task_state['trace']['completion_tokens'] = 900
+    assert budget.plan_iteration() is None
+    assert 'scale 0.00' in task_state['budget']['concluded_early']
+    assert 'Concluded early' in format_budget(task_state['budget'])
+
+
+def test_record_charges_what_was_spent_since_the_last_record(in_flight):
+    task_state, budget = new_task()
+    task_state['trace']['prompt_tokens'] = 300
+    assert budget.record('iteration 1', {'scale': 1.0})['tokens'] == 300
+    task_state['trace']['prompt_tokens'] = 500
+    assert budget.record('conclusion')['tokens'] == 200
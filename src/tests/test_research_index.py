@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+import utils.research_index
+from constants import SUMMARY_LENGTH
+from utils.research_index import REPORT_END, ResearchIndex, excerpt, format_findings
+
+
+class NoArchives:
+    """Stands in for the artifact store when only TXT reports matter."""
+
+    def task_paths(self):
+        return []
+
+
+@pytest.fixture
+def txt_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'txt'
+    directory.mkdir()
+    monkeypatch.setattr(utils.research_index, 'RESEARCH_TXT_DIR', str(directory))
+    monkeypatch.setattr(utils.research_index, 'get_artifact_store', NoArchives)
+    return directory
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ResearchIndex(db_path=str(tmp_path / 'index.db'))
+    yield index
+    index.close()
+
+
+def new_task(research_id, query, summary, pages=()):
+    return {
+        'research_id': research_id, 'initial_user_query': query, 'plan': '',
+        'final_summary': summary,
+        'iterations': [{
+            'summary': '',
+            'queries': [
+                {'query': query, 'title': title, 'url': url, 'summary': text}
+                for title, url, text in pages
+            ],
+        }],
+    }
+
+
+def write_report(directory, name, topic, body, complete=True):
+    path = directory / name
+    text = f'Initial Query: {topic}\n\n{body}\n'
+    if complete:
+        text += f'{REPORT_END}1. https://example.com\n'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_score_needs_topic_and_findings(index):
+    index.index_task(new_task('t1', 'heat pump efficiency', 'heat pumps reach efficiency 300%'))
+    index.index_task(new_task('t2', 'garden tools', 'heat is bad for pump seals'))
+    hits = index.lookup('heat pump efficiency', min_score=0.75)
+    assert [hit['research_id'] for hit in hits] == ['t1']
+    assert hits[0]['score'] == pytest.approx(5 / 6)
+    assert index.lookup('pump') == []  # One term says too little
+
+
+def test_pages_come_before_whole_reports(index, txt_dir):
+    write_report(txt_dir, 'research_pumps.txt', 'heat pump efficiency',
+                 'heat pump efficiency ' * 10)
+    index.sync()
+    index.index_task(new_task('t1', 'heat pump efficiency', '', pages=[
+        ('Heat pumps', 'https://example.com/hp', 'heat pump efficiency is 3'),
+    ]))
+    kinds = [hit['kind'] for hit in index.lookup('heat pump efficiency', min_score=0.5)]
+    assert kinds.index('page') < kinds.index('report')
+
+
+def test_snippet_is_capped_around_the_terms(index, txt_dir):
+    body = 'filler text ' * 2000 + 'heat pump efficiency ' * 5 + 'filler text ' * 2000
+    write_report(txt_dir, 'research_long.txt', 'heat pump efficiency', body)
+    index.sync()
+    hit, = index.lookup('heat pump efficiency', min_score=0.5)
+    assert len(hit['snippet']) <= SUMMARY_LENGTH + 6
+    assert 'heat pump efficiency' in hit['snippet']
+    assert len(format_findings([hit])) < 2 * SUMMARY_LENGTH
+
+
+def test_excerpt_keeps_short_text_whole():
+    assert excerpt('short text', {'short'}) == 'short text'
+    assert excerpt('a' * 50 + ' pump', {'pump'}, length=10).startswith('...')
+
+
+def test_sync_skips_partial_reports_and_reindexes_changed_ones(index, txt_dir):
+    path = write_report(txt_dir, 'research_pumps.txt', 'heat pump efficiency',
+                        'heat pump efficiency notes', complete=False)
+    assert index.sync() == 1
+    assert index.lookup('heat pump efficiency', min_score=0.5) == []
+    assert index.sync() == 0  # Unchanged files are not read again
+    write_report(txt_dir, 'research_pumps.txt', 'heat pump efficiency',
+                 'heat pump efficiency notes')
+    os.utime(path, (0, os.path.getmtime(path) + 1))
+    assert index.sync() == 1
+    assert len(index.lookup('heat pump efficiency', min_score=0.5)) == 1
+    os.utime(path, (0, os.path.getmtime(path) + 1))
+    index.sync()
+    assert len(index.lookup('heat pump efficiency', min_score=0.5)) == 1
+
+
+def test_forget_drops_task_and_report_docs(index, txt_dir):
+    path = write_report(txt_dir, 'research_pumps.txt', 'heat pump efficiency',
+                        'heat pump efficiency notes')
+    index.sync()
+    index.index_task(new_task('t1', 'heat pump efficiency', 'heat pump efficiency is 3'))
+    index.forget([(path, 'txt', None), ('/archive/t1.json.gz', 'task', 't1')])
+    assert index.lookup('heat pump efficiency', min_score=0.5) == []
+    # A forgotten task can be indexed again
+    index.index_task(new_task('t1', 'heat pump efficiency', 'heat pump efficiency is 3'))
+    assert len(index.lookup('heat pump efficiency', min_score=0.5)) == 1
@@ -0,0 +1,173 @@
+"""Admission control in front of the LLM pipeline.
+
+Every chat message costs up to three Ollama requests and a web search, so
+before handle_message starts one it asks the controller:
+
+- A user with a newer text message waiting while Ollama is busy (at
+  least LLM_QUEUE_SATURATION requests in flight) has this one coalesced:
+  it only joins the conversation, and the latest message is answered
+  with it as context. Commands do not count; they answer nothing.
+- Token buckets cap the messages of each user and of all users together.
+- With too many Ollama requests in flight, the message is shed.
+
+Rejected users get a quick "busy, retry in N s" reply, at most once per
+retry window, instead of an answer that times out. If the message that
+was to answer coalesced ones is rejected, the reply always goes out and
+says those were dropped too.
+"""
+import math
+import time
+from collections import OrderedDict
+
+from constants import (
+    ADMISSION_GLOBAL_BURST,
+    ADMISSION_GLOBAL_RATE,
+    ADMISSION_MAX_USERS,
+    ADMISSION_SHED_DEPTH,
+    ADMISSION_USER_BURST,
+    ADMISSION_USER_RATE,
+    LLM_QUEUE_SATURATION,
+)
+from utils.metrics import registry
+from utils.ollama_utils import llm_requests_in_flight
+
+ADMIT = 'admit'
+COALESCE = 'coalesce'
+RATE_LIMITED = 'rate_limited'
+SHED = 'shed'
+
+registry.describe('admission_decisions_total', 'counter',
+                  'Chat messages by admission decision.')
+
+
+class TokenBucket:
+    """Allow rate events per second on average and burst at once."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Return seconds until a token is available, 0 if one is now."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def full(self):
+        self._refill()
+        return self.tokens >= self.burst
+
+
+class AdmissionController:
+    """Decide which chat messages may start the LLM pipeline.
+
+    Runs on the event loop only, so it needs no locking.
+    """
+
+    def __init__(self, user_rate=ADMISSION_USER_RATE, user_burst=ADMISSION_USER_BURST,
+                 global_rate=ADMISSION_GLOBAL_RATE, global_burst=ADMISSION_GLOBAL_BURST,
+                 shed_depth=ADMISSION_SHED_DEPTH):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.shed_depth = shed_depth
+        self._users = OrderedDict()  # user_id -> TokenBucket, least recent first
+        self._busy_until = {}  # user_id -> monotonic time of the retry we told
+        self._coalesced = {}  # user_id -> messages waiting for a later answer
+        self._message_seconds = None  # Moving average of admitted messages
+
+    def _user_bucket(self, user_id):
+        bucket = self._users.pop(user_id, None)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            # A full bucket is what a new user gets anyway, so forgetting
+            # the least recent one only loses state if it was draining
+            if len(self._users) >= ADMISSION_MAX_USERS:
+                oldest = next(iter(self._users))
+                if self._users[oldest].full():
+                    del self._users[oldest]
+        self._users[user_id] = bucket
+        return bucket
+
+    def shed_retry_after(self, in_flight):
+        """Estimate seconds until the Ollama requests over shed_depth drain."""
+        per_message = self._message_seconds or 1.0
+        return per_message * (in_flight - self.shed_depth + 1) / self.shed_depth
+
+    def admit(self, user_id, pending=0):
+        """Return (decision, retry_after seconds) for a message of user_id.
+
+        pending is how many newer text messages of the user wait behind
+        this one.
+        """
+        in_flight = llm_requests_in_flight()
+        if pending and in_flight >= LLM_QUEUE_SATURATION:
+            self._coalesced[user_id] = self._coalesced.get(user_id, 0) + 1
+            return self._decide(COALESCE)
+        user_bucket = self._user_bucket(user_id)
+        wait = max(user_bucket.wait_time(), self.global_bucket.wait_time())
+        if wait:
+            return self._decide(RATE_LIMITED, wait)
+        if in_flight >= self.shed_depth:
+            return self._decide(SHED, self.shed_retry_after(in_flight))
+        user_bucket.take()
+        self.global_bucket.take()
+        self._coalesced.pop(user_id, None)  # Answered along with this one
+        return self._decide(ADMIT)
+
+    def _decide(self, decision, retry_after=0.0):
+        registry.inc('admission_decisions_total', decision=decision)
+        return decision, math.ceil(retry_after)
+
+    def pop_coalesced(self, user_id):
+        """Return and forget how many coalesced messages of user_id are unanswered."""
+        return self._coalesced.pop(user_id, 0)
+
+    def should_notify(self, user_id, retry_after):
+        """Return True unless user_id was already told to retry later."""
+        now = time.monotonic()
+        if self._busy_until.get(user_id, 0) > now:
+            return False
+        self._busy_until[user_id] = now + retry_after
+        if len(self._busy_until) > ADMISSION_MAX_USERS:
+            self._busy_until = {
+                user: until for user, until in self._busy_until.items() if until > now
+            }
+        return True
+
+    def observe(self, seconds):
+        """Record how long an admitted message took, for retry estimates."""
+        if self._message_seconds is None:
+            self._message_seconds = seconds
+        else:
+            self._message_seconds += 0.1 * (seconds - self._message_seconds)
+
+
+_controller = None
+
+
+def get_admission_controller():
+    """Return the process-wide AdmissionController, creating it on first use."""
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
+
+
+def pending_text_messages(context, user_id):
+    """Return how many text messages of user_id wait behind the one being handled."""
+    processor = context.application.update_processor
+    pending_text_count = getattr(processor, 'pending_text_count', None)
+    return pending_text_count(user_id) if pending_text_count else 0
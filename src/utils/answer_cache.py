@@ -0,0 +1,200 @@
+import itertools
+import json
+import logging
+import math
+import operator
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from constants import (
+    ANSWER_CACHE_CANDIDATES,
+    ANSWER_CACHE_DB,
+    ANSWER_CACHE_FRESH_TTL,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+)
+from utils.metrics import registry
+
+
+# Questions about current events must not be answered from a stale cache
+FRESHNESS_PATTERN = re.compile(
+    r'\b(today|tonight|now|current|currently|latest|recent|news|this week|'
+    r'yesterday|tomorrow|price|weather|score|сейчас|недавно|сегодня|'
+    r'вчера|завтра|новости|последн\w*|текущ\w*|курс|погода)\b|\b20\d\d\b',
+    re.IGNORECASE,
+)
+
+
+def is_time_sensitive(text):
+    """Return True if text asks about current events."""
+    return bool(FRESHNESS_PATTERN.search(text))
+
+
+def normalize(vector):
+    """Scale vector to unit length so a dot product is cosine similarity."""
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS answers ('
+    ' id INTEGER PRIMARY KEY,'
+    ' vector TEXT NOT NULL,'
+    ' answer TEXT NOT NULL,'
+    ' expires REAL NOT NULL,'
+    ' cost REAL NOT NULL'
+    ')'
+)
+
+
+class AnswerCache:
+    """Bounded LRU cache of answers keyed by question embeddings.
+
+    A lookup compares the question with the `candidates` most recently used
+    answers only, so its cost does not grow with max_entries. With a
+    db_path, answers are also written to a SQLite table that every process
+    sharing the file picks up on its next lookup.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE,
+                 threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL,
+                 fresh_ttl=ANSWER_CACHE_FRESH_TTL, db_path=None,
+                 candidates=ANSWER_CACHE_CANDIDATES):
+        self.max_entries = max_entries
+        self.candidates = candidates
+        self.enabled = True
+        self.threshold = threshold
+        self.ttl = ttl
+        self.fresh_ttl = fresh_ttl
+        self._entries = OrderedDict()  # key -> (vector, answer, expires, cost)
+        self._lock = threading.Lock()
+        self._next_key = 0
+        self._conn = None
+        self._synced_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(SCHEMA)
+            self._conn.commit()
+            row = self._conn.execute('SELECT MAX(id) FROM answers').fetchone()
+            self._synced_id = max((row[0] or 0) - max_entries, 0)
+
+    def _sync(self):
+        """Load answers other processes stored since the last sync."""
+        rows = self._conn.execute(
+            'SELECT id, vector, answer, expires, cost FROM answers '
+            'WHERE id > ? AND expires > ? ORDER BY id',
+            (self._synced_id, time.time()),
+        ).fetchall()
+        for key, vector, answer, expires, cost in rows:
+            self._entries[key] = (tuple(json.loads(vector)), answer, expires, cost)
+            self._synced_id = key
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def lookup(self, vector):
+        """Return the cached answer closest to vector, or None on a miss."""
+        vector = normalize(vector)
+        now = time.time()
+        best_key, best_similarity = None, self.threshold
+        with self._lock:
+            if self._conn is not None:
+                self._sync()
+            candidates = list(itertools.islice(
+                reversed(self._entries.items()), self.candidates
+            ))
+        # Compared outside the lock; entries are immutable tuples
+        expired = []
+        for key, (cached, _, expires, _) in candidates:
+            if expires < now:
+                expired.append(key)
+                continue
+            similarity = sum(map(operator.mul, vector, cached))
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        with self._lock:
+            for key in expired:
+                self._entries.pop(key, None)
+            if best_key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            _, answer, _, cost = self._entries[best_key]
+            self.hits += 1
+            self.latency_saved += cost
+            return answer
+
+    def store(self, question, vector, answer, cost):
+        """Cache answer for the question; cost is the time a hit saves, in seconds."""
+        ttl = self.fresh_ttl if is_time_sensitive(question) else self.ttl
+        entry = (tuple(normalize(vector)), answer, time.time() + ttl, cost)
+        with self._lock:
+            if self._conn is None:
+                key = self._next_key
+                self._next_key += 1
+            else:
+                with self._conn:
+                    key = self._conn.execute(
+                        'INSERT INTO answers (vector, answer, expires, cost) '
+                        'VALUES (?, ?, ?, ?)',
+                        (json.dumps(entry[0]), *entry[1:]),
+                    ).lastrowid
+                    self._conn.execute(
+                        'DELETE FROM answers WHERE expires < ? OR id <= ?',
+                        (time.time(), key - self.max_entries),
+                    )
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def disable(self, reason):
+        """Stop caching for the rest of the process, e.g. without an embed model."""
+        if self.enabled:
+            self.enabled = False
+            logging.warning(f'Answer cache disabled: {reason}')
+
+    def stats(self):
+        """Return hit/miss counters and the total latency saved in seconds."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'latency_saved_seconds': self.latency_saved,
+            }
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide AnswerCache, shared through ANSWER_CACHE_DB."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(db_path=ANSWER_CACHE_DB)
+            stats = _answer_cache.stats
+            registry.gauge('answer_cache_entries', lambda: stats()['entries'],
+                           'Answers held in the cache.')
+            registry.gauge('answer_cache_hits_total', lambda: stats()['hits'],
+                           'Questions answered from the cache.', 'counter')
+            registry.gauge('answer_cache_misses_total', lambda: stats()['misses'],
+                           'Cache lookups without a match.', 'counter')
+            registry.gauge('answer_cache_hit_ratio', lambda: stats()['hit_rate'],
+                           'Share of lookups answered from the cache.')
+            registry.gauge(
+                'answer_cache_saved_seconds_total',
+                lambda: stats()['latency_saved_seconds'],
+                'Search and summary time saved by cache hits.', 'counter',
+            )
+        return _answer_cache
@@ -0,0 +1,287 @@
+"""Index of research artifacts: task JSON, logs and reports.
+
+File names are handed out from a counter in the index, so a new log or
+report does not probe the disk for a free '_NNN' suffix. Finished tasks are
+archived as compressed JSON named after their research_id, and their logs
+are compressed too: zstd if the zstandard package is installed, gzip
+otherwise. Every artifact is recorded with its task and user, and retention
+deletes the oldest ones beyond RESEARCH_RETENTION_BYTES or older than
+RESEARCH_RETENTION_DAYS.
+"""
+import glob
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from constants import (
+    RESEARCH_ARCHIVE_DIR,
+    RESEARCH_ARTIFACTS_DB,
+    RESEARCH_DIR,
+    RESEARCH_JSON_FILE,
+    RESEARCH_LOG_DIR,
+    RESEARCH_RETENTION_BYTES,
+    RESEARCH_RETENTION_DAYS,
+    RESEARCH_TXT_DIR,
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS names ('
+    ' directory TEXT NOT NULL, name TEXT NOT NULL, counter INTEGER NOT NULL,'
+    ' PRIMARY KEY (directory, name)'
+    ')',
+    'CREATE TABLE IF NOT EXISTS artifacts ('
+    ' path TEXT PRIMARY KEY, research_id TEXT, user_id TEXT,'
+    ' kind TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL'
+    ')',
+    'CREATE INDEX IF NOT EXISTS artifacts_research_id ON artifacts (research_id)',
+    'CREATE INDEX IF NOT EXISTS artifacts_user_id ON artifacts (user_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS artifacts_created_at ON artifacts (created_at)',
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+)
+COMPRESSED_SUFFIX = '.zst' if zstandard else '.gz'
+# Files under RESEARCH_DIR that are artifacts, rather than databases
+ARTIFACT_KINDS = ('log', 'pdf', 'txt', 'md', 'html', 'json')
+
+
+def write_compressed(path, data):
+    """Write bytes to path, compressed according to its suffix."""
+    if path.endswith('.zst'):
+        data = zstandard.ZstdCompressor().compress(data)
+    elif path.endswith('.gz'):
+        data = gzip.compress(data)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_compressed(path):
+    """Return the bytes of path, decompressed according to its suffix."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise OSError(f'Reading {path} needs the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(data)
+    if path.endswith('.gz'):
+        return gzip.decompress(data)
+    return data
+
+
+def report_kind(path):
+    """Return the artifact kind of a report or log path, e.g. 'pdf'."""
+    name = os.path.basename(path)
+    for suffix in ('.zst', '.gz'):
+        name = name.removesuffix(suffix)
+    return os.path.splitext(name)[1].lstrip('.') or 'file'
+
+
+def task_archive_path(research_id):
+    """Return the archive path of a task, before the compression suffix."""
+    return os.path.join(RESEARCH_ARCHIVE_DIR, f'{research_id}.json')
+
+
+def task_archive_id(path):
+    """Return the research_id of the task archived at path."""
+    return os.path.basename(path).split('.json', 1)[0]
+
+
+class ArtifactStore:
+    """SQLite index of the files under RESEARCH_DIR."""
+
+    def __init__(self, db_path=RESEARCH_ARTIFACTS_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def reserve_path(self, base_name, directory, extension):
+        """Return a new path research_{base_name}[_NNN]{extension} in directory.
+
+        The counter lives in the index; the disk is only checked for the
+        name it yields, which exists only for files from before the index.
+        """
+        name = f'research_{base_name}{extension}'
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT counter FROM names WHERE directory = ? AND name = ?',
+                (directory, name),
+            ).fetchone()
+            counter = row[0] if row else 0
+            while True:
+                suffix = f'_{counter:03d}' if counter else ''
+                path = os.path.join(directory, f'research_{base_name}{suffix}{extension}')
+                counter += 1
+                if not os.path.exists(path):
+                    break
+            self._conn.execute(
+                'INSERT OR REPLACE INTO names VALUES (?, ?, ?)',
+                (directory, name, counter),
+            )
+        return path
+
+    def add(self, path, kind, research_id=None, user_id=None, created_at=None):
+        """Record the file at path as an artifact of research_id."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)',
+                (path, research_id, user_id, kind, os.path.getsize(path),
+                 created_at or time.time()),
+            )
+
+    def add_task_files(self, task_state, paths):
+        """Record the reports or logs at paths as artifacts of task_state."""
+        for path in paths:
+            if path and os.path.exists(path):
+                self.add(path, report_kind(path), task_state['research_id'],
+                         task_state.get('user_id'))
+
+    def compress(self, path, task_state):
+        """Replace the file at path by a compressed copy; return its path."""
+        compressed = path + COMPRESSED_SUFFIX
+        with open(path, 'rb') as f:
+            write_compressed(compressed, f.read())
+        os.remove(path)
+        self.add_task_files(task_state, [compressed])
+        return compressed
+
+    def archive_task(self, json_path=RESEARCH_JSON_FILE, created_at=None):
+        """Move the task JSON at json_path into the compressed archive."""
+        with open(json_path, 'rb') as f:
+            data = f.read()
+        state = json.loads(data)
+        research_id = state.get('research_id') or os.path.basename(json_path)
+        path = task_archive_path(research_id) + COMPRESSED_SUFFIX
+        write_compressed(path, data)
+        self.add(path, 'task', research_id, state.get('user_id'), created_at)
+        os.remove(json_path)
+        return path
+
+    def task_paths(self, research_id='', user_id=None):
+        """Return archived task paths, newest first, filtered by id prefix and user."""
+        query = (
+            "SELECT path FROM artifacts WHERE kind = 'task' "
+            'AND substr(research_id, 1, ?) = ?'
+        )
+        params = [len(research_id), research_id]
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            params.append(str(user_id))
+        with self._lock:
+            rows = self._conn.execute(
+                f'{query} ORDER BY created_at DESC', params
+            ).fetchall()
+        return [path for path, in rows]
+
+    def load_task(self, path):
+        """Return the task state archived at path."""
+        return json.loads(read_compressed(path))
+
+    def find_task(self, research_id='', user_id=None):
+        """Return the newest archived task matching research_id and user, or None."""
+        for path in self.task_paths(research_id, user_id):
+            try:
+                return self.load_task(path)
+            except (OSError, ValueError) as e:
+                logging.warning(f'Failed to read archived task {path}: {e}')
+        return None
+
+    def artifacts(self, research_id):
+        """Return (path, kind, size) of every artifact of research_id."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT path, kind, size FROM artifacts WHERE research_id = ? '
+                'ORDER BY created_at',
+                (research_id,),
+            ).fetchall()
+
+    def prune(self, max_bytes=RESEARCH_RETENTION_BYTES, max_days=RESEARCH_RETENTION_DAYS):
+        """Delete artifacts older than max_days, then the oldest beyond max_bytes.
+
+        Either limit is off when 0. Returns (path, kind, research_id) of the
+        artifacts deleted, for the research index to forget them.
+        """
+        expired = []
+        with self._lock:
+            if max_days:
+                expired += self._conn.execute(
+                    'SELECT path, kind, research_id FROM artifacts WHERE created_at < ?',
+                    (time.time() - max_days * 86400,),
+                ).fetchall()
+            if max_bytes:
+                total = 0
+                for path, kind, research_id, size in self._conn.execute(
+                    'SELECT path, kind, research_id, size FROM artifacts '
+                    'ORDER BY created_at DESC'
+                ):
+                    total += size
+                    if total > max_bytes:
+                        expired.append((path, kind, research_id))
+        expired = sorted(set(expired))
+        paths = [path for path, _, _ in expired]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f'Failed to delete research artifact {path}: {e}')
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM artifacts WHERE path = ?',
+                                   [(path,) for path in paths])
+        if paths:
+            logging.info(f'Research retention: deleted {len(paths)} artifacts')
+        return expired
+
+    def import_legacy(self):
+        """Archive 'research_task.json.NNN' files and index older logs and reports.
+
+        Runs once per store; later files are all added as they are made.
+        """
+        with self._lock:
+            done = self._conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'legacy_imported'"
+            ).fetchone()
+        if done:
+            return
+        for path in glob.glob(f'{glob.escape(RESEARCH_JSON_FILE)}.*'):
+            try:
+                self.archive_task(path, created_at=os.path.getmtime(path))
+            except (OSError, ValueError) as e:
+                logging.warning(f'Failed to archive research file {path}: {e}')
+        for directory in (RESEARCH_DIR, RESEARCH_LOG_DIR, RESEARCH_TXT_DIR):
+            for path in glob.glob(os.path.join(glob.escape(directory), 'research_*.*')):
+                kind = report_kind(path)
+                if kind in ARTIFACT_KINDS and path != RESEARCH_JSON_FILE:
+                    self.add(path, kind, created_at=os.path.getmtime(path))
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO meta VALUES ('legacy_imported', '1')")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_artifact_store = None
+_artifact_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """Return the process-wide ArtifactStore, importing older files on first use."""
+    global _artifact_store
+    with _artifact_store_lock:
+        if _artifact_store is None:
+            _artifact_store = ArtifactStore()
+            _artifact_store.import_legacy()
+            _artifact_store.prune()
+        return _artifact_store
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+
+from constants import (
+    AGENT_PRECONTEXT,
+    CHARS_PER_TOKEN,
+    CHAT_PROMPT_TOKEN_BUDGET,
+    CHAT_SUMMARY_BATCH,
+    CHAT_SUMMARY_MAX_TOKENS,
+    CHAT_VERBATIM_TURNS,
+)
+from utils.chat_store import get_chat_store
+from utils.ollama_utils import ollama_generate
+from utils.prompts import SUMMARIZE_CONVERSATION_PROMPT_TEMPLATE
+
+
+_folding = {}  # user_id -> running summarization task
+
+
+def estimate_tokens(text):
+    """Roughly estimate the number of LLM tokens in text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to about max_tokens, marking the cut with an ellipsis."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(max_chars - 3, 0)] + '...'
+
+
+def build_chat_prompt(user_id, budget=CHAT_PROMPT_TOKEN_BUDGET):
+    """Build the direct-answer prompt from the summary and recent turns."""
+    chat_store = get_chat_store()
+    summary, folded_seq = chat_store.get_summary(user_id)
+    entries = [
+        content for seq, content in chat_store.get_entries(user_id)
+        if seq > folded_seq
+    ]
+
+    head = AGENT_PRECONTEXT
+    if summary:
+        summary = truncate_to_tokens(summary, CHAT_SUMMARY_MAX_TOKENS)
+        head += f'\nConversation summary:\n{summary}'
+    remaining = budget - estimate_tokens(head) - 1
+
+    # Newest turns first, so the latest message always fits
+    turns = []
+    for content in reversed(entries):
+        if remaining <= 0:
+            break
+        content = truncate_to_tokens(content, remaining)
+        turns.append(content)
+        remaining -= estimate_tokens(content)
+    history_str = '\n'.join(reversed(turns))
+    return f'{head}\n{history_str}\nagent:'
+
+
+def schedule_summary(user_id):
+    """Fold old turns into the summary in the background when enough piled up."""
+    user_id = str(user_id)
+    task = _folding.get(user_id)
+    if task is not None and not task.done():
+        return
+    chat_store = get_chat_store()
+    _, folded_seq = chat_store.get_summary(user_id)
+    entries = chat_store.get_entries(user_id)
+    unfolded = [e for e in entries[:-CHAT_VERBATIM_TURNS] if e[0] > folded_seq]
+    if len(unfolded) < CHAT_SUMMARY_BATCH:
+        return
+    _folding[user_id] = asyncio.create_task(fold_turns(user_id, unfolded))
+
+
+async def fold_turns(user_id, turns):
+    """Merge turns, a list of (seq, message), into the rolling summary."""
+    summary, _ = get_chat_store().get_summary(user_id)
+    prompt = SUMMARIZE_CONVERSATION_PROMPT_TEMPLATE.format(
+        summary=summary or '(empty)',
+        turns='\n'.join(content for _, content in turns),
+        max_chars=CHAT_SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN,
+    )
+    try:
+        response = await asyncio.to_thread(ollama_generate, prompt)
+    except Exception as e:
+        logging.error(f'Failed to summarize conversation of {user_id}: {e}')
+        return
+    finally:
+        _folding.pop(user_id, None)
+    new_summary = truncate_to_tokens(
+        response.get('response', '').strip(), CHAT_SUMMARY_MAX_TOKENS
+    )
+    if not new_summary:
+        return
+    await asyncio.to_thread(save_summary, user_id, new_summary, turns[-1][0])
+
+
+def save_summary(user_id, summary, last_seq):
+    """Store the summary of the turns up to last_seq; blocking, run it in a thread.
+
+    Skipped if /delete wiped the history in the meantime. The user may have
+    been evicted while Ollama ran, and set_summary waits for a running flush.
+    """
+    chat_store = get_chat_store()
+    if any(seq >= last_seq for seq, _ in chat_store.get_entries(user_id)):
+        chat_store.set_summary(user_id, summary, last_seq)
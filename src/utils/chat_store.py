@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from constants import (
+    CHAT_CACHE_SIZE,
+    CHAT_DB_FILE,
+    CHAT_DIR,
+    CHAT_FLUSH_BATCH,
+    CHAT_FLUSH_INTERVAL,
+    MAX_HISTORY,
+)
+from utils.metrics import registry
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS messages ('
+    ' user_id TEXT NOT NULL,'
+    ' seq INTEGER NOT NULL,'
+    ' content TEXT NOT NULL,'
+    ' created_at REAL NOT NULL,'
+    ' PRIMARY KEY (user_id, seq)'
+    ') WITHOUT ROWID'
+)
+SUMMARY_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS summaries ('
+    ' user_id TEXT PRIMARY KEY,'
+    ' summary TEXT NOT NULL,'
+    ' folded_seq INTEGER NOT NULL'
+    ')'
+)
+
+
+def legacy_chat_file(user_id):
+    """Return the path of the pre-SQLite JSON history of user_id."""
+    return os.path.join(CHAT_DIR, f'{user_id}.json')
+
+
+class ChatStore:
+    """Per-user chat history with an in-memory LRU and SQLite write-behind."""
+
+    def __init__(self, db_path=CHAT_DB_FILE, max_history=MAX_HISTORY,
+                 cache_size=CHAT_CACHE_SIZE, flush_interval=CHAT_FLUSH_INTERVAL,
+                 flush_batch=CHAT_FLUSH_BATCH):
+        self.max_history = max_history
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._cache = OrderedDict()  # user_id -> deque of (seq, content)
+        self._summaries = {}  # user_id -> (summary, folded_seq), same keys
+        self._pending = []  # (user_id, seq, content, created_at)
+        self._writing = []  # Pending messages taken by the running flush
+        self._deleted = set()  # Users deleted while a flush was writing
+        # _lock guards the cache, the pending lists and _read_conn; writes
+        # to disk hold only _write_lock, so appends never wait for them
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(SCHEMA)
+        self._conn.execute(SUMMARY_SCHEMA)
+        self._conn.commit()
+        # WAL lets this one read while the writer's transaction is open
+        self._read_conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._writer = threading.Thread(
+            target=self._run_writer, name='chat-store-writer', daemon=True
+        )
+        self._writer.start()
+
+    def _load(self, user_id):
+        """Return the cached deque for user_id, loading it on a miss.
+
+        A miss reads SQLite; call get_history from a thread when the user
+        may not be cached, so the read does not block the event loop.
+        """
+        entries = self._cache.get(user_id)
+        if entries is not None:
+            self._cache.move_to_end(user_id)
+            return entries
+        rows = self._read_conn.execute(
+            'SELECT seq, content FROM messages WHERE user_id = ? '
+            'ORDER BY seq DESC LIMIT ?',
+            (user_id, self.max_history),
+        ).fetchall()
+        entries = deque(reversed(rows), maxlen=self.max_history)
+        # Messages of an evicted user may still be waiting for the writer
+        last_seq = entries[-1][0] if entries else 0
+        entries.extend(
+            (seq, content) for uid, seq, content, _ in self._writing + self._pending
+            if uid == user_id and seq > last_seq
+        )
+        if not entries:
+            entries.extend(self._import_legacy(user_id))
+        row = self._read_conn.execute(
+            'SELECT summary, folded_seq FROM summaries WHERE user_id = ?',
+            (user_id,),
+        ).fetchone()
+        self._cache[user_id] = entries
+        self._summaries[user_id] = row or ('', 0)
+        while len(self._cache) > self.cache_size:
+            evicted, _ = self._cache.popitem(last=False)
+            del self._summaries[evicted]
+        return entries
+
+    def _import_legacy(self, user_id):
+        """Migrate a pre-SQLite CHAT_DIR/{user_id}.json file, if present."""
+        legacy_file = legacy_chat_file(user_id)
+        if not os.path.exists(legacy_file):
+            return []
+        try:
+            with open(legacy_file, 'r') as f:
+                conversation = json.load(f)[-self.max_history:]
+        except (OSError, ValueError) as e:
+            logging.warning(f'Failed to import legacy chat {legacy_file}: {e}')
+            return []
+        now = time.time()
+        entries = list(enumerate(conversation, 1))
+        self._pending.extend((user_id, seq, text, now) for seq, text in entries)
+        os.remove(legacy_file)
+        return entries
+
+    def get_entries(self, user_id):
+        """Return the recent history of user_id as a list of (seq, message)."""
+        with self._lock:
+            return list(self._load(str(user_id)))
+
+    def get_history(self, user_id):
+        """Return the recent history of user_id as a list of messages."""
+        return [content for _, content in self.get_entries(user_id)]
+
+    def get_summary(self, user_id):
+        """Return (summary, folded_seq) of the older history of user_id."""
+        user_id = str(user_id)
+        with self._lock:
+            self._load(user_id)
+            return self._summaries[user_id]
+
+    def set_summary(self, user_id, summary, folded_seq):
+        """Store the rolling summary covering messages up to folded_seq."""
+        user_id = str(user_id)
+        with self._lock:
+            self._load(user_id)
+            self._summaries[user_id] = (summary, folded_seq)
+        with self._write_lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO summaries '
+                '(user_id, summary, folded_seq) VALUES (?, ?, ?)',
+                (user_id, summary, folded_seq),
+            )
+
+    def append(self, user_id, message):
+        """Append a message to the history of user_id and queue it for disk."""
+        user_id = str(user_id)
+        with self._lock:
+            entries = self._load(user_id)
+            seq = entries[-1][0] + 1 if entries else 1
+            entries.append((seq, message))
+            self._pending.append((user_id, seq, message, time.time()))
+            if len(self._pending) >= self.flush_batch:
+                self._wakeup.set()
+        return seq
+
+    def pending_writes(self):
+        """Return how many messages wait for the next flush."""
+        with self._lock:
+            return len(self._pending)
+
+    def delete(self, user_id):
+        """Delete all history of user_id. Return True if anything existed.
+
+        A legacy JSON history not imported yet is deleted too, so the next
+        message does not bring it back.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            cached = self._cache.pop(user_id, None)
+            self._summaries.pop(user_id, None)
+            self._pending = [p for p in self._pending if p[0] != user_id]
+            if self._writing:
+                self._deleted.add(user_id)
+            try:
+                os.remove(legacy_chat_file(user_id))
+                legacy = True
+            except FileNotFoundError:
+                legacy = False
+        # After a running flush, so the rows it writes are deleted too
+        with self._write_lock, self._conn:
+            cursor = self._conn.execute(
+                'DELETE FROM messages WHERE user_id = ?', (user_id,)
+            )
+            self._conn.execute(
+                'DELETE FROM summaries WHERE user_id = ?', (user_id,)
+            )
+        return bool(cached) or legacy or cursor.rowcount > 0
+
+    def flush(self):
+        """Write pending messages in one transaction and trim old rows.
+
+        If the write fails, the messages are put back for the next flush.
+        """
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._writing = pending
+                self._deleted.clear()
+            if not pending:
+                return 0
+            users = {p[0] for p in pending}
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO messages '
+                        '(user_id, seq, content, created_at) VALUES (?, ?, ?, ?)',
+                        pending,
+                    )
+                    self._conn.executemany(
+                        'DELETE FROM messages WHERE user_id = ? AND seq <= '
+                        '(SELECT MAX(seq) FROM messages WHERE user_id = ?) - ?',
+                        [(u, u, self.max_history) for u in users],
+                    )
+            except sqlite3.Error:
+                with self._lock:
+                    self._pending[:0] = [
+                        p for p in pending if p[0] not in self._deleted
+                    ]
+                    self._writing = []
+                raise
+            with self._lock:
+                self._writing = []
+        return len(pending)
+
+    def _run_writer(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logging.error(f'Chat store flush failed: {e}')
+
+    def close(self):
+        """Stop the writer thread and flush everything still pending."""
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join()
+        self.flush()
+        with self._lock, self._write_lock:
+            self._read_conn.close()
+            self._conn.close()
+
+
+_chat_store = None
+_chat_store_lock = threading.Lock()
+
+
+def get_chat_store():
+    """Return the process-wide ChatStore, creating it on first use."""
+    global _chat_store
+    with _chat_store_lock:
+        if _chat_store is None:
+            _chat_store = ChatStore()
+            registry.gauge(
+                'chat_store_pending_writes',
+                lambda: _chat_store.pending_writes() if _chat_store else 0,
+                'Chat messages waiting for the next flush.',
+            )
+        return _chat_store
+
+
+def close_chat_store():
+    """Flush and close the process-wide ChatStore if it was opened."""
+    global _chat_store
+    with _chat_store_lock:
+        if _chat_store is not None:
+            _chat_store.close()
+            _chat_store = None
@@ -0,0 +1,19 @@
+import threading
+
+import requests
+
+
+_local = threading.local()
+
+
+def get_http_session():
+    """Return the requests.Session of this thread, creating it on first use.
+
+    requests does not promise that a Session is thread safe, and Ollama and
+    search calls run in asyncio.to_thread workers. So each worker thread
+    keeps its own session, whose pool keeps its connections alive.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
@@ -0,0 +1,29 @@
+import asyncio
+import importlib
+
+
+class LazyCallback:
+    """Handler callback that imports 'module:function' when first needed.
+
+    Handler modules pull in fpdf, bs4, aiohttp and the like, so they are
+    imported by the startup warm-up, or in a thread on the first update if
+    that comes sooner, rather than when the bot starts.
+    """
+
+    def __init__(self, path):
+        self.module, self.name = path.split(':')
+        self._callback = None
+
+    def load(self):
+        """Import the callback; blocking, so call it from a thread."""
+        if self._callback is None:
+            module = importlib.import_module(self.module)
+            self._callback = getattr(module, self.name)
+        return self._callback
+
+    async def __call__(self, update, context):
+        callback = self._callback or await asyncio.to_thread(self.load)
+        return await callback(update, context)
+
+    def __repr__(self):
+        return f'LazyCallback({self.module}:{self.name})'
@@ -1,19 +1,149 @@
+import atexit
 import logging
 import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from dotenv import load_dotenv
 
 load_dotenv()
 LOG_FILE = os.getenv('LOG_FILE', 'websearchbuddy.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_ROTATE_SECONDS = int(os.getenv('LOG_ROTATE_SECONDS', str(24 * 3600)))
+LOG_PAYLOAD_CHARS = int(os.getenv('LOG_PAYLOAD_CHARS', '500'))
+LOG_FORMAT = '%(asctime)s[%(levelname)s]%(name)s - %(message)s'
+TASK_LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+TASK_LOGGER_PREFIX = 'research.'
 
 
-def configure_logging():
-    """Configure logging for the application with UTF-8 encoding."""
-    handlers = [
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler(),
-    ]
+def shorten(text, limit=LOG_PAYLOAD_CHARS):
+    """Cut a prompt or response to limit chars for logging."""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f'{text[:limit]}... [{len(text)} chars]'
+
+
+class SizedTimedRotatingFileHandler(RotatingFileHandler):
+    """Rotate when the file exceeds max_bytes or every interval seconds."""
+
+    def __init__(self, filename, max_bytes, backup_count, interval):
+        super().__init__(
+            filename, maxBytes=max_bytes, backupCount=backup_count,
+            encoding='utf-8', delay=True,
+        )
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def shouldRollover(self, record):
+        if self.interval and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+class TaskLogRouter(logging.Handler):
+    """Write records of research task loggers to the task's own file."""
+
+    def __init__(self):
+        super().__init__()
+        self._files = {}  # logger name -> FileHandler
+        self._files_lock = threading.Lock()
+
+    def add(self, name, path):
+        handler = logging.FileHandler(path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(TASK_LOG_FORMAT))
+        with self._files_lock:
+            self._files[name] = handler
+
+    def remove(self, name):
+        with self._files_lock:
+            handler = self._files.pop(name, None)
+        if handler is not None:
+            handler.close()
+
+    def emit(self, record):
+        with self._files_lock:
+            handler = self._files.get(record.name)
+            if handler is not None:
+                handler.handle(record)
+
+
+_log_queue = None
+_listener = None
+_task_router = TaskLogRouter()
+
+
+def configure_logging(log_file=LOG_FILE):
+    """Configure logging for the application with UTF-8 encoding.
+
+    Records are handed to a queue; one background thread formats them and
+    does all file and console writes, so logging never blocks the event
+    loop on disk I/O.
+    """
+    global _log_queue, _listener
+    if _listener is not None:
+        return
+    file_handler = SizedTimedRotatingFileHandler(
+        log_file, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATE_SECONDS
+    )
+    handlers = [file_handler, logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _log_queue = queue.Queue()
+    _listener = QueueListener(
+        _log_queue, *handlers, _task_router, respect_handler_level=True
+    )
+    _listener.start()
+    queue_handler = QueueHandler(_log_queue)
+    # The listener's handlers add time and level; pass the bare message
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s[%(levelname)s]%(name)s - %(message)s',
-        handlers=handlers,
-    )
\ No newline at end of file
+        handlers=[queue_handler],
+        force=True,
+    )
+    atexit.register(stop_logging)
+
+
+def flush_logs():
+    """Block until every record logged so far has been written."""
+    if _log_queue is not None:
+        _log_queue.join()
+
+
+def stop_logging():
+    """Write the remaining records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def open_task_log(task_id, path):
+    """Return a logger whose records also go to the file path."""
+    name = f'{TASK_LOGGER_PREFIX}{task_id}'
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    if _listener is None:
+        # Logging is not configured, e.g. in a benchmark: write directly
+        handler = logging.FileHandler(path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(TASK_LOG_FORMAT))
+        logger.addHandler(handler)
+    else:
+        _task_router.add(name, path)
+    return logger
+
+
+def close_task_log(logger):
+    """Flush and close the file of a logger from open_task_log."""
+    flush_logs()
+    _task_router.remove(logger.name)
+    for handler in list(logger.handlers):
+        handler.close()
+        logger.removeHandler(handler)
@@ -0,0 +1,211 @@
+"""Event loop lag watchdog.
+
+A heartbeat coroutine sleeps for a short interval and measures how late it
+wakes up. A watchdog thread notices when the heartbeat is overdue and
+captures the stack of the loop thread while the blocking code still runs,
+so every stall is blamed on the call that caused it.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from constants import (
+    LOOP_LAG_THRESHOLD, LOOP_MONITOR_ENABLED, LOOP_MONITOR_INTERVAL,
+    LOOP_MONITOR_SAMPLES,
+)
+from utils.metrics import inc, observe, registry
+
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STACK_DEPTH = 8  # Innermost frames kept per captured stack
+UNKNOWN = 'unknown (over before the watchdog looked)'
+
+registry.describe('event_loop_lag_seconds', 'histogram',
+                  'How late the event loop ran the heartbeat.')
+registry.describe('event_loop_stalls_total', 'counter',
+                  'Heartbeats delayed past the blocking threshold.')
+
+
+def is_own_frame(frame):
+    path = os.path.abspath(frame.filename)
+    return path.startswith(SRC_DIR) and path != os.path.abspath(__file__)
+
+
+def frame_location(frame):
+    """Return 'file:line function', relative to src/ for the bot's own files."""
+    path = os.path.abspath(frame.filename)
+    if path.startswith(SRC_DIR):
+        path = os.path.relpath(path, SRC_DIR)
+    else:
+        path = os.path.basename(path)
+    return f'{path}:{frame.lineno} {frame.name}'
+
+
+def callback_stack(frame):
+    """Return the innermost frames of frame's stack, below asyncio's callback runner."""
+    stack = traceback.extract_stack(frame)
+    for index in range(len(stack) - 1, -1, -1):
+        if stack[index].name == '_run' and stack[index].filename == asyncio.events.__file__:
+            stack = stack[index + 1:]
+            break
+    return stack[-STACK_DEPTH:]
+
+
+def blame(stack):
+    """Name the bot's innermost frame and the call it was blocked in."""
+    innermost = stack[-1]
+    own = next((frame for frame in reversed(stack) if is_own_frame(frame)), None)
+    if own is None or own is innermost:
+        return frame_location(innermost)
+    return f'{frame_location(own)} -> {frame_location(innermost)}'
+
+
+class LoopMonitor:
+    """Measure event loop lag and record what blocked the loop."""
+
+    def __init__(self, interval=LOOP_MONITOR_INTERVAL, threshold=LOOP_LAG_THRESHOLD,
+                 samples=LOOP_MONITOR_SAMPLES):
+        self.interval = interval
+        self.threshold = threshold
+        self.started_at = time.time()
+        self.stalls = 0
+        self._lags = deque(maxlen=samples)
+        self._offenders = {}  # blame -> {'count', 'seconds', 'worst', 'stack'}
+        self._lock = threading.Lock()
+        self._beat = (0, time.monotonic())  # (sequence, when it went to sleep)
+        self._captured = None  # (sequence, stack) of the stall in progress
+        self._loop_thread = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start watching the running loop; call from a coroutine."""
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(
+            target=self._watch, name='loop-watchdog', daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    async def _heartbeat(self):
+        sequence = 0
+        while True:
+            sequence += 1
+            slept_at = time.monotonic()
+            self._beat = (sequence, slept_at)
+            await asyncio.sleep(self.interval)
+            self.record(sequence, max(time.monotonic() - slept_at - self.interval, 0.0))
+
+    def _watch(self):
+        """Capture the loop thread's stack once per overdue heartbeat."""
+        while not self._stopped.wait(self.threshold / 4):
+            sequence, slept_at = self._beat
+            if time.monotonic() - slept_at - self.interval < self.threshold:
+                continue
+            if self._captured is not None and self._captured[0] == sequence:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._captured = (sequence, callback_stack(frame))
+            del frame
+
+    def record(self, sequence, lag):
+        observe('event_loop_lag_seconds', lag)
+        with self._lock:
+            self._lags.append(lag)
+        if lag < self.threshold:
+            return
+        inc('event_loop_stalls_total')
+        captured = self._captured
+        stack = captured[1] if captured is not None and captured[0] == sequence else None
+        key = blame(stack) if stack else UNKNOWN
+        with self._lock:
+            self.stalls += 1
+            offender = self._offenders.setdefault(
+                key, {'count': 0, 'seconds': 0.0, 'worst': 0.0, 'stack': stack}
+            )
+            first = offender['count'] == 0
+            offender['count'] += 1
+            offender['seconds'] += lag
+            if lag > offender['worst']:
+                offender['worst'] = lag
+                offender['stack'] = stack
+        message = f'Event loop blocked for {lag * 1000:.0f} ms in {key}'
+        if first and stack:
+            message += ':\n' + ''.join(traceback.format_list(stack)).rstrip()
+        logging.warning(message)
+
+    def lag_percentiles(self):
+        """Return (p50, p99, max) lag in seconds over the recent samples."""
+        with self._lock:
+            lags = sorted(self._lags)
+        if not lags:
+            return 0.0, 0.0, 0.0
+        return lags[len(lags) // 2], lags[min(int(len(lags) * 0.99), len(lags) - 1)], lags[-1]
+
+    def worst_offenders(self, limit=5):
+        """Return [(blame, stats)] ordered by total time blocked."""
+        with self._lock:
+            offenders = [(key, dict(stats)) for key, stats in self._offenders.items()]
+        offenders.sort(key=lambda item: item[1]['seconds'], reverse=True)
+        return offenders[:limit]
+
+    def report(self, limit=5, stack_lines=4):
+        """Describe loop lag and the worst offenders as plain text."""
+        p50, p99, worst = self.lag_percentiles()
+        lines = [
+            f'Event loop lag over the last {len(self._lags)} heartbeats: '
+            f'p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, max {worst * 1000:.0f} ms',
+            f'Stalls over {self.threshold * 1000:.0f} ms since '
+            f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(self.started_at))}: '
+            f'{self.stalls}',
+        ]
+        offenders = self.worst_offenders(limit)
+        if offenders:
+            lines.append('\nWorst offenders:')
+        for rank, (key, stats) in enumerate(offenders, 1):
+            lines.append(
+                f'{rank}. {key}\n   {stats["count"]} stalls, {stats["seconds"]:.2f} s '
+                f'total, worst {stats["worst"] * 1000:.0f} ms'
+            )
+            for frame in (stats['stack'] or [])[-stack_lines:]:
+                lines.append(f'     {frame_location(frame)}')
+        return '\n'.join(lines)
+
+
+_monitor = None
+
+
+def start_loop_monitor():
+    """Start the process-wide LoopMonitor on the running loop, if enabled."""
+    global _monitor
+    if LOOP_MONITOR_ENABLED and _monitor is None:
+        _monitor = LoopMonitor()
+        _monitor.start()
+    return _monitor
+
+
+def stop_loop_monitor():
+    global _monitor
+    if _monitor is not None:
+        _monitor.stop()
+        _monitor = None
+
+
+def get_loop_monitor():
+    """Return the running LoopMonitor, or None."""
+    return _monitor
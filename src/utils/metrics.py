@@ -0,0 +1,218 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+PREFIX = 'websearchbuddy_'
+# Upper bounds in seconds, from a cache hit to a long LLM generation
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0, 120.0, 300.0,
+)
+
+
+def format_labels(labels):
+    """Render a sorted label tuple as {name="value",...}."""
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+         .replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Process-wide counters, histograms and gauges.
+
+    Counters and histograms are updated in place under one lock; gauges are
+    callbacks read only when the metrics are rendered.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}  # name -> (type, help)
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+        self._buckets = {}  # name -> bucket upper bounds
+        self._gauges = {}  # name -> callback returning a value or {labels: value}
+
+    def describe(self, name, metric_type, help_text):
+        self._help.setdefault(name, (metric_type, help_text))
+
+    def inc(self, name, value=1, **labels):
+        """Add value to the counter name."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Record value in the histogram name."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                self._buckets.setdefault(name, buckets)
+                histogram = [[0] * len(self._buckets[name]), 0.0, 0]
+                self._histograms[key] = histogram
+            index = bisect_left(self._buckets[name], value)
+            if index < len(histogram[0]):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def total(self, name, **labels):
+        """Return the sum of counter name over samples matching labels."""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(
+                value for (counter, sample_labels), value in self._counters.items()
+                if counter == name and wanted <= set(sample_labels)
+            )
+
+    def gauge(self, name, callback, help_text='', metric_type='gauge'):
+        """Register callback to report name; it may return {labels: value}."""
+        self.describe(name, metric_type, help_text)
+        with self._lock:
+            self._gauges[name] = callback
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (list(buckets), total, count)
+                for key, (buckets, total, count) in self._histograms.items()
+            }
+            gauges = dict(self._gauges)
+        samples = {}  # name -> list of lines
+        for (name, labels), value in sorted(counters.items()):
+            samples.setdefault(name, []).append(
+                f'{PREFIX}{name}{format_labels(labels)} {format_value(value)}'
+            )
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(self._buckets[name], buckets):
+                cumulative += bucket_count
+                bucket_labels = format_labels(labels + (('le', format_value(bound)),))
+                lines.append(f'{PREFIX}{name}_bucket{bucket_labels} {cumulative}')
+            inf_labels = format_labels(labels + (('le', '+Inf'),))
+            lines.append(f'{PREFIX}{name}_bucket{inf_labels} {count}')
+            lines.append(f'{PREFIX}{name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{PREFIX}{name}_count{format_labels(labels)} {count}')
+        for name, callback in sorted(gauges.items()):
+            try:
+                value = callback()
+            except Exception as e:
+                logging.warning(f'Metric {name} failed: {e}')
+                continue
+            if not isinstance(value, dict):
+                value = {(): value}
+            samples.setdefault(name, []).extend(
+                f'{PREFIX}{name}{format_labels(tuple(sorted(labels)))} '
+                f'{format_value(sample)}'
+                for labels, sample in value.items()
+            )
+        output = []
+        for name, lines in samples.items():
+            metric_type, help_text = self._help.get(name, ('untyped', ''))
+            if help_text:
+                output.append(f'# HELP {PREFIX}{name} {help_text}')
+            output.append(f'# TYPE {PREFIX}{name} {metric_type}')
+            output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+
+registry = MetricsRegistry()
+registry.describe('stage_seconds', 'histogram', 'Latency of a pipeline stage.')
+registry.describe('handler_seconds', 'histogram', 'Latency of a Telegram handler.')
+registry.describe('stage_errors_total', 'counter', 'Stages that raised.')
+registry.describe('llm_requests_total', 'counter', 'Successful Ollama requests.')
+registry.describe('llm_prompt_tokens_total', 'counter', 'Prompt tokens evaluated by Ollama.')
+registry.describe('llm_completion_tokens_total', 'counter', 'Tokens generated by Ollama.')
+registry.describe('llm_duration_seconds_total', 'counter', 'Time Ollama reports per phase.')
+registry.describe('downloaded_bytes_total', 'counter', 'Bytes downloaded by source.')
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+@contextmanager
+def timed(stage, metric='stage_seconds'):
+    """Record the time spent in the block as metric{stage=stage}."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registry.inc('stage_errors_total', stage=stage)
+        raise
+    finally:
+        registry.observe(metric, time.perf_counter() - started, stage=stage)
+
+
+def instrument(stage, metric='stage_seconds'):
+    """Decorate a function or coroutine function to time it as stage."""
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(stage, metric):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage, metric):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def record_ollama_usage(result, model):
+    """Record the token counts and timings of an Ollama response."""
+    inc('llm_requests_total', model=model)
+    inc('llm_prompt_tokens_total', result.get('prompt_eval_count') or 0, model=model)
+    inc('llm_completion_tokens_total', result.get('eval_count') or 0, model=model)
+    for phase in ('load', 'prompt_eval', 'eval'):
+        nanoseconds = result.get(f'{phase}_duration')
+        if nanoseconds:
+            inc('llm_duration_seconds_total', nanoseconds / 1e9, model=model, phase=phase)
+
+
+async def serve_metrics(request):
+    from aiohttp import web
+    return web.Response(
+        text=registry.render(), content_type='text/plain', charset='utf-8',
+        headers={'Cache-Control': 'no-store'},
+    )
+
+
+async def start_metrics_server(host, port):
+    """Serve GET /metrics on host:port; return the runner to clean up."""
+    from aiohttp import web  # Only imported when metrics are served
+    app = web.Application()
+    app.router.add_get('/metrics', serve_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f'Metrics available at http://{host}:{port}/metrics')
+    return runner
@@ -2,14 +2,20 @@ import json
 import re
 import requests
 import logging
+import threading
 
 from constants import (
     MAX_QUERIES_PER_BATCH,
     OLLAMA_API_URL,
+    OLLAMA_EMBED_MODEL,
+    OLLAMA_EMBED_URL,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_LOAD_TIMEOUT,
     OLLAMA_MODEL,
 )
 from utils.prompts import (
     ANALYZE_PROMPT_TEMPLATE,
+    CONCLUSION_PROMPT_TEMPLATE,
     EXPAND_USER_TASK_PROMPT_TEMPLATE,
     NEXT_QUERY_PROMPT_TEMPLATE,
     REFINE_QUERY_PROMPT_TEMPLATE,
@@ -17,24 +23,95 @@ from utils.prompts import (
     SUMMARIZE_RESEARCH_PROMPT_TEMPLATE,
     SUMMARIZE_STEP_PROMPT_TEMPLATE,
 )
+from utils.http_session import get_http_session
+from utils.logging_confg import shorten
+from utils.metrics import record_ollama_usage, timed
+from utils.research_trace import add_usage
+
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def llm_requests_in_flight():
+    """Return how many Ollama requests are sent and not answered yet."""
+    return _in_flight
+
+
+def _track_in_flight(delta):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += delta
+
 
 def ollama_generate(prompt):
     """Generate a response using the Ollama API."""
-    logging.info(f'Ollama Prompt: {prompt}')
+    logging.info(f'Ollama Prompt: {shorten(prompt)}')
     payload = {
         'model': OLLAMA_MODEL,
         'prompt': prompt,
         'stream': False,
+        'keep_alive': OLLAMA_KEEP_ALIVE,
     }
+    _track_in_flight(1)
     try:
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=30)
-        response.raise_for_status()
-        result = response.json()
-        logging.info(f'Ollama Response: {result}')
+        with timed('ollama_generate'):
+            response = get_http_session().post(OLLAMA_API_URL, json=payload, timeout=30)
+            response.raise_for_status()
+            result = response.json()
+        record_ollama_usage(result, OLLAMA_MODEL)
+        add_usage(result.get('prompt_eval_count') or 0, result.get('eval_count') or 0)
+        logging.info(
+            f'Ollama Response: {shorten(result.get("response", ""))} '
+            f'({result.get("prompt_eval_count")}+{result.get("eval_count")} tokens, '
+            f'{(result.get("total_duration") or 0) / 1e9:.1f}s)'
+        )
         return result
     except requests.RequestException as e:
         logging.error(f'Ollama API error: {str(e)}')
         raise
+    finally:
+        _track_in_flight(-1)
+
+
+def ollama_embed(text):
+    """Return the embedding vector of text using the Ollama API."""
+    payload = {'model': OLLAMA_EMBED_MODEL, 'input': text, 'keep_alive': OLLAMA_KEEP_ALIVE}
+    _track_in_flight(1)
+    try:
+        with timed('ollama_embed'):
+            response = get_http_session().post(OLLAMA_EMBED_URL, json=payload, timeout=30)
+            response.raise_for_status()
+            result = response.json()
+        record_ollama_usage(result, OLLAMA_EMBED_MODEL)
+        return result['embeddings'][0]
+    except (requests.RequestException, KeyError, IndexError) as e:
+        logging.error(f'Ollama embed error: {str(e)}')
+        raise
+    finally:
+        _track_in_flight(-1)
+
+
+def is_model_missing(error):
+    """Return True if error is Ollama's answer for a model it does not have."""
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code == 404
+
+
+def ollama_preload():
+    """Load the chat and embedding models so the first request is not cold."""
+    session = get_http_session()
+    requests_to_send = (
+        (OLLAMA_API_URL, {'model': OLLAMA_MODEL, 'keep_alive': OLLAMA_KEEP_ALIVE}),
+        (OLLAMA_EMBED_URL, {
+            'model': OLLAMA_EMBED_MODEL, 'input': '', 'keep_alive': OLLAMA_KEEP_ALIVE,
+        }),
+    )
+    for url, payload in requests_to_send:
+        with timed('ollama_preload'):
+            response = session.post(url, json=payload, timeout=OLLAMA_LOAD_TIMEOUT)
+            response.raise_for_status()
+        logging.info(f'Ollama model {payload["model"]} loaded')
 
 
 def analyze_prompt(prompt, conversation=None):
@@ -136,7 +213,7 @@ def generate_batch_queries(prompt):
                 logger.warning(f'Filtered invalid JSON queries: {set(queries) - set(valid_queries)}')
             return valid_queries[:MAX_QUERIES_PER_BATCH]
         except json.JSONDecodeError as e:
-            logger.warning(f'Failed to parse JSON block: {e}, falling back to line-by-line parsing. Raw: {json_str}')
+            logger.warning(f'Failed to parse JSON block: {e}, falling back to line-by-line parsing. Raw: {shorten(json_str)}')
 
     # Fallback to line-by-line parsing if no valid JSON block
     lines = raw_queries.split('\n')
@@ -166,7 +243,7 @@ def generate_batch_queries(prompt):
             valid_queries.append(cleaned_query)
 
     if not valid_queries:
-        logger.error(f'No valid queries parsed from response: {raw_queries}')
+        logger.error(f'No valid queries parsed from response: {shorten(raw_queries)}')
     elif len(valid_queries) < len(lines):
         logger.warning(f'Filtered invalid queries from lines: {set(lines) - set(valid_queries)}')
 
@@ -182,4 +259,17 @@ def check_completion(prompt):
     except (ValueError, IndexError):
         logger = logging.getLogger(__name__)
         logger.warning(f'Failed to parse completion: {complete_response}, defaulting to 2')
-        return '2. Assumed complete due to parsing failure.'
\ No newline at end of file
+        return '2. Assumed complete due to parsing failure.'
+
+
+def generate_conclusion(task_state):
+    """Generate the report conclusion from the research iterations."""
+    iterations_json = json.dumps(task_state['iterations'], indent=2)
+    prompt = CONCLUSION_PROMPT_TEMPLATE.format(
+        current_date=task_state['current_date'],
+        initial_query=task_state['initial_user_query'],
+        plan=task_state['plan'],
+        iterations_json=iterations_json,
+    )
+    response = ollama_generate(prompt)
+    return response.get('response', 'No conclusion generated.').strip()
@@ -1,25 +1,66 @@
-import json
+import asyncio
+import copy
+import io
+import multiprocessing
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from fontTools import ttLib
 from fpdf import FPDF
+from fpdf.enums import TextEmphasis
+from fpdf.fonts import SubsetMap, TTFFont
 from constants import (
-    RESEARCH_DIR,
-    RESEARCH_TXT_DIR,
     FONT_PATH,
-    # CONCLUSION_PROMPT_TEMPLATE,
-    GENERATE_TXT,
-    GENERATE_PDF,
+    REPORT_WORKERS,
 )
-from utils.ollama_utils import ollama_generate
-from utils.prompts import CONCLUSION_PROMPT_TEMPLATE
+from utils.metrics import timed
+
+
+BOLD_PATTERN = re.compile(r'\*\*(.*?)\*\*')
+_font_cache = {}  # font_path -> (parsed TTFFont template, raw font bytes)
+
+
+def load_font(font_path):
+    """Parse font_path once per process and keep it as a template."""
+    if font_path not in _font_cache:
+        with open(font_path, 'rb') as f:
+            data = f.read()
+        template = TTFFont(FPDF(), font_path, 'template', '')
+        _font_cache[font_path] = (template, data)
+    return _font_cache[font_path]
 
 
 class ResearchPDF(FPDF):
     def __init__(self, font_path):
         super().__init__()
-        self.add_font('Arial', '', font_path, uni=True)
-        self.add_font('Arial', 'B', font_path, uni=True)
+        self.add_cached_font('Arial', '', font_path)
+        self.add_cached_font('Arial', 'B', font_path)
         self.set_font('Arial', '', 12)
 
+    def add_cached_font(self, family, style, font_path):
+        """Like add_font, but reuse the glyph metrics parsed for earlier reports.
+
+        Only the per-document state of fpdf2's TTFFont is rebuilt: the font
+        descriptor PDF object, a fresh lazy fontTools handle (subsetting on
+        output mutates it) and the subset map.
+        """
+        template, data = load_font(font_path)
+        font = copy.copy(template)
+        font.desc = copy.copy(template.desc)
+        font.i = len(self.fonts) + 1
+        font.fontkey = f'{family.lower()}{style}'
+        font.emphasis = TextEmphasis.coerce(style)
+        font.ttfont = ttLib.TTFont(
+            io.BytesIO(data), recalcTimestamp=False, fontNumber=0, lazy=True
+        )
+        font.missing_glyphs = []
+        identities = '\x00 \r\n'
+        if self.str_alias_nb_pages:
+            identities += '0123456789' + self.str_alias_nb_pages
+        font.subset = SubsetMap(font, [ord(char) for char in identities])
+        self.fonts[font.fontkey] = font
+
     def header(self):
         self.set_font('Arial', 'B', 10)
         self.cell(0, 10, 'Research Report', 0, 1, 'C')
@@ -41,16 +82,16 @@ class ResearchPDF(FPDF):
                 self.set_font('Arial', 'B', 16)
                 self.multi_cell(0, 10, line[3:])
                 self.ln(2)
-            else:
-                bold_pattern = r'\*\*(.*?)\*\*'
-                parts = re.split(bold_pattern, line)
+            elif '**' not in line:
                 self.set_font('Arial', '', 12)
+                self.write(10, line)
+                self.ln()
+            else:
+                parts = BOLD_PATTERN.split(line)
                 for i, part in enumerate(parts):
-                    if i % 2 == 1:  # Bold part
-                        self.set_font('Arial', 'B', 12)
-                        self.write(10, part)
-                    else:  # Regular part
-                        self.set_font('Arial', '', 12)
+                    if part:
+                        # Odd parts are the bold ones
+                        self.set_font('Arial', 'B' if i % 2 else '', 12)
                         self.write(10, part)
                 self.ln()
 
@@ -60,82 +101,62 @@ class ResearchPDF(FPDF):
         self.chapter_body(body)
 
 
-def save_txt(task_state, content, base_name):
-    """Save raw content to TXT file."""
-    from handlers.research_handler import get_unique_filename
-    txt_file = get_unique_filename(base_name, RESEARCH_TXT_DIR, '.txt')
-    with open(txt_file, 'w', encoding='utf-8') as f:
-        f.write(content)
-    return txt_file
-
-def generate_pdf(task_state):
-    """Generate TXT and/or PDF report."""
-    from handlers.research_handler import get_unique_filename
-    base_name = task_state['base_name']
-
-    # Raw content with Markdown
-    content = (
-        f'Initial Query: {task_state["initial_user_query"]}\n'
-        f'Plan:\n{task_state["plan"]}\n\n'
-        '### Findings\n'
-    )
-    for iteration in task_state['iterations']:
-        content += f'Iteration {iteration["iteration_number"]}:\n_______\n'
-        for q in iteration['queries']:
-            content += f'\nQuery: {q["query"]}\nURL: {q["url"]}\nSummary: {q["summary"]}\n'
-        content += f'Batch Summary: {iteration["summary"]}\n\n'
-    content += f'### Summary\n{task_state["final_summary"]}\n\n'
-
-    iterations_json = json.dumps(task_state['iterations'], indent=2)
-    prompt = CONCLUSION_PROMPT_TEMPLATE.format(
-        current_date=task_state['current_date'],
-        initial_query=task_state['initial_user_query'],
-        plan=task_state['plan'],
-        iterations_json=iterations_json,
-        final_summary=task_state['final_summary']
-    )
-    conclusion = ollama_generate(prompt).get('response', 'No conclusion generated.')
-    content += f'### Conclusion\n{conclusion}\n\n'
-
-    content += '### References\n' + '\n'.join(
-        f'{i+1}. {url}' for i, url in enumerate(task_state['used_urls'])
-    )
-
-    # Save TXT if enabled
-    txt_file = None
-    if GENERATE_TXT:
-        txt_file = save_txt(task_state, content, base_name)
-
-    # Generate PDF if enabled
-    pdf_file = None
-    if GENERATE_PDF:
-        pdf = ResearchPDF(FONT_PATH)
-        pdf.set_title('Research Report')
-        pdf.set_author('WebSearchBuddy')
-
-        intro = (
-            f'Initial Query: {task_state["initial_user_query"]}\n'
-            f'Plan:\n{task_state["plan"]}'
-        )
-        pdf.add_section('Introduction', intro)
-
-        findings = ''
-        for iteration in task_state['iterations']:
-            findings += f'Iteration {iteration["iteration_number"]}:\n_______\n'
-            for q in iteration['queries']:
-                findings += f'\nQuery: {q["query"]}\nURL: {q["url"]}\nSummary: {q["summary"]}\n'
-            findings += f'Batch Summary: {iteration["summary"]}\n\n'
-        pdf.add_section('Findings', findings)
-
-        pdf.add_section('Summary', task_state['final_summary'])
-        pdf.add_section('Conclusion', conclusion)
-
-        used_resources = 'Used Resources:\n' + '\n'.join(
-            f'{i+1}. {url}' for i, url in enumerate(task_state['used_urls'])
-        )
-        pdf.add_section('References', used_resources)
-
-        pdf_file = get_unique_filename(base_name, RESEARCH_DIR, '.pdf')
-        pdf.output(pdf_file)
-
-    return pdf_file, txt_file
\ No newline at end of file
+def generate_pdf(sections, pdf_file):
+    """Render (title, body) report sections to pdf_file and return its path."""
+    pdf = ResearchPDF(FONT_PATH)
+    pdf.set_title('Research Report')
+    pdf.set_author('WebSearchBuddy')
+    for title, body in sections:
+        pdf.add_section(title, body)
+    pdf.output(pdf_file)
+    return pdf_file
+
+
+_report_executor = None
+_report_executor_lock = threading.Lock()
+
+
+def get_report_executor():
+    """Return the process pool that renders reports off the event loop."""
+    global _report_executor
+    with _report_executor_lock:
+        if _report_executor is None:
+            _report_executor = ProcessPoolExecutor(
+                max_workers=REPORT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=load_font,
+                initargs=(FONT_PATH,),
+            )
+        return _report_executor
+
+
+def shutdown_report_executor():
+    """Stop the report worker processes if they were started."""
+    global _report_executor
+    with _report_executor_lock:
+        if _report_executor is not None:
+            _report_executor.shutdown(cancel_futures=True)
+            _report_executor = None
+
+
+_pending_renders = 0
+
+
+def pending_renders():
+    """Return how many PDF reports are queued or rendering."""
+    return _pending_renders
+
+
+async def render_pdf(sections, pdf_file):
+    """Render the PDF report in a worker process."""
+    global _pending_renders
+    loop = asyncio.get_running_loop()
+    _pending_renders += 1
+    try:
+        # Timed here: metrics recorded inside the worker process are lost
+        with timed('generate_pdf'):
+            return await loop.run_in_executor(
+                get_report_executor(), generate_pdf, sections, pdf_file
+            )
+    finally:
+        _pending_renders -= 1
@@ -0,0 +1,140 @@
+"""Sampling profiler of every thread of the bot process.
+
+A daemon thread wakes up every PROFILE_INTERVAL seconds, reads the stack of
+each thread from sys._current_frames() and counts identical stacks. The
+result uses the collapsed format ('root;caller;callee count') read by
+flamegraph.pl and speedscope. Report renderers in the process pool run in
+other processes and are not sampled.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from constants import PROFILE_DIR, PROFILE_INTERVAL, PROFILE_MAX_SECONDS
+
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Pool threads are numbered per worker: ThreadPoolExecutor-0_3, asyncio_2
+WORKER_NUMBER = re.compile(r'_\d+$')
+
+
+def frame_label(code):
+    """Return 'function (file:line)', relative to src/ for the bot's own files."""
+    path = os.path.abspath(code.co_filename)
+    if path.startswith(SRC_DIR):
+        path = os.path.relpath(path, SRC_DIR)
+    else:
+        path = os.path.basename(path)
+    return f'{code.co_name} ({path}:{code.co_firstlineno})'.replace(';', ',')
+
+
+class SamplingProfiler:
+    """Count the stacks of all threads until stopped or max_seconds pass."""
+
+    def __init__(self, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._labels = {}  # code object -> frame label
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def seconds(self):
+        return (self.stopped_at or time.time()) - self.started_at
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(
+            target=self._run, name='sampling-profiler', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_thread = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stopped.wait(self.interval):
+            self.sample(own_thread)
+            if time.monotonic() >= deadline:
+                logging.warning(f'Profiler stopped after {self.max_seconds} s')
+                break
+        self.stopped_at = time.time()
+
+    def sample(self, skip_thread=None):
+        """Count the current stack of every thread but skip_thread."""
+        names = {
+            thread.ident: WORKER_NUMBER.sub('', thread.name).replace(';', ',')
+            for thread in threading.enumerate()
+        }
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == skip_thread:
+                continue
+            labels = []
+            while frame is not None:
+                label = self._labels.get(frame.f_code)
+                if label is None:
+                    label = self._labels[frame.f_code] = frame_label(frame.f_code)
+                labels.append(label)
+                frame = frame.f_back
+            labels.append(names.get(thread_id, f'thread-{thread_id}'))
+            self.stacks[';'.join(reversed(labels))] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        """Return the counted stacks in the collapsed format."""
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in sorted(self.stacks.items())
+        )
+
+    def save(self):
+        """Write the collapsed stacks to PROFILE_DIR and return the path."""
+        started = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        path = os.path.join(PROFILE_DIR, f'profile-{started}.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        return path
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """Return the current profiler, running or with unsent results, or None."""
+    return _profiler
+
+
+def start_profiler():
+    """Start a new process-wide profiler unless one exists; return it."""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = SamplingProfiler()
+            _profiler.start()
+        return _profiler
+
+
+def stop_profiler():
+    """Stop the process-wide profiler and return it, or None if there is none."""
+    global _profiler
+    with _profiler_lock:
+        profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
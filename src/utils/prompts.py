@@ -104,8 +104,16 @@ CONCLUSION_PROMPT_TEMPLATE = (
     'Initial query: "{initial_query}"\n'
     'Plan: "{plan}"\n'
     'Iterations: {iterations_json}\n'
-    'Final summary: "{final_summary}"\n'
     'Write a concise, scientific conclusion addressing the query. Highlight key '
     'insights, implications, and potential further research. Include your '
     'analytical thoughts on the topic.'
-)
\ No newline at end of file
+)
+
+SUMMARIZE_CONVERSATION_PROMPT_TEMPLATE = (
+    'Summary of the conversation so far:\n{summary}\n\n'
+    'New conversation turns:\n{turns}\n\n'
+    'Update the summary to include the new turns. Keep facts, names, '
+    'decisions and open questions; drop small talk. Write at most '
+    '{max_chars} characters in the language of the conversation.\n'
+    'Output only the updated summary.'
+)
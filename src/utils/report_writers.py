@@ -0,0 +1,330 @@
+import html
+import json
+import os
+from abc import ABC, abstractmethod
+
+from constants import RESEARCH_DIR, RESEARCH_TRACE_APPENDIX, RESEARCH_TXT_DIR
+from utils.pdf_utils import BOLD_PATTERN, render_pdf
+from utils.research_budget import format_budget
+from utils.research_trace import format_trace
+
+
+def format_iteration(iteration):
+    """Render one research iteration as a plain-text findings block."""
+    parts = [f'Iteration {iteration["iteration_number"]}:\n_______\n']
+    parts.extend(
+        f'\nQuery: {q["query"]}\nURL: {q["url"]}\nSummary: {q["summary"]}\n'
+        for q in iteration['queries']
+    )
+    parts.append(f'Batch Summary: {iteration["summary"]}\n\n')
+    return ''.join(parts)
+
+
+def format_intro(task_state):
+    """Render the introduction: the query and the research plan."""
+    return (
+        f'Initial Query: {task_state["initial_user_query"]}\n'
+        f'Plan:\n{task_state["plan"]}'
+    )
+
+
+def format_references(urls):
+    """Render the numbered list of used URLs."""
+    return '\n'.join(f'{i+1}. {url}' for i, url in enumerate(urls))
+
+
+def format_appendix(task_state):
+    """Render the timing breakdown of the task, or '' if it is disabled."""
+    if not RESEARCH_TRACE_APPENDIX or not task_state.get('trace'):
+        return ''
+    if task_state.get('budget'):
+        return f'{format_trace(task_state["trace"])}\n\n{format_budget(task_state["budget"])}'
+    return format_trace(task_state['trace'])
+
+
+class ReportWriter(ABC):
+    """Base of the report writers; subclasses stream one file format.
+
+    A writer is fed in research order: start() once, add_iteration() after
+    every finished iteration and finish() with the closing sections.
+    """
+
+    extension = ''
+    directory = RESEARCH_DIR
+    caption = ''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, text):
+        self._file.write(text)
+        self._file.flush()
+
+    @abstractmethod
+    def start(self, task_state):
+        """Write what is known before the first iteration."""
+
+    @abstractmethod
+    def add_iteration(self, iteration, text):
+        """Write a finished iteration.
+
+        text is the iteration rendered by format_iteration; ReportBuilder
+        renders it once for all the writers of the plain-text form.
+        """
+
+    async def finish(self, task_state, conclusion):
+        """Write the closing sections and return the report path."""
+        self.write_closing(task_state, conclusion)
+        self.close()
+        return self.path
+
+    def close(self):
+        self._file.close()
+
+    @abstractmethod
+    def write_closing(self, task_state, conclusion):
+        """Write the summary, conclusion and references."""
+
+
+class TxtWriter(ReportWriter):
+    """Plain text with '###' headings, the raw-text report."""
+
+    extension = '.txt'
+    directory = RESEARCH_TXT_DIR
+    caption = 'Research raw text'
+
+    def start(self, task_state):
+        self.write(f'{format_intro(task_state)}\n\n### Findings\n')
+
+    def add_iteration(self, iteration, text):
+        self.write(text)
+
+    def write_closing(self, task_state, conclusion):
+        self.write(
+            f'### Summary\n{task_state["final_summary"]}\n\n'
+            f'### Conclusion\n{conclusion}\n\n'
+            f'### References\n{format_references(task_state["used_urls"])}\n\n'
+        )
+        appendix = format_appendix(task_state)
+        if appendix:
+            self.write(f'### Timing\n{appendix}\n')
+
+
+class MarkdownWriter(ReportWriter):
+    """Markdown report."""
+
+    extension = '.md'
+    caption = 'Research complete (Markdown)'
+
+    def start(self, task_state):
+        self.write(
+            f'# Research Report\n\n'
+            f'**Initial query:** {task_state["initial_user_query"]}\n\n'
+            f'## Plan\n\n{task_state["plan"]}\n\n## Findings\n\n'
+        )
+
+    def add_iteration(self, iteration, text):
+        parts = [f'### Iteration {iteration["iteration_number"]}\n\n']
+        parts.extend(
+            f'- **Query:** {q["query"]}  \n  **URL:** <{q["url"]}>  \n'
+            f'  {q["summary"]}\n'
+            for q in iteration['queries']
+        )
+        parts.append(f'\n**Batch summary:** {iteration["summary"]}\n\n')
+        self.write(''.join(parts))
+
+    def write_closing(self, task_state, conclusion):
+        self.write(
+            f'## Summary\n\n{task_state["final_summary"]}\n\n'
+            f'## Conclusion\n\n{conclusion}\n\n'
+            f'## References\n\n{format_references(task_state["used_urls"])}\n'
+        )
+        appendix = format_appendix(task_state)
+        if appendix:
+            self.write(f'\n## Timing\n\n```\n{appendix}\n```\n')
+
+
+def html_text(text):
+    """Escape text for HTML, keeping **bold** markup and paragraphs."""
+    text = BOLD_PATTERN.sub(r'<strong>\1</strong>', html.escape(text))
+    return ''.join(
+        f'<p>{paragraph.replace(chr(10), "<br>")}</p>\n'
+        for paragraph in text.split('\n\n') if paragraph.strip()
+    )
+
+
+class HtmlWriter(ReportWriter):
+    """Standalone HTML report."""
+
+    extension = '.html'
+    caption = 'Research complete (HTML)'
+
+    def start(self, task_state):
+        query = html.escape(task_state['initial_user_query'])
+        self.write(
+            '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            f'<title>Research: {query}</title></head><body>\n'
+            f'<h1>Research Report</h1>\n<p><strong>Initial query:</strong> {query}</p>\n'
+            f'<h2>Plan</h2>\n{html_text(task_state["plan"])}<h2>Findings</h2>\n'
+        )
+
+    def add_iteration(self, iteration, text):
+        parts = [f'<h3>Iteration {iteration["iteration_number"]}</h3>\n<ul>\n']
+        parts.extend(
+            f'<li><strong>{html.escape(q["query"])}</strong> '
+            f'<a href="{html.escape(q["url"], quote=True)}">'
+            f'{html.escape(q["title"] or q["url"])}</a>\n{html_text(q["summary"])}</li>\n'
+            for q in iteration['queries']
+        )
+        parts.append(f'</ul>\n<h4>Batch summary</h4>\n{html_text(iteration["summary"])}')
+        self.write(''.join(parts))
+
+    def write_closing(self, task_state, conclusion):
+        references = ''.join(
+            f'<li><a href="{html.escape(url, quote=True)}">{html.escape(url)}</a></li>\n'
+            for url in task_state['used_urls']
+        )
+        appendix = format_appendix(task_state)
+        if appendix:
+            appendix = f'<h2>Timing</h2>\n<pre>{html.escape(appendix)}</pre>\n'
+        self.write(
+            f'<h2>Summary</h2>\n{html_text(task_state["final_summary"])}'
+            f'<h2>Conclusion</h2>\n{html_text(conclusion)}'
+            f'<h2>References</h2>\n<ol>\n{references}</ol>\n'
+            f'{appendix}</body></html>\n'
+        )
+
+
+class JsonWriter(ReportWriter):
+    """Compact JSON report, written as one object streamed field by field."""
+
+    extension = '.json'
+    caption = 'Research complete (JSON)'
+
+    @staticmethod
+    def dumps(value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+    def start(self, task_state):
+        self._first_iteration = True
+        self.write(
+            f'{{"research_id":{self.dumps(task_state["research_id"])},'
+            f'"initial_query":{self.dumps(task_state["initial_user_query"])},'
+            f'"plan":{self.dumps(task_state["plan"])},"iterations":['
+        )
+
+    def add_iteration(self, iteration, text):
+        separator = '' if self._first_iteration else ','
+        self._first_iteration = False
+        self.write(separator + self.dumps(iteration))
+
+    def write_closing(self, task_state, conclusion):
+        self.write(
+            f'],"summary":{self.dumps(task_state["final_summary"])},'
+            f'"conclusion":{self.dumps(conclusion)},'
+            f'"references":{self.dumps(task_state["used_urls"])}'
+        )
+        if RESEARCH_TRACE_APPENDIX and task_state.get('trace'):
+            self.write(f',"trace":{self.dumps(task_state["trace"])}')
+        self.write('}\n')
+
+
+class PdfWriter(ReportWriter):
+    """PDF report, rendered in a worker process once the research is done."""
+
+    extension = '.pdf'
+    caption = 'Research complete (PDF)'
+
+    def __init__(self, path):
+        # FPDF lays out the whole document at once; nothing to stream
+        self.path = path
+        self.findings = []
+
+    def start(self, task_state):
+        self.intro = format_intro(task_state)
+
+    def add_iteration(self, iteration, text):
+        self.findings.append(text)
+
+    async def finish(self, task_state, conclusion):
+        sections = [
+            ('Introduction', self.intro),
+            ('Findings', ''.join(self.findings)),
+            ('Summary', task_state['final_summary']),
+            ('Conclusion', conclusion),
+            ('References', 'Used Resources:\n' + format_references(task_state['used_urls'])),
+        ]
+        appendix = format_appendix(task_state)
+        if appendix:
+            sections.append(('Timing', appendix))
+        return await render_pdf(sections, self.path)
+
+    def write_closing(self, task_state, conclusion):
+        pass  # finish() renders the whole document
+
+    def close(self):
+        pass
+
+
+REPORT_WRITERS = {
+    'pdf': PdfWriter,
+    'txt': TxtWriter,
+    'md': MarkdownWriter,
+    'html': HtmlWriter,
+    'json': JsonWriter,
+}
+
+
+class ReportBuilder:
+    """Build the reports of a task while the research runs.
+
+    Every requested format gets a writer; findings are written as soon as
+    an iteration completes, so only the closing sections are left for the
+    end.
+    """
+
+    def __init__(self, task_state, formats):
+        from utils.artifact_store import get_artifact_store
+        store = get_artifact_store()
+        self.task_state = task_state
+        self.writers = []
+        self.finished = set()  # Paths of the reports written completely
+        for report_format in formats:
+            writer_class = REPORT_WRITERS[report_format]
+            path = store.reserve_path(
+                task_state['base_name'], writer_class.directory,
+                writer_class.extension
+            )
+            writer = writer_class(path)
+            writer.start(task_state)
+            self.writers.append(writer)
+
+    def add_iteration(self, iteration):
+        """Write a finished iteration to every report."""
+        text = format_iteration(iteration)
+        for writer in self.writers:
+            writer.add_iteration(iteration, text)
+
+    async def finish(self, conclusion):
+        """Finish every report and return a list of (path, caption)."""
+        reports = []
+        for writer in self.writers:
+            reports.append((await writer.finish(self.task_state, conclusion), writer.caption))
+            self.finished.add(writer.path)
+        return reports
+
+    def close(self):
+        """Close all report files and delete the unfinished ones.
+
+        Used when the research failed; a partial TXT would otherwise be
+        indexed as a report, and a partial JSON report is not even valid.
+        """
+        for writer in self.writers:
+            writer.close()
+            if writer.path in self.finished:
+                continue
+            try:
+                os.remove(writer.path)
+            except FileNotFoundError:
+                pass
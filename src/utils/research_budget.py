@@ -0,0 +1,156 @@
+"""Wall-clock and token budget of a research task.
+
+The budget reads what a task has spent from its span tree. Before every
+iteration it scales the fan-out to what the rest of the budget can pay for,
+spread over the iterations left: fewer queries, fewer URLs per query and
+shorter page excerpts. Other Ollama requests in flight shrink it further,
+and the task concludes early once not even a small iteration fits. Every
+stage is recorded in task_state['budget']['ledger'].
+"""
+import time
+
+from constants import (
+    LLM_QUEUE_SATURATION,
+    MAX_BATCH_ITERATIONS,
+    MAX_QUERIES_PER_BATCH,
+    MAX_SCRAPED_CONTENT_LENGTH,
+    MIN_EXCERPT_LENGTH,
+    NUM_RESEARCH_URLS,
+    RESEARCH_BUDGET_MIN_SCALE,
+    RESEARCH_BUDGET_RESERVE,
+    RESEARCH_TIME_BUDGET,
+    RESEARCH_TOKEN_BUDGET,
+)
+from utils.ollama_utils import llm_requests_in_flight
+from utils.research_trace import totals
+
+
+class ResearchBudget:
+    """Budget of the task in task_state, persisted in task_state['budget']."""
+
+    def __init__(self, task_state, seconds=RESEARCH_TIME_BUDGET,
+                 tokens=RESEARCH_TOKEN_BUDGET):
+        self.task_state = task_state
+        self.state = task_state.setdefault('budget', {
+            'seconds': seconds,
+            'tokens': tokens,
+            'ledger': [],
+            'concluded_early': None,
+        })
+        self._mark = (0.0, 0)
+        self.record('plan')
+
+    def spent(self):
+        """Return (seconds, tokens) the task has used so far."""
+        trace = self.task_state['trace']
+        prompt, completion, _ = totals(trace)
+        return time.time() - trace['started_at'], prompt + completion
+
+    def usable(self):
+        """Return (seconds, tokens) left before the closing reserve."""
+        seconds, tokens = self.spent()
+        keep = 1 - RESEARCH_BUDGET_RESERVE
+        return (
+            self.state['seconds'] * keep - seconds,
+            self.state['tokens'] * keep - tokens,
+        )
+
+    def full_iteration_cost(self):
+        """Estimate (seconds, tokens) of an iteration at full fan-out, or None."""
+        iterations = [entry for entry in self.state['ledger'] if entry.get('scale')]
+        scale = sum(entry['scale'] for entry in iterations)
+        if not scale:
+            return None
+        return (
+            sum(entry['seconds'] for entry in iterations) / scale,
+            sum(entry['tokens'] for entry in iterations) / scale,
+        )
+
+    def scale(self):
+        """Return the share of the full fan-out the next iteration can afford."""
+        seconds_left, tokens_left = self.usable()
+        if seconds_left <= 0 or tokens_left <= 0:
+            return 0.0
+        scale = 1.0
+        cost = self.full_iteration_cost()
+        if cost is not None:
+            iterations_left = max(MAX_BATCH_ITERATIONS - len(self.task_state['iterations']), 1)
+            seconds_cost, tokens_cost = cost
+            if seconds_cost:
+                scale = min(scale, seconds_left / iterations_left / seconds_cost)
+            if tokens_cost:
+                scale = min(scale, tokens_left / iterations_left / tokens_cost)
+        # Called between iterations, so every request in flight is another task's
+        load = min(llm_requests_in_flight() / LLM_QUEUE_SATURATION, 1.0)
+        return scale * (1 - load / 2)
+
+    def exhausted(self, scale=None):
+        """Return True, noting why, once not even a small iteration fits.
+
+        scale is the result of scale(), if the caller already has it.
+        """
+        if scale is None:
+            scale = self.scale()
+        if scale >= RESEARCH_BUDGET_MIN_SCALE:
+            return False
+        seconds_left, tokens_left = self.usable()
+        self.state['concluded_early'] = (
+            f'{max(seconds_left, 0):.0f} s and {max(tokens_left, 0):.0f} tokens '
+            f'left before the reserve, scale {scale:.2f}'
+        )
+        return True
+
+    def plan_iteration(self):
+        """Return the fan-out of the next iteration, or None to conclude now.
+
+        Queries, URLs per query and excerpt length each get the cube root of
+        the scale, so their product, which the cost follows, gets the scale.
+        """
+        scale = self.scale()
+        if self.exhausted(scale):
+            return None
+        factor = scale ** (1 / 3)
+        return {
+            'scale': round(scale, 3),
+            'queries': max(1, round(MAX_QUERIES_PER_BATCH * factor)),
+            'urls_per_query': max(1, round(NUM_RESEARCH_URLS * factor)),
+            'excerpt_length': max(
+                MIN_EXCERPT_LENGTH, int(MAX_SCRAPED_CONTENT_LENGTH * factor)
+            ),
+            'llm_in_flight': llm_requests_in_flight(),
+        }
+
+    def record(self, stage, plan=None):
+        """Add what stage spent since the last record to the ledger."""
+        seconds, tokens = self.spent()
+        entry = {
+            'stage': stage,
+            'seconds': round(seconds - self._mark[0], 3),
+            'tokens': tokens - self._mark[1],
+        }
+        entry.update(plan or {})
+        self.state['ledger'].append(entry)
+        self._mark = (seconds, tokens)
+        return entry
+
+
+def format_budget(budget):
+    """Render the budget ledger of a task as text."""
+    spent_seconds = sum(entry['seconds'] for entry in budget['ledger'])
+    spent_tokens = sum(entry['tokens'] for entry in budget['ledger'])
+    lines = [
+        f'Budget: {spent_seconds:.0f} of {budget["seconds"]:.0f} s, '
+        f'{spent_tokens} of {budget["tokens"]} tokens'
+    ]
+    for entry in budget['ledger']:
+        line = f'- {entry["stage"]}: {entry["seconds"]:.1f} s, {entry["tokens"]} tokens'
+        if 'scale' in entry:
+            line += (
+                f' (scale {entry["scale"]:.2f}: {entry["queries"]} queries x '
+                f'{entry["urls_per_query"]} URLs, {entry["excerpt_length"]} chars, '
+                f'{entry["llm_in_flight"]} LLM requests in flight)'
+            )
+        lines.append(line)
+    if budget.get('concluded_early'):
+        lines.append(f'Concluded early: {budget["concluded_early"]}')
+    return '\n'.join(lines)
@@ -0,0 +1,280 @@
+import glob
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from constants import (
+    RESEARCH_INDEX_DB,
+    RESEARCH_INDEX_MAX_HITS,
+    RESEARCH_INDEX_MIN_SCORE,
+    RESEARCH_TXT_DIR,
+    SUMMARY_LENGTH,
+)
+from utils.artifact_store import get_artifact_store, task_archive_id
+
+
+SCHEMA = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5('
+    ' research_id UNINDEXED, kind UNINDEXED, topic, url UNINDEXED, body,'
+    " tokenize = 'unicode61 remove_diacritics 2'"
+    ')',
+    'CREATE TABLE IF NOT EXISTS indexed_tasks (research_id TEXT PRIMARY KEY)',
+    'CREATE TABLE IF NOT EXISTS indexed_sources ('
+    ' path TEXT PRIMARY KEY, mtime REAL NOT NULL'
+    ')',
+)
+TOKEN_PATTERN = re.compile(r'\w{3,}', re.IGNORECASE)
+REPORT_END = '\n### References\n'  # Written only once a TXT report is complete
+
+
+def tokenize(text):
+    """Return the set of lowercase search terms of text."""
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+def excerpt(text, terms, length=SUMMARY_LENGTH):
+    """Return about length characters of text where terms occur most often."""
+    if len(text) <= length:
+        return text
+    positions = [
+        match.start() for match in TOKEN_PATTERN.finditer(text)
+        if match.group().lower() in terms
+    ]
+    best_start, best_count, first = 0, 0, 0
+    for last, position in enumerate(positions):
+        while position - positions[first] >= length:
+            first += 1
+        if last - first + 1 > best_count:
+            best_start, best_count = positions[first], last - first + 1
+    # Start a little before the first match, for its context
+    start = max(0, min(best_start - length // 10, len(text) - length))
+    end = start + length
+    return (
+        ('...' if start else '') + text[start:end] + ('...' if end < len(text) else '')
+    )
+
+
+class ResearchIndex:
+    """Full-text index over summaries of finished research tasks."""
+
+    def __init__(self, db_path=RESEARCH_INDEX_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def index_task(self, task_state, sources=()):
+        """Index the final summary and per-URL summaries of a task."""
+        research_id = task_state['research_id']
+        topic = f'{task_state["initial_user_query"]}\n{task_state["plan"]}'
+        body = task_state.get('final_summary') or ''
+        body += ''.join(
+            f'\n{iteration["summary"]}' for iteration in task_state['iterations']
+        )
+        docs = [(research_id, 'summary', topic, '', body)]
+        for iteration in task_state['iterations']:
+            for q in iteration['queries']:
+                docs.append((
+                    research_id, 'page', f'{q["query"]}\n{q["title"]}',
+                    q['url'], q['summary'],
+                ))
+        with self._lock, self._conn:
+            exists = self._conn.execute(
+                'SELECT 1 FROM indexed_tasks WHERE research_id = ?',
+                (research_id,),
+            ).fetchone()
+            if not exists:
+                self._conn.executemany(
+                    'INSERT INTO docs (research_id, kind, topic, url, body) '
+                    'VALUES (?, ?, ?, ?, ?)', docs,
+                )
+                self._conn.execute(
+                    'INSERT INTO indexed_tasks VALUES (?)', (research_id,)
+                )
+            self._mark_sources(sources)
+
+    def _index_report(self, path):
+        """Index a TXT report whose task JSON is not available.
+
+        Reports without a References section were cut short by a failed
+        task and are skipped. A changed report replaces its old docs.
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        first_line = text.split('\n', 1)[0]
+        topic = first_line.replace('Initial Query:', '').strip()
+        report_id = os.path.basename(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM docs WHERE research_id = ? AND kind = 'report'",
+                (report_id,),
+            )
+            if REPORT_END in text:
+                self._conn.execute(
+                    'INSERT INTO docs (research_id, kind, topic, url, body) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (report_id, 'report', topic, '', text),
+                )
+            self._mark_sources([path])
+
+    def _mark_sources(self, paths):
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO indexed_sources VALUES (?, ?)',
+            [(p, os.path.getmtime(p)) for p in paths if p and os.path.exists(p)],
+        )
+
+    def forget(self, artifacts):
+        """Drop the docs of deleted artifacts, given as (path, kind, research_id).
+
+        Deleting a task archive drops the findings of its task, deleting a
+        TXT report drops the report.
+        """
+        task_ids = [(research_id,) for _, kind, research_id in artifacts if kind == 'task']
+        report_ids = [
+            (os.path.basename(path),) for path, kind, _ in artifacts if kind == 'txt'
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM docs WHERE research_id = ? AND kind != 'report'", task_ids
+            )
+            self._conn.executemany(
+                'DELETE FROM indexed_tasks WHERE research_id = ?', task_ids
+            )
+            self._conn.executemany(
+                "DELETE FROM docs WHERE research_id = ? AND kind = 'report'", report_ids
+            )
+            self._conn.executemany(
+                'DELETE FROM indexed_sources WHERE path = ?',
+                [(path,) for path, _, _ in artifacts],
+            )
+
+    def sync(self):
+        """Index archived task JSON and TXT reports added since the last sync.
+
+        Sources that are gone, e.g. deleted by retention before the index
+        was opened, are forgotten.
+        """
+        with self._lock:
+            known = dict(self._conn.execute(
+                'SELECT path, mtime FROM indexed_sources'
+            ).fetchall())
+        store = get_artifact_store()
+        archives = store.task_paths()
+        reports = set(glob.glob(os.path.join(glob.escape(RESEARCH_TXT_DIR), '*.txt')))
+        current = set(archives) | reports
+        self.forget([
+            (path, 'txt', None) if path.endswith('.txt')
+            else (path, 'task', task_archive_id(path))
+            for path in known if path not in current
+        ])
+        indexed = 0
+        for path in archives + sorted(reports):
+            try:
+                # Files can vanish, e.g. removed by hand or by retention
+                if known.get(path) == os.path.getmtime(path):
+                    continue
+                if path in reports:
+                    self._index_report(path)
+                else:
+                    task_state = store.load_task(path)
+                    if task_state.get('status') != 'complete':
+                        with self._lock, self._conn:
+                            self._mark_sources([path])
+                        continue
+                    self.index_task(task_state, [path])
+                indexed += 1
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f'Failed to index research file {path}: {e}')
+        if indexed:
+            logging.info(f'Research index: indexed {indexed} new files')
+        return indexed
+
+    def lookup(self, query, min_score=RESEARCH_INDEX_MIN_SCORE,
+               limit=RESEARCH_INDEX_MAX_HITS):
+        """Return stored findings matching query with score >= min_score.
+
+        Page and summary docs come before whole TXT reports. Every hit has
+        a snippet of its body around the query terms, short enough for a
+        prompt.
+        """
+        terms = tokenize(query)
+        if len(terms) < 2:
+            return []
+        match = ' OR '.join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT research_id, kind, topic, url, body FROM docs '
+                'WHERE docs MATCH ? ORDER BY bm25(docs, 0, 0, 2.0, 0, 1.0) '
+                'LIMIT ?',
+                (match, limit * 4),
+            ).fetchall()
+        hits = []
+        for research_id, kind, topic, url, body in rows:
+            # Half for covering the researched topic, half for the findings
+            score = (
+                len(terms & tokenize(topic)) + len(terms & tokenize(body))
+            ) / (2 * len(terms))
+            if score >= min_score:
+                hits.append({
+                    'research_id': research_id, 'kind': kind, 'topic': topic,
+                    'url': url, 'body': body, 'snippet': excerpt(body, terms),
+                    'score': score,
+                })
+        hits.sort(key=lambda hit: (hit['kind'] == 'report', -hit['score']))
+        return hits[:limit]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def format_findings(hits):
+    """Format index hits like search results for the summary prompt."""
+    return '\n'.join(
+        f'{i}. Title: {hit["topic"].splitlines()[0]}\n'
+        + (f'URL: {hit["url"]}\n' if hit['url'] else '')
+        + f'Snippet: {hit["snippet"]}\n'
+        for i, hit in enumerate(hits, 1)
+    )
+
+
+_research_index = None
+_research_index_lock = threading.Lock()
+
+
+def get_research_index():
+    """Return the process-wide ResearchIndex, syncing it on first use."""
+    global _research_index
+    with _research_index_lock:
+        if _research_index is None:
+            _research_index = ResearchIndex()
+            _research_index.sync()
+        return _research_index
+
+
+def lookup_findings(query):
+    """Look query up in the process-wide index; blocking, so run it in a thread.
+
+    The first call also syncs the index with every archived task.
+    """
+    return get_research_index().lookup(query)
+
+
+def index_finished_task(task_state, sources=()):
+    """Index task_state in the process-wide index; blocking, like lookup_findings."""
+    get_research_index().index_task(task_state, sources)
+
+
+def forget_artifacts(artifacts):
+    """Drop deleted artifacts from the process-wide index, if it is open.
+
+    An index opened later forgets them when it syncs.
+    """
+    with _research_index_lock:
+        research_index = _research_index
+    if research_index is not None and artifacts:
+        research_index.forget(artifacts)
@@ -0,0 +1,135 @@
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+
+
+# Span that Ollama calls and downloads are attributed to. asyncio.to_thread
+# and new tasks copy the context, so work started inside a span records
+# into it from any thread.
+_current_span = contextvars.ContextVar('research_span', default=None)
+
+
+def new_span(name, detail=''):
+    """Return a new span; spans are plain dicts so they persist as JSON."""
+    return {
+        'name': name,
+        'detail': detail,
+        'started_at': time.time(),
+        'seconds': None,
+        'prompt_tokens': 0,
+        'completion_tokens': 0,
+        'bytes': 0,
+        'children': [],
+    }
+
+
+def end_span(node):
+    node['seconds'] = round(time.time() - node['started_at'], 3)
+
+
+@contextmanager
+def activate(node):
+    """Make node the current span for the block."""
+    token = _current_span.set(node)
+    try:
+        yield node
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name, detail=''):
+    """Time the block as a child of the current span, if there is one."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    node = new_span(name, detail)
+    parent['children'].append(node)
+    token = _current_span.set(node)
+    try:
+        yield node
+    finally:
+        _current_span.reset(token)
+        end_span(node)
+
+
+async def run_in_span(name, func, *args, detail=''):
+    """Run blocking func in a thread, timed as span name."""
+    with span(name, detail):
+        return await asyncio.to_thread(func, *args)
+
+
+def add_usage(prompt_tokens=0, completion_tokens=0, size=0):
+    """Add tokens and downloaded bytes to the current span."""
+    node = _current_span.get()
+    if node is not None:
+        node['prompt_tokens'] += prompt_tokens
+        node['completion_tokens'] += completion_tokens
+        node['bytes'] += size
+
+
+def totals(node):
+    """Return (prompt tokens, completion tokens, bytes) of node and below."""
+    prompt, completion, size = (
+        node['prompt_tokens'], node['completion_tokens'], node['bytes']
+    )
+    for child in node['children']:
+        child_prompt, child_completion, child_size = totals(child)
+        prompt += child_prompt
+        completion += child_completion
+        size += child_size
+    return prompt, completion, size
+
+
+def format_usage(seconds, prompt, completion, size):
+    duration = 'running' if seconds is None else f'{seconds:.1f}s'
+    parts = [duration]
+    if prompt or completion:
+        parts.append(f'{prompt}+{completion} tokens')
+    if size:
+        parts.append(f'{size / 1024:.0f} KiB')
+    return ', '.join(parts)
+
+
+def stage_breakdown(root):
+    """Return {span name: [count, seconds, tokens, bytes]} over the tree."""
+    stages = {}
+
+    def visit(node):
+        for child in node['children']:
+            stage = stages.setdefault(child['name'], [0, 0.0, 0, 0])
+            stage[0] += 1
+            stage[1] += child['seconds'] or 0.0
+            stage[2] += child['prompt_tokens'] + child['completion_tokens']
+            stage[3] += child['bytes']
+            visit(child)
+
+    visit(root)
+    return stages
+
+
+def format_trace(root):
+    """Render the span tree of a task as text: stage totals, then the tree."""
+    lines = [f'Total: {format_usage(root["seconds"], *totals(root))}', '']
+    lines.append('Time by stage (concurrent spans overlap; own tokens and bytes):')
+    stages = sorted(
+        stage_breakdown(root).items(), key=lambda item: item[1][1], reverse=True
+    )
+    for name, (count, seconds, tokens, size) in stages:
+        lines.append(
+            f'- {name}: {count}x, {seconds:.1f}s, {tokens} tokens, '
+            f'{size / 1024:.0f} KiB'
+        )
+    lines.append('')
+
+    def visit(node, depth):
+        label = f'{node["name"]} {node["detail"]}'.strip()
+        usage = format_usage(node['seconds'], *totals(node))
+        lines.append(f'{"  " * depth}{label}: {usage}')
+        for child in node['children']:
+            visit(child, depth + 1)
+
+    visit(root, 0)
+    return '\n'.join(lines)
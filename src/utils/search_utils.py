@@ -1,26 +1,93 @@
 import logging
 import random
+import time
+from collections import OrderedDict
 
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup
-import requests
 import urllib.parse
 from urllib.robotparser import RobotFileParser
 
 from constants import (
     SEARCH_API_URL, NUM_SEARCH_RESULTS, NUM_RESEARCH_URLS, USER_AGENTS,
-    MAX_SCRAPED_CONTENT_LENGTH,SCRAPE_DELAY, RESPECT_ROBOTS_TXT
+    MAX_SCRAPED_CONTENT_LENGTH,SCRAPE_DELAY, RESPECT_ROBOTS_TXT,
+    RESEARCH_CACHE_SIZE, RESEARCH_CACHE_TTL,
 )
+from utils.http_session import get_http_session
+from utils.metrics import inc, instrument, registry
+from utils.research_trace import add_usage, span
 
 
+registry.describe('research_cache_requests_total', 'counter',
+                  'Research search and page lookups by cache result.')
+
+
+class FetchCache:
+    """Recent research fetches by key, including fetches still in flight.
+
+    Entries are tasks, so a lookup for a key that is being fetched, e.g. by
+    a speculative prefetch, waits for that fetch instead of starting another.
+    A fetch that failed or returned None is not kept.
+    """
+
+    def __init__(self, kind, size=RESEARCH_CACHE_SIZE, ttl=RESEARCH_CACHE_TTL):
+        self.kind = kind
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires at, task)
+
+    def _valid(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, task = entry
+        failed = task.done() and (
+            task.cancelled() or task.exception() is not None or task.result() is None
+        )
+        if expires_at < time.monotonic() or failed:
+            del self._entries[key]
+            return None
+        return task
+
+    def __contains__(self, key):
+        return self._valid(key) is not None
+
+    async def get(self, key, fetch):
+        """Return the cached result for key, or await fetch() and cache it."""
+        task = self._valid(key)
+        if task is not None:
+            inc('research_cache_requests_total', kind=self.kind, result='hit')
+            self._entries.move_to_end(key)
+            try:
+                # Shielded: a cancelled waiter must not cancel the shared fetch
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+            # The prefetch that started the fetch was cancelled, fetch again
+        inc('research_cache_requests_total', kind=self.kind, result='miss')
+        task = asyncio.ensure_future(fetch())
+        self._entries[key] = (time.monotonic() + self.ttl, task)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        # Unshielded: cancelling the caller cancels the fetch it started
+        return await task
+
+
+search_cache = FetchCache('search')
+page_cache = FetchCache('page')
+
+
+@instrument('perform_search')
 def perform_search(query):
     """Perform a web search and return formatted results."""
     url = (f'{SEARCH_API_URL}?q={urllib.parse.quote(query)}'
            f'&format=json')
     try:
-        response = requests.get(url)
+        response = get_http_session().get(url)
         response.raise_for_status()
+        inc('downloaded_bytes_total', len(response.content), source='search')
         data = response.json()
         results = data.get('results', [])[:NUM_SEARCH_RESULTS]
         formatted_results = []
@@ -33,8 +100,19 @@ def perform_search(query):
         logging.error(f'Search API error: {str(e)}')
         return 'Failed to retrieve search results.'
     
+def check_search_api():
+    """Raise unless the search API answers a JSON query."""
+    response = get_http_session().get(
+        SEARCH_API_URL, params={'q': 'test', 'format': 'json'}, timeout=10
+    )
+    response.raise_for_status()
+    response.json()
+
+
+@instrument('fetch_page')
 async def fetch_page(session, url, logger):
     """Fetch page content asynchronously with robots.txt check."""
+    from bs4 import BeautifulSoup  # Slow to import; only research needs it
     if RESPECT_ROBOTS_TXT:
         rp = RobotFileParser()
         rp.set_url(f'{url}/robots.txt')
@@ -51,7 +129,10 @@ async def fetch_page(session, url, logger):
     try:
         async with session.get(url, headers=headers, timeout=10) as response:
             response.raise_for_status()
-            text = await response.text()
+            body = await response.read()
+            inc('downloaded_bytes_total', len(body), source='page')
+            add_usage(size=len(body))
+            text = await response.text()  # Decodes the body read above
             soup = BeautifulSoup(text, 'html.parser')
             content = ' '.join(
                 tag.get_text(strip=True)
@@ -63,32 +144,62 @@ async def fetch_page(session, url, logger):
         logger.error(f'Failed to scrape {url}: {e}')
         return None
 
-async def perform_research_search(query, logger):
-    """Perform search and scrape top URLs."""
+async def traced_fetch(session, url, logger, max_length=MAX_SCRAPED_CONTENT_LENGTH):
+    """Fetch a page through the cache as a 'fetch' span of the research trace."""
+    with span('fetch', url):
+        content = await page_cache.get(url, lambda: fetch_page(session, url, logger))
+        return content[:max_length] if content else content
+
+async def fetch_search_results(session, query):
+    """Return the top NUM_RESEARCH_URLS results of the search API for query."""
     url = f'{SEARCH_API_URL}?q={urllib.parse.quote(query)}&format=json&language=en'
+    async with session.get(url) as response:
+        response.raise_for_status()
+        body = await response.read()
+        inc('downloaded_bytes_total', len(body), source='search')
+        add_usage(size=len(body))
+        data = await response.json()
+        return data.get('results', [])[:NUM_RESEARCH_URLS]
+
+@instrument('perform_research_search')
+async def perform_research_search(query, logger, max_urls=NUM_RESEARCH_URLS,
+                                  max_length=MAX_SCRAPED_CONTENT_LENGTH):
+    """Perform search and scrape the top max_urls URLs, cut to max_length."""
+    return await research_search(query, logger, max_urls, max_length)
+
+async def research_search(query, logger, max_urls, max_length):
+    """perform_research_search without the stage metric, for prefetches."""
     try:
         async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                data = await response.json()
-                results = data.get('results', [])[:NUM_RESEARCH_URLS]
-                if not results:
-                    logger.error('No search results returned.')
-                    return []
-
-                tasks = []
-                for result in results:
-                    url = result.get('url')
-                    if url:
-                        tasks.append(fetch_page(session, url, logger))
+            results = await search_cache.get(
+                query, lambda: fetch_search_results(session, query)
+            )
+            if not results:
+                logger.error('No search results returned.')
+                return []
+            results = results[:max_urls]
+
+            tasks = []
+            for result in results:
+                url = result.get('url')
+                if url:
+                    cached = url in page_cache
+                    tasks.append(traced_fetch(session, url, logger, max_length))
+                    if not cached:
                         await asyncio.sleep(SCRAPE_DELAY / 1000)
 
-                contents = await asyncio.gather(*tasks)
-                return [
-                    {'url': result['url'], 'title': result['title'], 'content': content}
-                    for result, content in zip(results, contents)
-                    if content
-                ]
+            contents = await asyncio.gather(*tasks)
+            return [
+                {'url': result['url'], 'title': result['title'], 'content': content}
+                for result, content in zip(results, contents)
+                if content
+            ]
     except Exception as e:
         logger.error(f'Search API error: {e}')
-        return []
\ No newline at end of file
+        return []
+
+async def prefetch_research_search(queries, logger, max_urls=NUM_RESEARCH_URLS):
+    """Warm the caches with the search results and pages of queries."""
+    for query in queries:
+        logger.info(f'Prefetching: "{query}"')
+        await research_search(query, logger, max_urls, MAX_SCRAPED_CONTENT_LENGTH)
@@ -0,0 +1,79 @@
+import logging
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def is_text_message(update):
+    """Return True if update is a text message that is not a command."""
+    message = getattr(update, 'message', None)
+    text = getattr(message, 'text', None)
+    return bool(text) and not text.startswith('/')
+
+
+def get_update_user_id(update):
+    """Return the id of the user who sent update, or None if unknown."""
+    if isinstance(update, Update) and update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently while keeping each user's updates in order.
+
+    The first update of a user takes a concurrency slot and then drains any
+    updates that user sent meanwhile, so queued updates never hold a slot.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # user_id -> deque of (update, coroutine), the running one first
+        self._pending = {}
+
+    def pending_count(self, user_id):
+        """Return how many updates of user_id wait behind the running one."""
+        pending = self._pending.get(user_id)
+        return len(pending) - 1 if pending else 0
+
+    def pending_text_count(self, user_id):
+        """Return how many text messages of user_id wait behind the running update."""
+        pending = self._pending.get(user_id)
+        if not pending:
+            return 0
+        return sum(is_text_message(update) for update, _ in list(pending)[1:])
+
+    def queue_depths(self):
+        """Return (users with a running update, updates queued behind them)."""
+        running = len(self._pending)
+        return running, sum(len(pending) for pending in self._pending.values()) - running
+
+    async def do_process_update(self, update, coroutine):
+        user_id = get_update_user_id(update)
+        if user_id is None:
+            await coroutine
+            return
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            pending.append((update, coroutine))
+            return
+        self._pending[user_id] = pending = deque([(update, coroutine)])
+        try:
+            while pending:
+                try:
+                    await pending[0][1]
+                except Exception as e:
+                    logging.error(f'Update of user {user_id} failed: {e}')
+                finally:
+                    pending.popleft()
+        finally:
+            del self._pending[user_id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        # Drop queued updates; the running ones finish on their own
+        for pending in self._pending.values():
+            while len(pending) > 1:
+                pending.pop()[1].close()
@@ -0,0 +1,45 @@
+import asyncio
+import importlib
+import logging
+import time
+
+from utils.lazy_callback import LazyCallback
+
+
+def load_handlers(app):
+    """Import the modules behind the lazy handler callbacks of app."""
+    callbacks = [
+        handler.callback for handlers in app.handlers.values() for handler in handlers
+    ]
+    callbacks.extend(app.error_handlers)
+    for callback in callbacks:
+        if isinstance(callback, LazyCallback):
+            callback.load()
+
+
+async def run_step(name, func, *args):
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(func, *args)
+    except Exception as e:
+        logging.warning(f'Warm-up: {name} failed: {e}')
+    else:
+        logging.info(f'Warm-up: {name} took {time.perf_counter() - started:.1f}s')
+
+
+async def warm_up(app):
+    """Load handlers, open connections and load the models while updates flow.
+
+    Every step runs in a thread and a failing step is only logged, so a
+    slow or missing backend never keeps the bot from starting.
+    """
+    await run_step('loading handlers', load_handlers, app)
+    # Imported after the handlers, which load the same modules
+    from utils.ollama_utils import ollama_preload
+    from utils.search_utils import check_search_api
+    await asyncio.gather(
+        # fetch_page imports it on the event loop otherwise
+        run_step('loading page parser', importlib.import_module, 'bs4'),
+        run_step('search API check', check_search_api),
+        run_step('Ollama model preload', ollama_preload),
+    )
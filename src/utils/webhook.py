@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+
+import aiohttp
+from aiohttp import web
+from telegram import Bot, Update
+
+from constants import (
+    TELEGRAM_API_URL,
+    TELEGRAM_BOT_TOKEN,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WEBHOOK_WORKERS,
+    WARM_UP,
+    WORKER_BASE_PORT,
+    WORKER_HOST,
+    WORKER_URLS,
+)
+from utils.chat_store import close_chat_store
+from utils.loop_monitor import start_loop_monitor, stop_loop_monitor
+from utils.metrics import serve_metrics
+from utils.warmup import warm_up
+
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+WORKER_PATH = '/update'
+WORKER_STARTUP_TIMEOUT = 60  # Seconds to wait for workers before going live
+
+
+def extract_user_id(data):
+    """Return the sender id of a raw update dict, or None if it has none."""
+    for value in data.values():
+        if isinstance(value, dict):
+            sender = value.get('from') or value.get('user')
+            if isinstance(sender, dict) and 'id' in sender:
+                return sender['id']
+    return None
+
+
+def worker_index(user_id, workers):
+    """Map user_id to a worker so each user always hits the same process."""
+    if user_id is None:
+        return 0
+    return int(user_id) % workers
+
+
+def get_worker_urls():
+    """Return the update URLs of all workers the router forwards to."""
+    if WORKER_URLS:
+        return [url.strip() for url in WORKER_URLS.split(',') if url.strip()]
+    return [
+        f'http://{WORKER_HOST}:{WORKER_BASE_PORT + i}{WORKER_PATH}'
+        for i in range(WEBHOOK_WORKERS)
+    ]
+
+
+async def serve_worker(build_application, port, host=WORKER_HOST):
+    """Feed updates POSTed to host:port into an Application without an updater."""
+    app = build_application(with_updater=False)
+
+    async def receive(request):
+        # Workers on other nodes may be reachable by more than the router
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        data = await request.json()
+        await app.update_queue.put(Update.de_json(data, app.bot))
+        return web.Response()
+
+    async def health(request):
+        return web.Response(text='ok')
+
+    server = web.Application()
+    server.router.add_post(WORKER_PATH, receive)
+    server.router.add_get(WORKER_PATH, health)
+    server.router.add_get('/metrics', serve_metrics)
+    runner = web.AppRunner(server)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with app:
+        await app.start()
+        start_loop_monitor()
+        # post_init only runs under run_polling, so warm up here
+        warm_up_task = asyncio.create_task(warm_up(app)) if WARM_UP else None
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logging.info(f'Webhook worker listening on {host}:{port}')
+        await stop.wait()
+        await runner.cleanup()
+        if warm_up_task is not None:
+            warm_up_task.cancel()
+        stop_loop_monitor()
+        await app.stop()
+
+
+def run_worker(build_application, port):
+    """Process entry point of a local webhook worker."""
+    from utils.logging_confg import LOG_FILE, configure_logging, stop_logging
+    # Each process rotates its own file; sharing one would race on rollover
+    root, extension = os.path.splitext(LOG_FILE)
+    configure_logging(f'{root}-worker-{port}{extension}')
+    try:
+        asyncio.run(serve_worker(build_application, port))
+    finally:
+        # main() cleans up the router process only, which never opens these
+        close_chat_store()
+        pdf_utils = sys.modules.get('utils.pdf_utils')
+        if pdf_utils is not None:
+            pdf_utils.shutdown_report_executor()
+        stop_logging()
+
+
+async def wait_for_workers(session, worker_urls, timeout=WORKER_STARTUP_TIMEOUT):
+    """Poll every worker until it answers or timeout seconds have passed."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    for url in worker_urls:
+        while True:
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            if asyncio.get_running_loop().time() > deadline:
+                logging.warning(f'Worker {url} is not up yet, going live anyway')
+                return
+            await asyncio.sleep(0.5)
+
+
+def build_router(worker_urls):
+    """Build the public webhook app that routes updates by user_id."""
+
+    async def route(request):
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        data = await request.json()
+        index = worker_index(extract_user_id(data), len(worker_urls))
+        try:
+            async with request.app['session'].post(
+                worker_urls[index], json=data,
+                headers={SECRET_HEADER: WEBHOOK_SECRET} if WEBHOOK_SECRET else None,
+            ) as response:
+                response.raise_for_status()
+        except aiohttp.ClientError as e:
+            logging.error(f'Failed to forward update to worker {index}: {e}')
+            # Telegram redelivers the update on a non-2xx answer
+            return web.Response(status=503)
+        return web.Response()
+
+    async def on_startup(app):
+        app['session'] = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=10)
+        )
+        await wait_for_workers(app['session'], worker_urls)
+        if WEBHOOK_URL:
+            bot = Bot(TELEGRAM_BOT_TOKEN, base_url=TELEGRAM_API_URL)
+            async with bot:
+                await bot.set_webhook(
+                    WEBHOOK_URL,
+                    allowed_updates=Update.ALL_TYPES,
+                    secret_token=WEBHOOK_SECRET or None,
+                )
+            logging.info(f'Webhook registered at {WEBHOOK_URL}')
+
+    async def on_cleanup(app):
+        await app['session'].close()
+
+    router = web.Application()
+    router.router.add_post(WEBHOOK_PATH, route)
+    router.on_startup.append(on_startup)
+    router.on_cleanup.append(on_cleanup)
+    return router
+
+
+def run_webhook(build_application):
+    """Run the webhook router and, unless WORKER_URLS is set, local workers."""
+    workers = []
+    if not WORKER_URLS:
+        context = multiprocessing.get_context('spawn')
+        for i in range(WEBHOOK_WORKERS):
+            process = context.Process(
+                target=run_worker,
+                args=(build_application, WORKER_BASE_PORT + i),
+                name=f'webhook-worker-{i}',
+            )
+            process.start()
+            workers.append(process)
+    try:
+        web.run_app(
+            build_router(get_worker_urls()),
+            host=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            print=None,
+        )
+    finally:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()